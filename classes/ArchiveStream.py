@@ -0,0 +1,174 @@
+import tarfile
+import time
+import zipfile
+from typing import Iterable, Optional, Tuple
+
+
+class _Sink:
+    """
+    A write-only file object collecting what an archive writer writes until it is drained.
+    """
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+class ArchiveStream:
+    """
+    :class: ArchiveStream
+
+    This class encodes a zip or tar archive on the fly, one entry at a time, without seeking or holding any entry in
+    memory. Each method returns the bytes to send next, so an archive can be streamed to a client as its files are
+    read. Entries are stored uncompressed, since audio and images do not compress.
+
+    Zip entries carry their CRC and sizes in a data descriptor after their data, and ZIP64 records are written when
+    the archive outgrows 4GB. Tar entries use the POSIX ustar format, whose length is known in advance.
+
+    :ivar format: The archive format, "zip" or "tar".
+    :type format: str
+
+    Methods
+    -------
+
+    begin_entry(self, name, size, mtime):
+        Starts an entry and returns its header.
+
+    write(self, data):
+        Encodes a chunk of the current entry's data.
+
+    end_entry(self):
+        Ends the current entry and returns its trailer.
+
+    close(self):
+        Ends the archive and returns its trailer.
+
+    abort(self):
+        Releases the archive without ending it.
+
+    content_length(format, entries):
+        Returns the length of an archive of the given entries, if the format allows knowing it in advance.
+    """
+    FORMATS = {"zip": "application/zip", "tar": "application/x-tar"}
+
+    def __init__(self, format: str):
+        if format not in self.FORMATS:
+            raise ValueError(f"Unsupported archive format {format}")
+        self.format = format
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, "w", zipfile.ZIP_STORED) if format == "zip" else None
+        self._entry = None
+        self._entry_size = 0
+
+    @property
+    def media_type(self) -> str:
+        """
+        :return: The media type of the archive.
+        """
+        return self.FORMATS[self.format]
+
+    @staticmethod
+    def _tar_header(name: str, size: int, mtime: float) -> bytes:
+        """
+        :param name: The name of the entry.
+        :param size: The size of the entry in bytes.
+        :param mtime: The modification time of the entry.
+        :return: The ustar header of the entry.
+        """
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(mtime)
+        info.mode = 0o644
+        return info.tobuf(format=tarfile.USTAR_FORMAT)
+
+    @staticmethod
+    def _tar_padding(size: int) -> int:
+        """
+        :param size: The size of an entry's data in bytes.
+        :return: The number of zero bytes padding the data to a whole block.
+        """
+        return -size % tarfile.BLOCKSIZE
+
+    def begin_entry(self, name: str, size: int, mtime: float) -> bytes:
+        """
+        Start an entry. Its data must then be passed to `write`, `size` bytes in all, before `end_entry` is called.
+
+        :param name: The name of the entry in the archive.
+        :param size: The size of the entry's data in bytes.
+        :param mtime: The modification time of the entry.
+        :return: The bytes to send.
+        """
+        self._entry_size = size
+        if self._zip is None:
+            return self._tar_header(name, size, mtime)
+        info = zipfile.ZipInfo(name, date_time=time.localtime(mtime)[:6])
+        info.file_size = size
+        self._entry = self._zip.open(info, "w")
+        return self._sink.drain()
+
+    def write(self, data: bytes) -> bytes:
+        """
+        :param data: The next chunk of the current entry's data.
+        :return: The bytes to send.
+        """
+        if self._entry is None:
+            return data
+        self._entry.write(data)
+        return self._sink.drain()
+
+    def end_entry(self) -> bytes:
+        """
+        :return: The bytes to send to end the current entry.
+        """
+        if self._entry is None:
+            return bytes(self._tar_padding(self._entry_size))
+        self._entry.close()
+        self._entry = None
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        """
+        :return: The bytes to send to end the archive.
+        """
+        if self._zip is None:
+            return bytes(2 * tarfile.BLOCKSIZE)
+        self._zip.close()
+        return self._sink.drain()
+
+    def abort(self):
+        """
+        Release the archive when it will not be completed, discarding anything left to send.
+
+        :return: None
+        """
+        if self._zip is not None:
+            try:
+                if self._entry is not None:
+                    self._entry.close()
+                self._zip.close()
+            except ValueError:
+                pass
+            self._entry = None
+        self._sink.drain()
+
+    @classmethod
+    def content_length(cls, format: str, entries: Iterable[Tuple[str, int, float]]) -> Optional[int]:
+        """
+        :param format: The archive format.
+        :param entries: The name, size and modification time of each entry.
+        :return: The length in bytes of the archive, or None if the format does not allow knowing it in advance.
+        """
+        if format != "tar":
+            return None
+        return sum(len(cls._tar_header(name, size, mtime)) + size + cls._tar_padding(size)
+                   for name, size, mtime in entries) + 2 * tarfile.BLOCKSIZE
@@ -0,0 +1,169 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from fastapi.logger import logger
+
+
+class DatabaseConnectionPool:
+    """
+    :class: DatabaseConnectionPool
+
+    This class keeps long-lived SQLite connections open for the lifetime of the database service so that
+    queries no longer pay for opening the file, parsing the schema and warming the page cache on every call.
+
+    Each worker thread lazily receives its own read-only connection, and all writes go through a single
+    dedicated writer connection guarded by a lock. The database is switched to WAL journaling so readers
+    never block behind the writer.
+
+    :ivar database_file: The path to the SQLite database file.
+    :type database_file: str
+    :ivar pragmas: The pragmas applied to every connection opened by the pool.
+    :type pragmas: dict
+
+    Methods
+    -------
+
+    open(self):
+        Opens the writer connection and enables WAL journaling.
+
+    reader(self):
+        Returns the read connection bound to the calling thread, opening it if necessary.
+
+    writer(self):
+        Context manager yielding the writer connection while holding the write lock.
+
+    open_reader(self):
+        Opens a read-only connection owned by the caller.
+
+    close(self):
+        Closes every connection opened by the pool.
+    """
+    DEFAULT_PRAGMAS = {
+        "synchronous": "NORMAL",
+        "cache_size": -16000,  # negative values are in KiB, so roughly 16MB per connection
+        "mmap_size": 268435456,  # 256MB
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    }
+
+    def __init__(self, database_file: str, pragmas: dict = None):
+        self.database_file = database_file
+        self.pragmas = dict(self.DEFAULT_PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._writer = None
+        self._closed = True
+
+    @property
+    def is_open(self) -> bool:
+        """
+        :return: True if the pool has been opened and not yet closed, False otherwise.
+        """
+        return not self._closed
+
+    def _connect(self, read_only: bool, track: bool = True) -> sqlite3.Connection:
+        """
+        Open a new connection and apply the configured pragmas.
+
+        :param read_only: Whether the connection should reject writes.
+        :param track: Whether the pool should close the connection when it is closed.
+        :return: The configured connection.
+        """
+        conn = sqlite3.connect(self.database_file, check_same_thread=False)
+        for pragma, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        if read_only:
+            conn.execute("PRAGMA query_only = 1")
+
+        if track:
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def open_reader(self) -> sqlite3.Connection:
+        """
+        Open a read-only connection owned by the caller, for long-running reads such as streamed result sets that
+        may be resumed from different threads and must not share a thread's pooled connection.
+
+        :return: A read-only connection the caller must close.
+        :raises RuntimeError: If the pool is not open.
+        """
+        if self._closed:
+            raise RuntimeError("Database connection pool is not open")
+        return self._connect(read_only=True, track=False)
+
+    def open(self):
+        """
+        Open the writer connection and switch the database to WAL journaling.
+
+        :return: None
+        """
+        if not self._closed:
+            return
+
+        self._local = threading.local()
+        self._writer = self._connect(read_only=False)
+        mode = self._writer.execute("PRAGMA journal_mode = WAL").fetchone()
+        if mode is None or str(mode[0]).lower() != "wal":
+            logger.warning(f"Unable to enable WAL journaling on {self.database_file}, using {mode}")
+        self._closed = False
+
+    def reader(self) -> sqlite3.Connection:
+        """
+        Retrieve the read connection for the calling thread.
+
+        :return: A read-only connection owned by the current thread.
+        :raises RuntimeError: If the pool is not open.
+        """
+        if self._closed:
+            raise RuntimeError("Database connection pool is not open")
+
+        conn = getattr(self._local, "connection", None)
+        if conn is None:
+            conn = self._connect(read_only=True)
+            self._local.connection = conn
+        return conn
+
+    @contextmanager
+    def writer(self):
+        """
+        Yield the writer connection while holding the write lock. Any open transaction is rolled back if the
+        body raises.
+
+        :return: A context manager yielding the writer connection.
+        :raises RuntimeError: If the pool is not open.
+        """
+        if self._closed:
+            raise RuntimeError("Database connection pool is not open")
+
+        with self._write_lock:
+            try:
+                yield self._writer
+            except Exception:
+                if self._writer.in_transaction:
+                    self._writer.rollback()
+                raise
+
+    def close(self):
+        """
+        Close every connection opened by the pool.
+
+        :return: None
+        """
+        if self._closed:
+            return
+        self._closed = True
+
+        with self._write_lock, self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except Exception as e:
+                    logger.error(f"An error occurred while closing database connection: {str(e)}")
+            self._connections.clear()
+            self._writer = None
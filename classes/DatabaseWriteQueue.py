@@ -0,0 +1,205 @@
+import asyncio
+import time
+
+from fastapi.logger import logger
+
+
+class DatabaseWriteQueue:
+    """
+    :class: DatabaseWriteQueue
+
+    This class funnels every database write through a single writer task. Operations are queued, collected into
+    batches within a short latency window and committed together, so a burst of inserts costs one fsync instead
+    of one per row and never contends for SQLite's write lock.
+
+    Each operation runs inside its own savepoint, so a failing operation is rolled back on its own and only its
+    caller receives the error; the rest of the batch is still committed.
+
+    :ivar connection_pool: The pool providing the writer connection.
+    :type connection_pool: DatabaseConnectionPool
+    :ivar max_batch_size: The maximum number of operations committed together.
+    :type max_batch_size: int
+    :ivar commit_latency: The number of seconds to wait for more operations after the first one arrives.
+    :type commit_latency: float
+    :ivar executor: The executor batches are committed on, or None for the event loop's default executor.
+    :type executor: concurrent.futures.Executor
+
+    Methods
+    -------
+
+    start(self):
+        Starts the writer task.
+
+    submit(self, operation, *args):
+        Queues a write operation and waits for its result.
+
+    stop(self):
+        Commits any queued operations and stops the writer task.
+
+    stats(self):
+        Returns the batch-size and commit-latency counters.
+    """
+    def __init__(self, connection_pool, max_batch_size: int = 128, commit_latency: float = 0.005, executor=None):
+        self.connection_pool = connection_pool
+        self.max_batch_size = max_batch_size
+        self.commit_latency = commit_latency
+        self.executor = executor
+        self.queue = None
+        self.task = None
+        self.batches_committed = 0
+        self.operations_committed = 0
+        self.operations_failed = 0
+        self.max_batch_seen = 0
+        self.total_commit_time = 0.0
+        self.max_commit_time = 0.0
+        self.last_commit_time = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        """
+        :return: True if the writer task is accepting operations, False otherwise.
+        """
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        """
+        Start the writer task on the running event loop.
+
+        :return: The writer task.
+        """
+        if not self.is_running:
+            self.queue = asyncio.Queue()
+            self.task = asyncio.create_task(self.run())
+        return self.task
+
+    async def submit(self, operation, *args):
+        """
+        Queue a write operation and wait for it to be committed.
+
+        :param operation: A function taking the writer connection followed by `args`.
+        :param args: The arguments to pass to the operation.
+        :return: The value returned by the operation.
+        :raises RuntimeError: If the writer task is not running.
+        :raises Exception: Any exception raised by the operation or by the commit.
+        """
+        if not self.is_running:
+            raise RuntimeError("Database write queue is not running")
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((operation, args, future))
+        return await future
+
+    async def run(self):
+        """
+        Drain the queue forever, committing operations in batches.
+
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.commit_latency
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await loop.run_in_executor(self.executor, self.commit_batch, batch)
+            except Exception as e:
+                logger.error(f"An error occurred while committing database writes: {str(e)}")
+                results = [(False, e)] * len(batch)
+
+            for (_, _, future), (success, result) in zip(batch, results):
+                if future.done():
+                    continue
+                if success:
+                    future.set_result(result)
+                else:
+                    future.set_exception(result)
+
+            for _ in batch:
+                self.queue.task_done()
+
+    def commit_batch(self, batch):
+        """
+        Run a batch of operations in a single transaction.
+
+        :param batch: A list of (operation, args, future) tuples.
+        :return: A list of (success, result or exception) tuples in the same order as the batch.
+        """
+        results = []
+        start = time.perf_counter()
+        with self.connection_pool.writer() as conn:
+            conn.execute("BEGIN")
+            for operation, args, _ in batch:
+                conn.execute("SAVEPOINT write_operation")
+                try:
+                    result = operation(conn, *args)
+                    conn.execute("RELEASE write_operation")
+                    results.append((True, result))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_operation")
+                    conn.execute("RELEASE write_operation")
+                    results.append((False, e))
+            conn.commit()
+
+        elapsed = time.perf_counter() - start
+        self.batches_committed += 1
+        self.operations_committed += sum(1 for success, _ in results if success)
+        self.operations_failed += sum(1 for success, _ in results if not success)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        self.total_commit_time += elapsed
+        self.max_commit_time = max(self.max_commit_time, elapsed)
+        self.last_commit_time = elapsed
+        return results
+
+    async def stop(self):
+        """
+        Wait for queued operations to be committed and stop the writer task.
+
+        :return: None
+        """
+        if not self.is_running:
+            return
+
+        await self.queue.join()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    def stats(self):
+        """
+        Retrieve the writer counters.
+
+        :return: A dictionary containing the following information:
+                 - "queue_depth": The number of operations waiting to be committed.
+                 - "batches_committed": The number of committed batches.
+                 - "operations_committed": The number of operations that succeeded.
+                 - "operations_failed": The number of operations that were rolled back.
+                 - "avg_batch_size": The average number of operations per batch.
+                 - "max_batch_size": The largest batch committed.
+                 - "avg_commit_ms": The average time taken to run and commit a batch in milliseconds.
+                 - "max_commit_ms": The longest time taken to run and commit a batch in milliseconds.
+                 - "last_commit_ms": The time taken by the most recent batch in milliseconds.
+        :rtype: dict
+        """
+        batches = self.batches_committed
+        return {
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "batches_committed": batches,
+            "operations_committed": self.operations_committed,
+            "operations_failed": self.operations_failed,
+            "avg_batch_size": (self.operations_committed + self.operations_failed) / batches if batches else 0,
+            "max_batch_size": self.max_batch_seen,
+            "avg_commit_ms": self.total_commit_time * 1000 / batches if batches else 0,
+            "max_commit_ms": self.max_commit_time * 1000,
+            "last_commit_ms": self.last_commit_time * 1000,
+        }
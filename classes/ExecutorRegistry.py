@@ -0,0 +1,169 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class InstrumentedThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    :class: InstrumentedThreadPoolExecutor
+
+    A :class:`ThreadPoolExecutor` that records how long each call waits for a free worker and how many calls are
+    queued or running, so a saturated pool shows up in the service data.
+    """
+    def __init__(self, max_workers: int, thread_name_prefix: str = ""):
+        super().__init__(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.max_workers = max_workers
+        self._stats_lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def submit(self, fn, /, *args, **kwargs):
+        """
+        Schedule a call, timing how long it waits before a worker picks it up.
+
+        :param fn: The function to call.
+        :param args: The positional arguments to pass to the function.
+        :param kwargs: The keyword arguments to pass to the function.
+        :return: A future resolving to the result of the call.
+        """
+        submitted = time.perf_counter()
+        with self._stats_lock:
+            self.queued += 1
+
+        def timed_call():
+            waited = time.perf_counter() - submitted
+            with self._stats_lock:
+                self.queued -= 1
+                self.active += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._stats_lock:
+                    self.active -= 1
+                    self.completed += 1
+
+        return super().submit(timed_call)
+
+    def stats(self):
+        """
+        Retrieve the pool counters.
+
+        :return: A dictionary containing the following information:
+                 - "max_workers": The number of worker threads.
+                 - "queue_depth": The number of calls waiting for a worker.
+                 - "active": The number of calls currently running.
+                 - "completed": The number of calls that have finished.
+                 - "avg_wait_ms": The average time calls waited for a worker in milliseconds.
+                 - "max_wait_ms": The longest time a call waited for a worker in milliseconds.
+        :rtype: dict
+        """
+        with self._stats_lock:
+            started = self.active + self.completed
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self.queued,
+                "active": self.active,
+                "completed": self.completed,
+                "avg_wait_ms": self.total_wait * 1000 / started if started else 0,
+                "max_wait_ms": self.max_wait * 1000,
+            }
+
+
+class ExecutorRegistry:
+    """
+    :class: ExecutorRegistry
+
+    This class keeps a separately sized thread pool per class of blocking work, so a burst of one kind of work
+    (such as password hashing) cannot starve another (such as database reads) of threads. Pools are created on
+    first use.
+
+    :ivar pool_sizes: The number of worker threads of each pool, by pool name.
+    :type pool_sizes: dict
+
+    Methods
+    -------
+
+    get(self, name):
+        Returns the executor of the named pool.
+
+    run(self, name, func, *args):
+        Runs a function on the named pool and waits for its result.
+
+    shutdown(self):
+        Shuts every pool down.
+
+    stats(self):
+        Returns the queue depth and wait time counters of every pool.
+    """
+    DB = "db"
+    CPU = "cpu"
+    FILE = "file"
+
+    def __init__(self, pool_sizes: dict):
+        self.pool_sizes = dict(pool_sizes)
+        self._executors = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> InstrumentedThreadPoolExecutor:
+        """
+        Retrieve the executor of a pool, creating it if necessary.
+
+        :param name: The name of the pool.
+        :return: The pool's executor.
+        :raises KeyError: If no pool with that name is configured.
+        """
+        with self._lock:
+            executor = self._executors.get(name)
+            if executor is None:
+                executor = InstrumentedThreadPoolExecutor(self.pool_sizes[name], thread_name_prefix=f"{name}-pool")
+                self._executors[name] = executor
+            return executor
+
+    async def run(self, name: str, func, *args):
+        """
+        Run a function on a pool without blocking the event loop.
+
+        :param name: The name of the pool.
+        :param func: The function to execute.
+        :param args: The arguments to pass to the function.
+        :return: The result of the function.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.get(name), func, *args)
+
+    def shutdown(self):
+        """
+        Shut every pool down without waiting for queued calls. Pools are created again if they are used afterwards.
+
+        :return: None
+        """
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+        for executor in executors:
+            executor.shutdown(wait=False)
+
+    def stats(self):
+        """
+        Retrieve the counters of every configured pool.
+
+        :return: A dictionary of pool counters by pool name. See `InstrumentedThreadPoolExecutor.stats`.
+        :rtype: dict
+        """
+        with self._lock:
+            executors = dict(self._executors)
+        stats = {}
+        for name, size in self.pool_sizes.items():
+            executor = executors.get(name)
+            if executor is not None:
+                stats[name] = executor.stats()
+            else:
+                stats[name] = {"max_workers": size, "queue_depth": 0, "active": 0, "completed": 0, "avg_wait_ms": 0,
+                               "max_wait_ms": 0}
+        return stats
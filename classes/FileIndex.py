@@ -0,0 +1,251 @@
+import os
+from typing import NamedTuple, Optional
+
+from utils.FileLayout import is_shard_name, shard_dir
+
+
+class IndexedFile(NamedTuple):
+    path: str
+    extension: str
+    size: int
+    mtime: float
+
+
+class FileIndex:
+    """
+    :class: FileIndex
+
+    This class maps the IDs of the files in a directory, the part of each file name before the first dot, to the
+    files themselves, so looking a file up by ID no longer lists the whole directory.
+
+    Files are stored in nested shard directories `depth` levels deep (see `utils.FileLayout.shard_dir`), or flat in
+    the directory itself if they were stored before it was sharded and have not been migrated yet.
+
+    The index is rebuilt from the directory with `scan` and `replace`. Files added behind the index's back are
+    picked up on the next lookup miss by listing the file's small shard directory, or by rescanning if the top
+    directory's modification time changed since the last scan, which only happens when flat files come and go.
+
+    :ivar directory: The directory being indexed.
+    :type directory: str
+    :ivar depth: The number of nested shard levels.
+    :type depth: int
+
+    Methods
+    -------
+
+    get(self, file_id):
+        Returns the indexed file with the given ID, if it still exists.
+
+    shard_dir(self, file_id):
+        Returns the shard directory a file belongs in.
+
+    find_in_shard(self, file_id):
+        Lists the shard directory of a file to find it. Safe to call from a worker thread.
+
+    needs_scan(self):
+        Returns whether flat files changed since the directory was last scanned.
+
+    scan(self):
+        Lists the directory. Safe to call from a worker thread.
+
+    replace(self, entries, directory_mtime):
+        Swaps in the result of a scan.
+
+    add(self, file_id, path):
+        Indexes a file that was just written.
+
+    remove(self, file_id):
+        Drops a file that was just deleted.
+
+    ids(self):
+        Returns the IDs of the indexed files.
+
+    stats(self):
+        Returns the size and lookup counters of the index.
+    """
+    def __init__(self, directory: str, depth: int = 0):
+        self.directory = directory
+        self.depth = depth
+        self._entries = {}
+        self._directory_mtime = None
+        self.hits = 0
+        self.misses = 0
+        self.scans = 0
+
+    @staticmethod
+    def file_id(file_name: str) -> Optional[str]:
+        """
+        :param file_name: The name of a file in the directory.
+        :return: The ID of the file, or None for hidden and temporary files.
+        """
+        if file_name.startswith("."):
+            return None
+        return file_name.split(".")[0]
+
+    @staticmethod
+    def _indexed_file(path: str, stat_result) -> IndexedFile:
+        """
+        :param path: The path to the file.
+        :param stat_result: The result of os.stat on the file.
+        :return: The index entry of the file.
+        """
+        extension = os.path.splitext(path)[1].lstrip(".")
+        return IndexedFile(path, extension, stat_result.st_size, stat_result.st_mtime)
+
+    def _current_directory_mtime(self):
+        """
+        :return: The modification time of the directory, or None if it does not exist.
+        """
+        try:
+            return os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def get(self, file_id: str) -> Optional[IndexedFile]:
+        """
+        Retrieve the indexed file with the given ID, refreshing its size and modification time.
+
+        :param file_id: The ID of the file.
+        :return: The indexed file, or None if it is not indexed or no longer exists.
+        """
+        entry = self._entries.get(file_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        try:
+            stat_result = os.stat(entry.path)
+        except FileNotFoundError:
+            del self._entries[file_id]
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        if stat_result.st_size != entry.size or stat_result.st_mtime != entry.mtime:
+            entry = self._indexed_file(entry.path, stat_result)
+            self._entries[file_id] = entry
+        return entry
+
+    def shard_dir(self, file_id: str) -> str:
+        """
+        :param file_id: The ID of the file.
+        :return: The shard directory the file belongs in.
+        """
+        return shard_dir(self.directory, file_id, self.depth)
+
+    def find_in_shard(self, file_id: str) -> Optional[str]:
+        """
+        List the shard directory of a file to find it. This does not modify the index, so it can run in a worker
+        thread.
+
+        :param file_id: The ID of the file.
+        :return: The path to the file, or None if it is not in its shard directory.
+        """
+        if self.depth == 0:
+            return None
+        try:
+            with os.scandir(self.shard_dir(file_id)) as directory:
+                for dir_entry in directory:
+                    if self.file_id(dir_entry.name) == file_id and dir_entry.is_file():
+                        return dir_entry.path
+        except FileNotFoundError:
+            pass
+        return None
+
+    def needs_scan(self) -> bool:
+        """
+        :return: True if the directory was never scanned or was modified since it was last scanned.
+        """
+        return self._directory_mtime is None or self._current_directory_mtime() != self._directory_mtime
+
+    def scan(self):
+        """
+        List the directory and its shard directories. This does not modify the index, so it can run in a worker
+        thread. Files in shard directories take precedence over flat files with the same ID.
+
+        :return: A tuple of the entries found by file ID and the directory's modification time before listing.
+        """
+        directory_mtime = self._current_directory_mtime()
+        entries = {}
+        if directory_mtime is not None:
+            self._scan_level(self.directory, 0, entries)
+        return entries, directory_mtime
+
+    def _scan_level(self, path: str, level: int, entries: dict):
+        """
+        Add the files of a directory to the entries, descending into its shard directories.
+
+        :param path: The directory to list.
+        :param level: The nesting level of the directory, 0 for the top directory.
+        :param entries: The entries found so far by file ID.
+        :return: None
+        """
+        flat_entries = {}
+        try:
+            with os.scandir(path) as directory:
+                for dir_entry in directory:
+                    try:
+                        if dir_entry.is_dir(follow_symlinks=False):
+                            if level < self.depth and is_shard_name(dir_entry.name):
+                                self._scan_level(dir_entry.path, level + 1, entries)
+                            continue
+                        file_id = self.file_id(dir_entry.name)
+                        target = entries if level == self.depth else flat_entries
+                        if file_id is not None and file_id not in target and dir_entry.is_file():
+                            target[file_id] = self._indexed_file(dir_entry.path, dir_entry.stat())
+                    except FileNotFoundError:
+                        continue
+        except FileNotFoundError:
+            return
+        for file_id, entry in flat_entries.items():
+            entries.setdefault(file_id, entry)
+
+    def replace(self, entries: dict, directory_mtime):
+        """
+        Replace the index with the result of `scan`.
+
+        :param entries: The entries found by the scan.
+        :param directory_mtime: The directory's modification time before the scan.
+        :return: None
+        """
+        self._entries = entries
+        self._directory_mtime = directory_mtime
+        self.scans += 1
+
+    def add(self, file_id: str, path: str):
+        """
+        Index a file that was just written.
+
+        :param file_id: The ID of the file.
+        :param path: The path to the file.
+        :return: None
+        """
+        self._entries[file_id] = self._indexed_file(path, os.stat(path))
+
+    def remove(self, file_id: str):
+        """
+        Drop a file that was just deleted from the index.
+
+        :param file_id: The ID of the file.
+        :return: None
+        """
+        self._entries.pop(file_id, None)
+
+    def ids(self):
+        """
+        :return: A list of the IDs of the indexed files.
+        """
+        return list(self._entries)
+
+    def stats(self):
+        """
+        Retrieve the index counters.
+
+        :return: A dictionary containing the following information:
+                 - "entries": The number of indexed files.
+                 - "hits": The number of lookups answered from the index.
+                 - "misses": The number of lookups for files that were not indexed.
+                 - "scans": The number of times the directory was listed.
+        :rtype: dict
+        """
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "scans": self.scans}
@@ -0,0 +1,111 @@
+import bisect
+import hashlib
+from typing import Iterable, List
+
+
+class HashRing:
+    """
+    :class: HashRing
+
+    This class places keys, such as song IDs, on a consistent-hash ring of nodes, such as file service URLs. Each node
+    owns `virtual_nodes` points on the ring, and a key is stored on the first distinct nodes found walking clockwise
+    from the key's hash. Adding or removing a node only moves the keys next to its points, so most keys stay where
+    they are when the cluster changes.
+
+    Every process building a ring from the same nodes and number of virtual nodes places keys identically, so the
+    ring can be rebuilt by clients from the node list alone.
+
+    :ivar virtual_nodes: The number of points each node owns on the ring.
+    :type virtual_nodes: int
+
+    Methods
+    -------
+
+    add(self, node):
+        Adds a node to the ring.
+
+    remove(self, node):
+        Removes a node from the ring.
+
+    get_nodes(self, key, count):
+        Returns the nodes a key is placed on, in order of preference.
+    """
+    VIRTUAL_NODES = 100
+
+    def __init__(self, nodes: Iterable[str] = (), virtual_nodes: int = VIRTUAL_NODES):
+        self.virtual_nodes = virtual_nodes
+        self._nodes = set()
+        self._points = []
+        self._owners = []
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        """
+        :param value: The value to hash.
+        :return: The position of the value on the ring.
+        """
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+    @property
+    def nodes(self) -> List[str]:
+        """
+        :return: The nodes on the ring, sorted.
+        """
+        return sorted(self._nodes)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def add(self, node: str):
+        """
+        Add a node to the ring. Adding a node already on the ring does nothing.
+
+        :param node: The node to add.
+        :return: None
+        """
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for replica in range(self.virtual_nodes):
+            point = self._hash(f"{node}#{replica}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node: str):
+        """
+        Remove a node from the ring. Removing a node not on the ring does nothing.
+
+        :param node: The node to remove.
+        :return: None
+        """
+        if node not in self._nodes:
+            return
+        self._nodes.discard(node)
+        kept = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != node]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def get_nodes(self, key: str, count: int) -> List[str]:
+        """
+        Retrieve the nodes a key is placed on.
+
+        :param key: The key to place.
+        :param count: The number of nodes to place the key on, the replication factor.
+        :return: Up to `count` distinct nodes, the primary first. Fewer are returned if the ring has fewer nodes.
+        """
+        count = min(count, len(self._nodes))
+        placement = []
+        if count == 0:
+            return placement
+
+        start = bisect.bisect(self._points, self._hash(key))
+        for offset in range(len(self._points)):
+            owner = self._owners[(start + offset) % len(self._points)]
+            if owner not in placement:
+                placement.append(owner)
+                if len(placement) == count:
+                    break
+        return placement
@@ -0,0 +1,207 @@
+from collections import OrderedDict
+from typing import Hashable, NamedTuple, Optional
+
+
+class CachedImage(NamedTuple):
+    content: bytes
+    media_type: str
+    headers: dict
+    mtime: float
+
+
+class ImageCache:
+    """
+    :class: ImageCache
+
+    This class is a least-recently-used cache of small images held in memory with their response headers, bounded
+    by the total number of bytes it holds rather than by its number of entries.
+
+    An image is only admitted once it has been requested `admit_after` times and is no larger than
+    `max_entry_size`, so a page of covers requested once, or a single large image, cannot flush the covers every page
+    shows. Request counts of uncached images are kept for the `max_tracked` most recently requested only.
+
+    An image is only stored if it was not invalidated while it was being read, so a read racing an upload or a
+    deletion can never put a stale image back into the cache, while uploads of other images do not stop it from being
+    cached. The version of the last invalidation of each image is kept for the `max_tracked` most recently
+    invalidated, and a read older than those forgotten is not stored. The cache is only used from the event loop and
+    is not thread-safe.
+
+    :ivar max_bytes: The maximum number of image bytes held before the least recently used are evicted.
+    :type max_bytes: int
+    :ivar max_entry_size: The size in bytes of the largest image admitted.
+    :type max_entry_size: int
+    :ivar admit_after: The number of requests for an image before it is admitted.
+    :type admit_after: int
+    :ivar max_tracked: The maximum number of uncached images whose requests are counted, and of invalidated images
+                       whose last invalidation is remembered.
+    :type max_tracked: int
+    :ivar version: The number of invalidations so far, read before an image is read and passed to `put`.
+    :type version: int
+
+    Methods
+    -------
+
+    get(self, key):
+        Looks up a cached image.
+
+    admits(self, key, size):
+        Counts a request for an uncached image and returns whether it should be read into the cache.
+
+    put(self, key, image, version):
+        Stores an image read while the cache was at the given version.
+
+    invalidate(self, key):
+        Drops an image that was replaced or deleted.
+
+    clear(self):
+        Drops every image.
+
+    stats(self):
+        Returns the hit, miss and eviction counters.
+    """
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entry_size: int = 1024 * 1024, admit_after: int = 2,
+                 max_tracked: int = 16384):
+        self.max_bytes = max_bytes
+        self.max_entry_size = max_entry_size
+        self.admit_after = admit_after
+        self.max_tracked = max_tracked
+        self.version = 0
+        self.size = 0
+        self._entries = OrderedDict()
+        self._requests = OrderedDict()
+        # the version of the last invalidation of each image, oldest first, and the version below which they are lost
+        self._invalidated = OrderedDict()
+        self._oldest_version = 0
+        self.hits = 0
+        self.misses = 0
+        self.admissions = 0
+        self.rejections = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[CachedImage]:
+        """
+        Look up a cached image, marking it as the most recently used.
+
+        :param key: The key of the image, such as its ID and size.
+        :return: The cached image, or None if it is not cached.
+        """
+        image = self._entries.get(key)
+        if image is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return image
+
+    def admits(self, key: Hashable, size: int) -> bool:
+        """
+        Count a request for an image that was not cached.
+
+        :param key: The key of the image, such as its ID and size.
+        :param size: The size of the image in bytes.
+        :return: True if the image is small enough and was requested often enough to be read into the cache.
+        """
+        if size > self.max_entry_size or size > self.max_bytes:
+            self.rejections += 1
+            return False
+
+        requests = self._requests.pop(key, 0) + 1
+        self._requests[key] = requests
+        while len(self._requests) > self.max_tracked:
+            self._requests.popitem(last=False)
+        return requests >= self.admit_after
+
+    def put(self, key: Hashable, image: CachedImage, version: int):
+        """
+        Store an image, evicting the least recently used images until the cache fits in `max_bytes`.
+
+        :param key: The key of the image, such as its ID and size.
+        :param image: The image and its response headers.
+        :param version: The cache version read before the image was read. The image is discarded if it was
+                        invalidated since.
+        :return: None
+        """
+        if version < self._oldest_version or self._invalidated.get(key, 0) > version or \
+                len(image.content) > self.max_entry_size:
+            return
+
+        self._remove(key)
+        self._requests.pop(key, None)
+        self._entries[key] = image
+        self.size += len(image.content)
+        self.admissions += 1
+
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        """
+        Drop an image that was replaced or deleted, and any read of it in progress.
+
+        :param key: The key of the image, such as its ID and size.
+        :return: None
+        """
+        self.version += 1
+        self._invalidated.pop(key, None)
+        self._invalidated[key] = self.version
+        while len(self._invalidated) > self.max_tracked:
+            _, self._oldest_version = self._invalidated.popitem(last=False)
+        if self._remove(key):
+            self.invalidations += 1
+
+    def clear(self):
+        """
+        Drop every cached image and request count.
+
+        :return: None
+        """
+        self.version += 1
+        self._oldest_version = self.version
+        self._invalidated.clear()
+        self._entries.clear()
+        self._requests.clear()
+        self.size = 0
+
+    def _remove(self, key: Hashable) -> bool:
+        """
+        :param key: The key of the image, such as its ID and size.
+        :return: True if the image was cached.
+        """
+        image = self._entries.pop(key, None)
+        if image is None:
+            return False
+        self.size -= len(image.content)
+        return True
+
+    def stats(self):
+        """
+        Retrieve the cache counters.
+
+        :return: A dictionary containing the following information:
+                 - "entries": The number of cached images.
+                 - "bytes": The number of bytes held.
+                 - "max_bytes": The maximum number of bytes held.
+                 - "hits": The number of requests answered from memory.
+                 - "misses": The number of requests that had to read the disk.
+                 - "admissions": The number of images read into the cache.
+                 - "rejections": The number of requests for images too large to cache.
+                 - "evictions": The number of images dropped to make room for newer ones.
+                 - "invalidations": The number of images dropped because they were replaced or deleted.
+                 - "hit_rate": The fraction of requests answered from memory.
+        :rtype: dict
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "admissions": self.admissions,
+            "rejections": self.rejections,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0,
+        }
@@ -0,0 +1,229 @@
+import asyncio
+import json
+import os
+from typing import Optional
+
+from fastapi.logger import logger
+
+
+class Md5VerificationCache:
+    """
+    :class: Md5VerificationCache
+
+    This class remembers the MD5 hash of each file, keyed on its path and validated against the file's inode, size
+    and modification time, so a file is hashed once and then trusted until it changes. Concurrent requests for the
+    hash of the same file share a single read of the file.
+
+    The cache can be saved to and loaded from a small JSON sidecar index so a restart does not rehash every file.
+
+    :ivar index_file: The path of the sidecar index.
+    :type index_file: str
+    :ivar hash_file: The coroutine function used to hash a file, taking its path.
+    :type hash_file: Callable[[str], Awaitable[str]]
+
+    Methods
+    -------
+
+    get_md5(self, path):
+        Returns the MD5 hash of a file, hashing it only if it changed since it was last hashed.
+
+    peek(self, path):
+        Returns the MD5 hash of a file if it is known and the file did not change, without hashing it.
+
+    record(self, path, md5):
+        Stores the MD5 hash of a file that was just written.
+
+    forget(self, path):
+        Drops the entry of a deleted file.
+
+    move(self, old_path, new_path):
+        Moves the entry of a renamed file.
+
+    load(self):
+        Loads the sidecar index.
+
+    save(self, executor=None):
+        Writes the sidecar index if any entry changed.
+
+    stats(self):
+        Returns the hit and miss counters.
+    """
+    def __init__(self, index_file: str, hash_file):
+        self.index_file = index_file
+        self.hash_file = hash_file
+        self._entries = {}
+        self._pending = {}
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def _signature(stat_result):
+        """
+        :param stat_result: The result of os.stat on a file.
+        :return: The inode, size and modification time identifying the file's current contents.
+        """
+        return stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns
+
+    async def get_md5(self, path: str) -> str:
+        """
+        Retrieve the MD5 hash of a file, hashing it only if it is unknown or changed since it was last hashed.
+
+        :param path: The path to the file.
+        :return: The MD5 hash of the file.
+        :raises OSError: If the file cannot be read.
+        """
+        path = os.path.abspath(path)
+        signature = self._signature(os.stat(path))
+        entry = self._entries.get(path)
+        if entry is not None and tuple(entry[:3]) == signature:
+            self.hits += 1
+            return entry[3]
+
+        pending = self._pending.get((path, signature))
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        task = asyncio.ensure_future(self._hash(path, signature))
+        self._pending[(path, signature)] = task
+        return await asyncio.shield(task)
+
+    def peek(self, path: str) -> Optional[str]:
+        """
+        Retrieve the MD5 hash of a file if it is known and the file did not change since, without hashing it.
+
+        :param path: The path to the file.
+        :return: The MD5 hash of the file, or None if it would have to be hashed.
+        :raises OSError: If the file cannot be read.
+        """
+        path = os.path.abspath(path)
+        entry = self._entries.get(path)
+        if entry is None or tuple(entry[:3]) != self._signature(os.stat(path)):
+            return None
+        self.hits += 1
+        return entry[3]
+
+    async def _hash(self, path: str, signature):
+        """
+        Hash a file and store the result if the file did not change while it was read.
+
+        :param path: The absolute path to the file.
+        :param signature: The signature of the file before it was read.
+        :return: The MD5 hash of the file.
+        """
+        try:
+            md5 = await self.hash_file(path)
+            if self._signature(os.stat(path)) == signature:
+                self._entries[path] = (*signature, md5)
+                self.dirty = True
+            return md5
+        finally:
+            self._pending.pop((path, signature), None)
+
+    def record(self, path: str, md5: str):
+        """
+        Store the MD5 hash of a file that was just written, so it never has to be read back.
+
+        :param path: The path to the file.
+        :param md5: The MD5 hash of the file's contents.
+        :return: None
+        """
+        path = os.path.abspath(path)
+        self._entries[path] = (*self._signature(os.stat(path)), md5)
+        self.dirty = True
+
+    def forget(self, path: str):
+        """
+        Drop the entry of a file that was deleted.
+
+        :param path: The path to the file.
+        :return: None
+        """
+        if self._entries.pop(os.path.abspath(path), None) is not None:
+            self.dirty = True
+
+    def move(self, old_path: str, new_path: str):
+        """
+        Move the entry of a file that was renamed, so it is not hashed again under its new path.
+
+        :param old_path: The path the file was moved from.
+        :param new_path: The path the file was moved to.
+        :return: None
+        """
+        entry = self._entries.pop(os.path.abspath(old_path), None)
+        if entry is not None:
+            self._entries[os.path.abspath(new_path)] = entry
+            self.dirty = True
+
+    def load(self):
+        """
+        Load the sidecar index, skipping it if it is missing or unreadable.
+
+        :return: The number of entries loaded.
+        """
+        try:
+            with open(self.index_file, "r") as file:
+                entries = json.load(file)
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            logger.error(f"An error occurred while loading MD5 index {self.index_file}: {str(e)}")
+            return 0
+
+        self._entries = {path: tuple(entry) for path, entry in entries.items() if len(entry) == 4}
+        self.dirty = False
+        return len(self._entries)
+
+    async def save(self, executor=None):
+        """
+        Write the sidecar index atomically if any entry changed since it was last written.
+
+        :param executor: The executor to write the index on, or None for the event loop's default executor.
+        :return: None
+        """
+        if not self.dirty:
+            return
+
+        # snapshot on the event loop, which is the only place entries change. Entries for files that changed since
+        # never match the file's signature again, so a slightly stale index is harmless
+        entries = dict(self._entries)
+        self.dirty = False
+        try:
+            await asyncio.get_running_loop().run_in_executor(executor, self._write_index, entries)
+        except Exception as e:
+            self.dirty = True
+            logger.error(f"An error occurred while saving MD5 index {self.index_file}: {str(e)}")
+
+    def _write_index(self, entries):
+        """
+        Write the sidecar index to a temporary file and rename it into place.
+
+        :param entries: The entries to write.
+        :return: None
+        """
+        temp_path = f"{self.index_file}.tmp"
+        os.makedirs(os.path.dirname(self.index_file) or ".", exist_ok=True)
+        with open(temp_path, "w") as file:
+            json.dump(entries, file)
+        os.replace(temp_path, self.index_file)
+
+    def stats(self):
+        """
+        Retrieve the cache counters.
+
+        :return: A dictionary containing the following information:
+                 - "entries": The number of files with a known hash.
+                 - "hits": The number of lookups answered without reading the file.
+                 - "misses": The number of lookups that hashed the file.
+                 - "coalesced": The number of lookups that waited for a hash already in progress.
+        :rtype: dict
+        """
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,178 @@
+import time
+from collections import OrderedDict
+
+
+class QueryCache:
+    """
+    :class: QueryCache
+
+    This class is a bounded least-recently-used cache of query results with a time-to-live. Each entry is stored
+    under a key made of the query and its parameters, and is labelled with tags naming the rows it was read from,
+    such as ("song", song_id). Writes invalidate the tags they touch, dropping exactly the entries that could have
+    changed.
+
+    A result is only stored if none of its tags was invalidated while it was being read, so a read racing a write can
+    never put a stale result back into the cache, while writes to other rows do not stop results from being cached.
+    The version of the last invalidation of each tag is kept for the `max_tracked_tags` most recently invalidated
+    tags, and a read older than the tags forgotten is not stored. The cache is only used from the event loop and is
+    not thread-safe.
+
+    :ivar max_entries: The maximum number of results kept before the least recently used is evicted.
+    :type max_entries: int
+    :ivar ttl: The number of seconds a result is kept before it is read again.
+    :type ttl: float
+    :ivar max_tracked_tags: The maximum number of tags whose last invalidation is remembered.
+    :type max_tracked_tags: int
+    :ivar version: The number of invalidations so far, read before a query and passed to `put`.
+    :type version: int
+
+    Methods
+    -------
+
+    get(self, key):
+        Looks up a cached result.
+
+    put(self, key, value, tags, version):
+        Stores a result read while the cache was at the given version.
+
+    invalidate(self, *tags):
+        Drops every result labelled with any of the tags.
+
+    stats(self):
+        Returns the hit, miss and eviction counters.
+    """
+    def __init__(self, max_entries: int = 4096, ttl: float = 60.0, max_tracked_tags: int = 16384):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_tracked_tags = max_tracked_tags
+        self.version = 0
+        # the version of the last invalidation of each tag, oldest first, and the version below which they are lost
+        self._invalidated = OrderedDict()
+        self._oldest_version = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """
+        Look up a cached result, marking it as the most recently used.
+
+        :param key: The key the result was stored under.
+        :return: A tuple of whether the result was found and the result itself.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+
+        value, tags, expires = entry
+        if expires <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return False, None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return True, value
+
+    def put(self, key, value, tags, version: int):
+        """
+        Store a result, evicting the least recently used results if the cache is full.
+
+        :param key: The key to store the result under.
+        :param value: The result.
+        :param tags: The tags of the rows the result was read from.
+        :param version: The cache version read before the query started. The result is discarded if any of its tags
+                        was invalidated since.
+        :return: None
+        """
+        tags = tuple(tags)
+        if version < self._oldest_version or any(self._invalidated.get(tag, 0) > version for tag in tags):
+            return
+
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, tags, time.monotonic() + self.ttl)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, *tags):
+        """
+        Drop every result labelled with any of the given tags.
+
+        :param tags: The tags of the rows that were written.
+        :return: None
+        """
+        self.version += 1
+        for tag in tags:
+            self._invalidated.pop(tag, None)
+            self._invalidated[tag] = self.version
+            for key in self._tags.pop(tag, ()):
+                if key in self._entries:
+                    self._remove(key)
+                    self.invalidations += 1
+        while len(self._invalidated) > self.max_tracked_tags:
+            _, self._oldest_version = self._invalidated.popitem(last=False)
+
+    def clear(self):
+        """
+        Drop every cached result.
+
+        :return: None
+        """
+        self.version += 1
+        self._oldest_version = self.version
+        self._invalidated.clear()
+        self._entries.clear()
+        self._tags.clear()
+
+    def _remove(self, key):
+        """
+        Remove a result and unlink it from its tags.
+
+        :param key: The key of the result.
+        :return: None
+        """
+        _, tags, _ = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self):
+        """
+        Retrieve the cache counters.
+
+        :return: A dictionary containing the following information:
+                 - "size": The number of cached results.
+                 - "max_entries": The maximum number of cached results.
+                 - "hits": The number of lookups answered from the cache.
+                 - "misses": The number of lookups that had to query the database.
+                 - "evictions": The number of results dropped to make room for newer ones.
+                 - "expirations": The number of results dropped because they outlived the TTL.
+                 - "invalidations": The number of results dropped because of a write.
+                 - "hit_rate": The fraction of lookups answered from the cache.
+        :rtype: dict
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0,
+        }
@@ -0,0 +1,215 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class SongMetadataIndex:
+    """
+    :class: SongMetadataIndex
+
+    This class keeps the MD5 hash and size of each song stored by a file service in a small SQLite database next to
+    the files, so downloads can be verified without asking the database service. Entries are written when a song is
+    uploaded and reconciled with the database service in the background, which stays the source of truth.
+
+    The connection is opened on first use and shared by the worker threads behind a lock. All methods block on disk
+    I/O and are meant to run on a worker thread.
+
+    :ivar database_file: The path of the SQLite database file.
+    :type database_file: str
+
+    Methods
+    -------
+
+    get(self, song_id):
+        Returns the MD5 hash and size of a song.
+
+    put(self, song_id, md5, size, reconciled=None):
+        Stores the MD5 hash and size of a song.
+
+    remove(self, song_id):
+        Removes a song.
+
+    stale(self, before, limit):
+        Returns the songs not reconciled since a given time.
+
+    reconcile(self, checked, database_md5s):
+        Applies the database service's MD5 hashes to the given songs.
+
+    get_state(self, key):
+        Returns a value stored alongside the songs.
+
+    set_state(self, key, value):
+        Stores a value alongside the songs.
+
+    stats(self):
+        Returns the number of songs and the lookup counters.
+
+    close(self):
+        Closes the connection.
+    """
+    def __init__(self, database_file: str):
+        self.database_file = database_file
+        self._connection = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.corrected = 0
+        self.removed = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Open the connection and create the table if necessary. Must be called with the lock held.
+
+        :return: The connection.
+        """
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.database_file) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.database_file, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS songs (song_id TEXT PRIMARY KEY, md5 TEXT NOT NULL, "
+                               "size INTEGER NOT NULL, reconciled REAL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS songs_reconciled ON songs (reconciled)")
+            connection.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def get(self, song_id: str) -> Optional[Tuple[str, int]]:
+        """
+        :param song_id: The ID of the song.
+        :return: A tuple of the MD5 hash and size in bytes of the song, or None if it is not indexed.
+        """
+        with self._lock:
+            row = self._connect().execute("SELECT md5, size FROM songs WHERE song_id = ?", (song_id,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0], row[1]
+
+    def put(self, song_id: str, md5: str, size: int, reconciled: Optional[float] = None):
+        """
+        Store the MD5 hash and size of a song, replacing any previous entry.
+
+        :param song_id: The ID of the song.
+        :param md5: The MD5 hash of the song's file.
+        :param size: The size of the song's file in bytes.
+        :param reconciled: The time the MD5 hash was last checked against the database service, or None if it never
+                           was, which puts the song first in line for the next reconciliation.
+        :return: None
+        """
+        with self._lock:
+            connection = self._connect()
+            connection.execute("INSERT OR REPLACE INTO songs (song_id, md5, size, reconciled) VALUES (?, ?, ?, ?)",
+                               (song_id, md5, size, reconciled))
+            connection.commit()
+
+    def remove(self, song_id: str):
+        """
+        :param song_id: The ID of the song to remove.
+        :return: None
+        """
+        with self._lock:
+            connection = self._connect()
+            connection.execute("DELETE FROM songs WHERE song_id = ?", (song_id,))
+            connection.commit()
+
+    def stale(self, before: float, limit: int) -> List[str]:
+        """
+        :param before: The time songs must not have been reconciled since.
+        :param limit: The maximum number of songs to return.
+        :return: The IDs of up to `limit` songs not reconciled since `before`, those never reconciled first.
+        """
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT song_id FROM songs WHERE reconciled IS NULL OR reconciled < ? "
+                "ORDER BY reconciled IS NOT NULL, reconciled LIMIT ?", (before, limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def reconcile(self, checked: List[str], database_md5s: Dict[str, str]):
+        """
+        Apply the database service's MD5 hashes to the given songs. A song whose hash differs takes the database
+        service's hash, so its file fails verification if it does not match, and a song the database service does not
+        know is removed, so lookups for it fall back to the database service.
+
+        :param checked: The IDs of the songs checked.
+        :param database_md5s: The MD5 hash of each checked song known to the database service, by song ID.
+        :return: A tuple of the number of songs corrected and the number removed.
+        """
+        corrected = removed = 0
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            for song_id in checked:
+                md5 = database_md5s.get(song_id)
+                if md5 is None:
+                    removed += connection.execute("DELETE FROM songs WHERE song_id = ?", (song_id,)).rowcount
+                    continue
+                corrected += connection.execute("UPDATE songs SET md5 = ? WHERE song_id = ? AND md5 != ?",
+                                                (md5, song_id, md5)).rowcount
+                connection.execute("UPDATE songs SET reconciled = ? WHERE song_id = ?", (now, song_id))
+            connection.commit()
+            self.corrected += corrected
+            self.removed += removed
+        return corrected, removed
+
+    def get_state(self, key: str) -> Optional[str]:
+        """
+        :param key: The name of the value, such as "scrub_position".
+        :return: The value stored under the key, or None if there is none.
+        """
+        with self._lock:
+            row = self._connect().execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_state(self, key: str, value: Optional[str]):
+        """
+        Store a value that must survive restarts alongside the songs, such as the progress of a background task.
+
+        :param key: The name of the value.
+        :param value: The value, or None to remove it.
+        :return: None
+        """
+        with self._lock:
+            connection = self._connect()
+            if value is None:
+                connection.execute("DELETE FROM state WHERE key = ?", (key,))
+            else:
+                connection.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+            connection.commit()
+
+    def stats(self):
+        """
+        Retrieve the index counters.
+
+        :return: A dictionary containing the following information:
+                 - "entries": The number of songs indexed.
+                 - "hits": The number of lookups answered by the index.
+                 - "misses": The number of lookups for songs not indexed.
+                 - "corrected": The number of MD5 hashes replaced by the database service's during reconciliation.
+                 - "removed": The number of songs removed because the database service does not know them.
+        :rtype: dict
+        """
+        with self._lock:
+            entries = self._connect().execute("SELECT COUNT(*) FROM songs").fetchone()[0]
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "corrected": self.corrected,
+            "removed": self.removed,
+        }
+
+    def close(self):
+        """
+        Close the connection. The next call opens it again.
+
+        :return: None
+        """
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import secrets
+import time
+from typing import Optional, Tuple
+
+from classes.exception.UploadTooLargeException import UploadTooLargeException
+
+
+class UploadSessionStore:
+    """
+    :class: UploadSessionStore
+
+    This class keeps resumable upload sessions on disk. Each session is a partial file, whose size is the offset the
+    next chunk must be written at, and a small JSON file recording the expected length and MD5 hash of the upload.
+    Because both live on disk, an interrupted upload can resume from its last written byte even after a restart.
+
+    All methods block on disk I/O and are meant to run on a worker thread.
+
+    :ivar directory: The directory the sessions are kept in. Must be on the same filesystem as the stored files, so
+                     completed uploads can be renamed into place.
+    :type directory: str
+    :ivar ttl: The number of seconds after which an unfinished session expires.
+    :type ttl: int
+
+    Methods
+    -------
+
+    create(self, length, md5=None, max_length=None):
+        Starts a session and returns its ID.
+
+    get(self, upload_id):
+        Returns the offset and metadata of a session.
+
+    append(self, upload_id, offset, data, sync=False):
+        Writes data at the end of a session's partial file.
+
+    finish(self, upload_id):
+        Checks a complete session's length and MD5 hash and returns its partial file.
+
+    discard(self, upload_id):
+        Removes a session.
+
+    expire(self):
+        Removes the sessions older than the TTL.
+    """
+    READ_SIZE = 1024 * 1024  # 1MB
+
+    def __init__(self, directory: str, ttl: int):
+        self.directory = directory
+        self.ttl = ttl
+
+    @staticmethod
+    def is_upload_id(value: str) -> bool:
+        """
+        :param value: The value to check.
+        :return: True if the value has the form of an upload ID, and so is safe to use in a path.
+        """
+        return value is not None and len(value) == 32 and all(character in "0123456789abcdef" for character in value)
+
+    def part_path(self, upload_id: str) -> str:
+        """
+        :param upload_id: The ID of the session.
+        :return: The path of the session's partial file.
+        """
+        return os.path.join(self.directory, f"{upload_id}.part")
+
+    def _meta_path(self, upload_id: str) -> str:
+        """
+        :param upload_id: The ID of the session.
+        :return: The path of the session's metadata file.
+        """
+        return os.path.join(self.directory, f"{upload_id}.json")
+
+    def create(self, length: int, md5: Optional[str] = None, max_length: Optional[int] = None) -> str:
+        """
+        Start a session.
+
+        :param length: The total length of the upload in bytes.
+        :param md5: The MD5 hash the upload must have, if known.
+        :param max_length: The largest length allowed, if any.
+        :return: The ID of the session.
+        :raises UploadTooLargeException: If the length is larger than `max_length`.
+        """
+        if max_length is not None and length > max_length:
+            raise UploadTooLargeException(f"Upload exceeds the maximum upload size of {max_length} bytes")
+
+        os.makedirs(self.directory, exist_ok=True)
+        upload_id = secrets.token_hex(16)
+        with open(self.part_path(upload_id), "xb"):
+            pass
+        with open(self._meta_path(upload_id), "w") as file:
+            json.dump({"length": length, "md5": md5, "created": time.time()}, file)
+        return upload_id
+
+    def get(self, upload_id: str) -> dict:
+        """
+        Retrieve the state of a session.
+
+        :param upload_id: The ID of the session.
+        :return: A dictionary with the ID, the current offset, the total length and the expected MD5 hash.
+        :raises FileNotFoundError: If there is no such session.
+        """
+        with open(self._meta_path(upload_id), "r") as file:
+            meta = json.load(file)
+        offset = os.stat(self.part_path(upload_id)).st_size
+        return {"upload_id": upload_id, "offset": offset, "length": meta["length"], "md5": meta["md5"]}
+
+    def append(self, upload_id: str, offset: int, data: bytes, sync: bool = False) -> int:
+        """
+        Write data at the end of a session's partial file.
+
+        :param upload_id: The ID of the session.
+        :param offset: The offset the client believes the data starts at. Must be the current offset.
+        :param data: The bytes to write.
+        :param sync: Whether to flush the partial file to disk, so the new offset survives a crash.
+        :return: The new offset.
+        :raises FileNotFoundError: If there is no such session.
+        :raises ValueError: If the offset is not the current offset, or the data runs past the upload's length.
+        """
+        session = self.get(upload_id)
+        if offset != session["offset"]:
+            raise ValueError(f"Offset {offset} does not match the current offset {session['offset']}")
+        if offset + len(data) > session["length"]:
+            raise ValueError(f"Data runs past the upload length of {session['length']} bytes")
+
+        fd = os.open(self.part_path(upload_id), os.O_WRONLY | os.O_APPEND)
+        try:
+            view = memoryview(data)
+            while view:
+                written = os.write(fd, view)
+                offset += written
+                view = view[written:]
+            if sync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+        return offset
+
+    def finish(self, upload_id: str) -> Tuple[str, str, int]:
+        """
+        Check that a session is complete and matches its expected MD5 hash.
+
+        :param upload_id: The ID of the session.
+        :return: A tuple of the path of the partial file, the MD5 hash of the upload and its size. The caller moves
+                 the file into place and then discards the session.
+        :raises FileNotFoundError: If there is no such session.
+        :raises ValueError: If the upload is incomplete or does not match its expected MD5 hash.
+        """
+        session = self.get(upload_id)
+        if session["offset"] != session["length"]:
+            raise ValueError(f"Upload is incomplete: {session['offset']} of {session['length']} bytes received")
+
+        hash_md5 = hashlib.md5()
+        with open(self.part_path(upload_id), "rb") as file:
+            while chunk := file.read(self.READ_SIZE):
+                hash_md5.update(chunk)
+        md5 = hash_md5.hexdigest()
+        if session["md5"] is not None and md5 != session["md5"]:
+            raise ValueError(f"MD5 mismatch: expected {session['md5']}, received {md5}")
+        return self.part_path(upload_id), md5, session["length"]
+
+    def discard(self, upload_id: str):
+        """
+        Remove a session and whatever remains of its partial file.
+
+        :param upload_id: The ID of the session.
+        :return: None
+        """
+        for path in (self.part_path(upload_id), self._meta_path(upload_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def expire(self) -> int:
+        """
+        Remove the sessions started more than `ttl` seconds ago.
+
+        :return: The number of sessions removed.
+        """
+        removed = 0
+        deadline = time.time() - self.ttl
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return removed
+
+        for name in names:
+            upload_id, extension = os.path.splitext(name)
+            if extension != ".json" or not self.is_upload_id(upload_id):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), "r") as file:
+                    created = json.load(file)["created"]
+            except (OSError, ValueError, KeyError):
+                continue
+            if created < deadline:
+                self.discard(upload_id)
+                removed += 1
+        return removed
@@ -0,0 +1,6 @@
+class UploadTooLargeException(Exception):
+    """Exception raised when an uploaded file exceeds the maximum upload size."""
+
+    def __init__(self, message="Uploaded file exceeds the maximum upload size."):
+        self.message = message
+        super().__init__(self.message)
@@ -0,0 +1,7 @@
+from typing import List
+
+from pydantic import BaseModel
+
+
+class SongIds(BaseModel):
+    song_ids: List[str]
@@ -6,8 +6,8 @@ import jwt
 from fastapi import HTTPException
 from fastapi.logger import logger
 from jwt import PyJWTError
-from starlette.concurrency import run_in_threadpool
 
+from classes.ExecutorRegistry import ExecutorRegistry
 from classes.enum.ServiceType import ServiceType
 from classes.exception.TokenCreationException import TokenCreationException
 from classes.services.ExtendedService import ExtendedService
@@ -47,8 +47,7 @@ class AuthService(ExtendedService):
             await asyncio.sleep(1)
 
 
-    @staticmethod
-    async def hash_password(password: str, salt: bytes):
+    async def hash_password(self, password: str, salt: bytes):
         """
         Hashes a password using PBKDF2 with the given salt.
 
@@ -57,10 +56,9 @@ class AuthService(ExtendedService):
         :return: The hashed password.
 
         """
-        loop = asyncio.get_running_loop()
-        hashed_password = await loop.run_in_executor(
-            None,  # Uses the default executor (ThreadPoolExecutor)
-            pbkdf2_hmac, 'sha256', password.encode('utf-8'), salt, 100000
+        # run on the CPU pool so a burst of logins only queues behind other hashing
+        hashed_password = await self.run_in_executor(
+            ExecutorRegistry.CPU, pbkdf2_hmac, 'sha256', password.encode('utf-8'), salt, 100000
         )
         return hashed_password
 
@@ -93,8 +91,8 @@ class AuthService(ExtendedService):
         :param token: The encoded token to be decoded.
         :return: The decoded token.
 
-        This method decodes an encoded token using the specified secret key and algorithm. The token is decoded using the `jwt.decode` function, which is run in a separate thread using `run
-        *_in_threadpool` to ensure asynchronous execution.
+        This method decodes an encoded token using the specified secret key and algorithm. The token is decoded using the `jwt.decode` function, which is called directly since verifying
+        * an HMAC signature takes microseconds, less than handing the call to a thread.
 
         :param token: The encoded token string.
         :return: The decoded token.
@@ -104,11 +102,8 @@ class AuthService(ExtendedService):
         :raises Exception: If an unexpected error occurs during token decoding.
         """
         try:
-            # run_in_threadpool is used to run the synchronous jwt.decode function in a separate thread
             secret_key = await self.get_secret_key()
-            decoded_token = await run_in_threadpool(
-                jwt.decode, token, secret_key, algorithms=[self.algorithm]
-            )
+            decoded_token = jwt.decode(token, secret_key, algorithms=[self.algorithm])
             return decoded_token
         except PyJWTError as e:
             raise e
@@ -8,6 +8,7 @@ from fastapi import FastAPI, BackgroundTasks, HTTPException
 from fastapi.logger import logger
 from httpx import HTTPStatusError
 
+from classes.ExecutorRegistry import ExecutorRegistry
 from classes.enum.ServiceType import ServiceType
 from classes.exception.RequestFailedExceptionException import RequestFailedException
 from utils.service_utils import generate_service_name, get_local_ip, get_property, handle_rest_request
@@ -29,15 +30,24 @@ class BaseService:
         - `tasks`: A list of background tasks.
         - `secret_key`: The secret key used for authentication.
         - `algorithm`: The algorithm used for authentication.
+        - `executors`: The thread pools used for blocking work, one per class of work (see `EXECUTOR_POOL_SIZES`).
 
     Methods:
         - `__init__(self, service_type: ServiceType)`: Initializes a new instance of the `BaseService` class.
         - `lifespan(self, app: FastAPI)`: An async context manager that handles the lifespan of the service.
         - `start_background_tasks(self)`: Starts the background tasks of the service.
         - `stop(self)`: Handles any cleanup necessary before service shutdown.
-        - `service_exception_handling(self, service_url, endpoint, method, params=None, data=None, files=None, stream=False)`: Handles service exceptions and returns the response.
+        - `run_in_executor(self, pool, func, *args)`: Runs a blocking function on one of the service's thread pools.
+        - `service_exception_handling(self, service_url, endpoint, method, params=None, data=None, files=None, stream=False, content=None)`: Handles service exceptions and returns the response.
 
     """
+    # database calls, CPU-bound hashing and file I/O each get their own threads so they cannot starve each other
+    EXECUTOR_POOL_SIZES = {
+        ExecutorRegistry.DB: 8,
+        ExecutorRegistry.CPU: os.cpu_count() or 1,
+        ExecutorRegistry.FILE: 8,
+    }
+
     def __init__(self, service_type: ServiceType, debug: Optional[bool] = False):
         self.service_type = service_type
         self.properties_file = "service_properties.json"
@@ -48,6 +58,7 @@ class BaseService:
         self.tasks = []
         self.secret_key = None
         self.algorithm = "HS256"
+        self.executors = ExecutorRegistry(self.EXECUTOR_POOL_SIZES)
         # enable swagger
         self.app = FastAPI(
             title=self.service_name,
@@ -111,8 +122,21 @@ class BaseService:
             except asyncio.CancelledError:
                 pass
 
+        self.executors.shutdown()
+
+    async def run_in_executor(self, pool: str, func, *args):
+        """
+        Run a blocking function on one of the service's thread pools.
+
+        :param pool: The name of the pool, such as `ExecutorRegistry.CPU`.
+        :param func: The function to execute.
+        :param args: The arguments to pass to the function.
+        :return: The result of the function.
+        """
+        return await self.executors.run(pool, func, *args)
+
     async def service_exception_handling(self, service_url, endpoint, method, params=None, data=None, files=None,
-                                         stream=False):
+                                         stream=False, content=None):
         """
         :param service_url: The URL of the service to make the request to.
         :param endpoint: The endpoint of the service to make the request to.
@@ -121,12 +145,13 @@ class BaseService:
         :param data: Optional. The body of the request.
         :param files: Optional. Any files to include in the request.
         :param stream: Optional. Whether to enable streaming of the response.
+        :param content: Optional. The raw bytes to send as the body of a PATCH request.
         :return: The response from the service.
 
         """
         try:
             response = await handle_rest_request(service_url, endpoint, method, params=params, data=data, files=files,
-                                                 stream=stream)
+                                                 stream=stream, content=content)
         except HTTPException:
             raise
         except HTTPStatusError as e:
@@ -1,8 +1,9 @@
 import hashlib
 import os
-from typing import Optional
+import time
+from typing import Dict, List, Optional
 
-from fastapi import UploadFile
+from fastapi import UploadFile, HTTPException
 from fastapi.logger import logger
 from starlette.staticfiles import StaticFiles
 
@@ -33,11 +34,21 @@ class ClientService(ExtendedService):
     Methods
     -------
     .. automethod:: calculate_md5
+    .. automethod:: blob_exists
+    .. automethod:: upload_resumable
+    .. automethod:: get_file_placement
     .. automethod:: is_optimal_service
 
     """
+    FILE_RING_TTL = 30  # seconds
+    UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # 4MB
+    UPLOAD_ATTEMPTS = 5  # failed chunks resumed per upload
+
     def __init__(self):
         super().__init__(ServiceType.CLIENT_SERVICE)
+        self.file_ring = None
+        self.file_replication_factor = 1
+        self.file_ring_fetched = 0.0
         if not os.getenv("DEBUG", "True") == "True":
             self.app.mount("/templates", StaticFiles(directory="templates"), name="static")
 
@@ -58,6 +69,84 @@ class ClientService(ExtendedService):
         await upload_file.seek(0)
         return hash_md5.hexdigest()
 
+    async def blob_exists(self, file_service_url: str, md5: str) -> bool:
+        """
+        Checks whether the file service already stores content with the given MD5 hash.
+
+        :param file_service_url: The URL of the file service.
+        :param md5: The MD5 hash of the content.
+        :return: True if the content is stored, False if it is not or the file service could not tell.
+        """
+        try:
+            await self.service_exception_handling(file_service_url, f"blobs/{md5}", "GET")
+            return True
+        except HTTPException as e:
+            if e.status_code != 404:
+                logger.error(f"Failed to check for stored content {md5}: {e.detail}")
+            return False
+
+    async def upload_resumable(self, file_service_url: str, content: bytes, md5: Optional[str] = None) -> str:
+        """
+        Sends a file to the file service through a resumable upload session, in chunks of `UPLOAD_CHUNK_SIZE` bytes.
+        When a chunk fails, the offset the file service reached is queried and the upload resumes from there, so only
+        the missing bytes are sent again. Up to `UPLOAD_ATTEMPTS` failures are resumed before giving up.
+
+        :param file_service_url: The URL of the file service.
+        :param content: The content of the file.
+        :param md5: The MD5 hash of the content, which the file service checks when the upload is completed.
+
+        :return: The ID of the completed upload session, to pass to the file service's `upload/song/complete`.
+        :rtype: str
+        """
+        params = {"length": len(content)}
+        if md5 is not None:
+            params["md5"] = md5
+        session, _ = await self.service_exception_handling(file_service_url, "uploads", "POST", params=params)
+        upload_id, offset = session["upload_id"], session["offset"]
+
+        view = memoryview(content)
+        failures = 0
+        while offset < len(content):
+            chunk = bytes(view[offset:offset + self.UPLOAD_CHUNK_SIZE])
+            try:
+                response, _ = await self.service_exception_handling(
+                    file_service_url, f"uploads/{upload_id}", "PATCH", params={"offset": offset}, content=chunk)
+                offset = response["offset"]
+            except HTTPException as e:
+                # 409 means the offset moved, such as after a chunk was cut off, the others are worth retrying
+                failures += 1
+                if e.status_code not in (409, 500, 503) or failures >= self.UPLOAD_ATTEMPTS:
+                    raise
+                logger.warning(f"Upload {upload_id} failed at offset {offset}, resuming: {e.detail}")
+                session, _ = await self.service_exception_handling(file_service_url, f"uploads/{upload_id}", "GET")
+                offset = session["offset"]
+        return upload_id
+
+    async def get_file_placement(self, song_ids: List[str]) -> Dict[str, List[str]]:
+        """
+        Finds the file services storing each song, from the file service ring fetched from the main service at most
+        every `FILE_RING_TTL` seconds. If the ring cannot be fetched or is empty, every song is placed on the file
+        service returned by `get_service_url`.
+
+        :param song_ids: The IDs of the songs.
+        :type song_ids: List[str]
+
+        :return: The URLs of the file services storing each song, the primary first, by song ID.
+        :rtype: Dict[str, List[str]]
+        """
+        if self.file_ring is None or time.monotonic() - self.file_ring_fetched > self.FILE_RING_TTL:
+            try:
+                self.file_ring, self.file_replication_factor = await self.fetch_file_ring()
+            except Exception as e:
+                logger.error(f"Failed to fetch the file service ring: {e}")
+            self.file_ring_fetched = time.monotonic()
+
+        if self.file_ring is None or len(self.file_ring) == 0:
+            file_service_url = await self.get_service_url(ServiceType.FILE_SERVICE)
+            return {song_id: [file_service_url] for song_id in song_ids}
+
+        return {song_id: self.file_ring.get_nodes(song_id, self.file_replication_factor) for song_id in song_ids}
+
     async def is_optimal_service(self):
         """
         Checks if the current service instance is optimal.
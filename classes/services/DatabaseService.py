@@ -1,12 +1,70 @@
-from utils import DatabaseAsyncQuery
+from utils import DatabaseAsyncQuery, DatabaseMigrations
+from classes.DatabaseConnectionPool import DatabaseConnectionPool
+from classes.DatabaseWriteQueue import DatabaseWriteQueue
+from classes.ExecutorRegistry import ExecutorRegistry
+from classes.QueryCache import QueryCache
 from classes.enum.ServiceType import ServiceType
 from classes.services.ExtendedService import ExtendedService
 
 
 class DatabaseService(ExtendedService):
+    """
+    :class:`DatabaseService` is a subclass of :class:`ExtendedService`. It represents the database service and owns
+    the pooled SQLite connections, the group-commit write queue and the query result cache used by
+    :mod:`utils.DatabaseAsyncQuery`.
+
+    Methods:
+        - `__init__()`: Initializes the :class:`DatabaseService` object, its connection pool, write queue and query
+          cache.
+        - `start_background_tasks()`: Opens the connection pool, creates and migrates the tables on the database
+          thread pool, starts the writer task and enables the query cache.
+        - `stop()`: Flushes the write queue and closes the connection pool before stopping the service.
+        - `fetch_service_data()`: Adds the write queue and query cache counters to the service data.
+
+    """
+    WRITE_BATCH_SIZE = 128
+    WRITE_COMMIT_LATENCY = 0.005  # seconds
+    QUERY_CACHE_SIZE = 4096
+    QUERY_CACHE_TTL = 60  # seconds
+
     def __init__(self):
         super().__init__(ServiceType.DATABASE_SERVICE)
+        self.connection_pool = DatabaseConnectionPool(DatabaseAsyncQuery.DATABASE_FILE)
+        self.write_queue = DatabaseWriteQueue(self.connection_pool, max_batch_size=self.WRITE_BATCH_SIZE,
+                                              commit_latency=self.WRITE_COMMIT_LATENCY,
+                                              executor=self.executors.get(ExecutorRegistry.DB))
+        self.query_cache = QueryCache(max_entries=self.QUERY_CACHE_SIZE, ttl=self.QUERY_CACHE_TTL)
 
     async def start_background_tasks(self):
         await super().start_background_tasks()
-        await DatabaseAsyncQuery.create_tables()
\ No newline at end of file
+        self.connection_pool.open()
+        DatabaseAsyncQuery.set_connection_pool(self.connection_pool)
+        DatabaseAsyncQuery.set_executor(self.executors.get(ExecutorRegistry.DB))
+        await DatabaseAsyncQuery.create_tables()
+        await DatabaseMigrations.apply_migrations()
+        self.write_queue.start()
+        DatabaseAsyncQuery.set_write_queue(self.write_queue)
+        DatabaseAsyncQuery.set_query_cache(self.query_cache)
+
+    async def stop(self):
+        DatabaseAsyncQuery.set_query_cache(None)
+        self.query_cache.clear()
+        DatabaseAsyncQuery.set_write_queue(None)
+        await self.write_queue.stop()
+        DatabaseAsyncQuery.set_connection_pool(None)
+        DatabaseAsyncQuery.set_executor(None)
+        self.connection_pool.close()
+        await super().stop()
+
+    async def fetch_service_data(self):
+        """
+        Fetches service data, including the write queue counters under "write_queue" and the query cache counters
+        under "query_cache".
+
+        :return: A dictionary containing the service data.
+        :rtype: dict
+        """
+        data = await super().fetch_service_data()
+        data["write_queue"] = self.write_queue.stats()
+        data["query_cache"] = self.query_cache.stats()
+        return data
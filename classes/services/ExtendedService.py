@@ -9,6 +9,8 @@ import psutil
 from fastapi import HTTPException, Request
 from fastapi.logger import logger
 
+from classes.ExecutorRegistry import ExecutorRegistry
+from classes.HashRing import HashRing
 from classes.enum.ServiceType import ServiceType
 from classes.exception.InvalidServiceException import InvalidServiceException
 from classes.services.BaseService import BaseService
@@ -55,8 +57,11 @@ class ExtendedService(BaseService):
     * the URL of the optimal service instance. If a URL is returned, it is immediately returned. If an exception is raised, an error log is generated. The method waits for 5 seconds before
     * retrying.
 
+    ### `fetch_file_ring(self)`
+    Rebuilds the consistent-hash ring placing song IDs on the file services from the ring described by the main service's `file_ring` endpoint, and returns it with the replication factor.
+
     ### `calculate_md5(self, filepath: str)`
-    Calculates the MD5 hash of the file specified by the given filepath. This method opens the file in binary mode using `aiofiles.open`, reads the contents in chunks of 4096 bytes, and
+    Calculates the MD5 hash of the file specified by the given filepath. This method opens the file in binary mode using `aiofiles.open`, reads the contents in chunks of 64KB on the file I/O pool, and
     * repeatedly updates the `hash_md5` object with the read content. The MD5 hash of the file is returned as a hexadecimal string.
 
     ### `get_optimal_service_instance(self, service_type: ServiceType)`
@@ -119,6 +124,7 @@ class ExtendedService(BaseService):
                  - "memory_free": The free memory available in MB.
                  - "total_memory": The total memory of the system in MB.
                  - "cpu_free": The free CPU percentage.
+                 - "executors": The queue depth and wait time counters of each thread pool.
 
         :rtype: dict
         """
@@ -142,7 +148,8 @@ class ExtendedService(BaseService):
             "memory_usage": memory_usage,
             "memory_free": memory_free,
             "total_memory": total_memory,
-            "cpu_free": cpu_free
+            "cpu_free": cpu_free,
+            "executors": self.executors.stats()
         }
 
     async def update_main_service(self):
@@ -190,6 +197,16 @@ class ExtendedService(BaseService):
                 logger.error(f"Failed to update Service URL: {e}")
             await asyncio.sleep(5)
 
+    async def fetch_file_ring(self):
+        """
+        Rebuild the consistent-hash ring placing song IDs on the file services from the main service.
+
+        :return: A tuple of the ring and the number of file services storing each song.
+        :rtype: Tuple[HashRing, int]
+        """
+        ring_data, _ = await self.service_exception_handling(self.main_service_url, "file_ring", "GET")
+        return HashRing(ring_data["nodes"], ring_data["virtual_nodes"]), ring_data["replication_factor"]
+
     async def calculate_md5(self, filepath: str) -> str:
         """
         Calculate the MD5 hash of the file specified by the given filepath.
@@ -199,8 +216,8 @@ class ExtendedService(BaseService):
         """
         try:
             hash_md5 = hashlib.md5()
-            async with aiofiles.open(filepath, "rb") as file:
-                while content := await file.read(4096):
+            async with aiofiles.open(filepath, "rb", executor=self.executors.get(ExecutorRegistry.FILE)) as file:
+                while content := await file.read(65536):
                     hash_md5.update(content)
             return hash_md5.hexdigest()
         except Exception as e:
@@ -1,16 +1,1006 @@
+import asyncio
+import hashlib
 import os
+import re
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Optional
 
+from fastapi import HTTPException, UploadFile
 from fastapi.logger import logger
+from starlette.requests import ClientDisconnect
 from starlette.staticfiles import StaticFiles
 
+from classes.ExecutorRegistry import ExecutorRegistry
+from classes.FileIndex import FileIndex, IndexedFile
+from classes.ImageCache import ImageCache
+from classes.Md5VerificationCache import Md5VerificationCache
+from classes.SongMetadataIndex import SongMetadataIndex
+from classes.UploadSessionStore import UploadSessionStore
 from classes.enum.ServiceType import ServiceType
+from classes.exception.UploadTooLargeException import UploadTooLargeException
 from classes.services.BaseService import BaseService
 from classes.services.ExtendedService import ExtendedService
+from utils.FileLayout import migrate_batch, shard_dir
+from utils.Thumbnails import make_thumbnails, thumbnails_supported
 
 
 class FileService(ExtendedService):
+    UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+    MAX_UPLOAD_SIZE = 512 * 1024 * 1024  # 512MB
+    MD5_INDEX_SAVE_INTERVAL = 30  # seconds
+    FILE_INDEX_SYNC_INTERVAL = 300  # seconds
+    SHARD_DEPTH = 2  # levels of 256 shard directories
+    MIGRATION_BATCH_SIZE = 500  # files moved per batch
+    MIGRATION_PAUSE = 0.5  # seconds between batches
+    REPLICA_REPAIR_INTERVAL = 600  # seconds
+    REPLICA_REPAIR_BATCH_SIZE = 200  # song IDs checked per request
+    REPLICA_UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # 4MB sent per request when copying a file
+    REPLICA_UPLOAD_ATTEMPTS = 5  # failed chunks resumed per copied file
+    UPLOAD_SESSION_TTL = 24 * 60 * 60  # seconds
+    SONG_INDEX_RECONCILE_INTERVAL = 600  # seconds
+    SONG_INDEX_RECONCILE_AGE = 24 * 60 * 60  # seconds a song is trusted after it was last reconciled
+    SONG_INDEX_RECONCILE_BATCH_SIZE = 500  # song IDs checked per request
+    SCRUB_INTERVAL = 6 * 60 * 60  # seconds between scrub passes
+    SCRUB_RATE = 10 * 1024 * 1024  # bytes read per second
+    SCRUB_CONCURRENCY = 2  # files hashed at once
+    SCRUB_BATCH_SIZE = 100  # songs whose expected MD5 is looked up at once
+    SCRUB_FINDINGS_KEPT = 100  # most recent mismatches and read failures reported
+    SCRUB_READ_SIZE = 1024 * 1024  # 1MB read and paced at a time
+    SCRUB_POSITION_KEY = "scrub_position"
+    BUNDLE_MAX_SONGS = 1000  # songs per archive download
+    UPLOAD_SESSION_EXPIRY_INTERVAL = 60 * 60  # seconds
+    IMAGE_CACHE_SIZE = 64 * 1024 * 1024  # 64MB of images held in memory
+    IMAGE_CACHE_MAX_ENTRY_SIZE = 1024 * 1024  # 1MB, larger images are always read from disk
+    IMAGE_CACHE_ADMIT_AFTER = 2  # requests before an image is cached
+    THUMBNAIL_SIZES = (64, 256)  # pixels along the longest side
+    THUMBNAIL_FORMAT = "webp"
+    THUMBNAIL_QUALITY = 80  # encoder quality, from 1 to 100
+    # stored files never change under the same ID, so clients may cache them for a year without revalidating
+    CACHE_CONTROL = "public, max-age=31536000, immutable"
+    # an image sent in place of a thumbnail that could not be generated must be revalidated, so clients pick up the
+    # thumbnail once it exists
+    FALLBACK_CACHE_CONTROL = "no-cache"
+
     def __init__(self):
         super().__init__(ServiceType.FILE_SERVICE)
         self.file_dir = "files"
         self.image_dir = self.file_dir + "/images"
-        self.music_dir = self.file_dir + "/music"
\ No newline at end of file
+        self.music_dir = self.file_dir + "/music"
+        # must be on the same filesystem as the music and image directories, which hardlink into it
+        self.blob_dir = self.file_dir + "/blobs"
+        # serializes linking files to blobs with releasing them, so a blob is never removed as a file is linked to it
+        self._blob_lock = threading.Lock()
+        self.shard_depth = int(os.getenv("FILE_SHARD_DEPTH", self.SHARD_DEPTH))
+        self.max_upload_size = self.MAX_UPLOAD_SIZE
+        # files corrupted on disk are moved here by the scrubber rather than deleted
+        self.quarantine_dir = self.file_dir + "/.quarantine"
+        self.scrub_rate = int(os.getenv("FILE_SCRUB_RATE", self.SCRUB_RATE))
+        self.scrub_concurrency = int(os.getenv("FILE_SCRUB_CONCURRENCY", self.SCRUB_CONCURRENCY))
+        # the scrubber finds corrupted files in the background, so downloads may skip hashing them
+        self.verify_downloads = os.getenv("FILE_VERIFY_DOWNLOADS", "True") == "True"
+        self.scrub_stats = {"passes": 0, "position": None, "files_checked": 0, "bytes_checked": 0, "unverified": 0,
+                            "errors": 0, "mismatches": 0, "findings": [], "failures": []}
+        self._scrub_next_read = 0.0
+        # must be on the same filesystem as the music and image directories, which completed uploads are renamed into
+        self.upload_sessions = UploadSessionStore(os.path.join(self.file_dir, ".uploads"), self.UPLOAD_SESSION_TTL)
+        self.uploads_in_progress = set()
+        self.song_index = SongMetadataIndex(os.path.join(self.file_dir, ".song_index.sqlite3"))
+        self.md5_cache = Md5VerificationCache(os.path.join(self.file_dir, ".md5_index.json"), self.calculate_md5)
+        # scaled down copies of the images, generated with Pillow if it is installed
+        self.thumbnail_dir = self.file_dir + "/thumbnails"
+        self.thumbnail_queue = asyncio.Queue()
+        self._thumbnail_jobs = {}
+        self.thumbnail_stats = {"supported": thumbnails_supported(), "generated": 0, "backfilled": 0, "failed": 0}
+        # cover images are small and shown on every page listing songs, so the popular ones are served from memory
+        self.image_cache = ImageCache(int(os.getenv("FILE_IMAGE_CACHE_SIZE", self.IMAGE_CACHE_SIZE)),
+                                      self.IMAGE_CACHE_MAX_ENTRY_SIZE, self.IMAGE_CACHE_ADMIT_AFTER)
+        self.file_indexes = {}
+        self._file_index_scans = {}
+        self._replica_repair = None
+
+    async def start_background_tasks(self):
+        """
+        Start background tasks, indexing the music and image directories, loading the MD5 index saved by the previous
+        run and saving it periodically, moving files stored flat by earlier versions into shard directories,
+        periodically copying songs to any of their replicas missing them, removing abandoned upload sessions,
+        reconciling the song index with the database service, scrubbing the stored songs for corruption, and
+        generating the thumbnails of uploaded images.
+
+        :return: None
+        """
+        await super().start_background_tasks()
+        for directory in (self.music_dir, self.image_dir):
+            await self.sync_file_index(self.file_index(directory))
+        loaded = await self.run_in_executor(ExecutorRegistry.FILE, self.md5_cache.load)
+        logger.info(f"Loaded {loaded} entries from the MD5 index")
+        self.tasks.append(asyncio.create_task(self.save_md5_index()))
+        self.tasks.append(asyncio.create_task(self.sync_file_indexes()))
+        self.tasks.append(asyncio.create_task(self.migrate_file_layout()))
+        self.tasks.append(asyncio.create_task(self.repair_replicas_periodically()))
+        self.tasks.append(asyncio.create_task(self.expire_upload_sessions()))
+        self.tasks.append(asyncio.create_task(self.reconcile_song_index_periodically()))
+        self.tasks.append(asyncio.create_task(self.scrub_periodically()))
+        self.tasks.append(asyncio.create_task(self.generate_queued_thumbnails()))
+
+    async def stop(self):
+        await self.md5_cache.save(self.executors.get(ExecutorRegistry.FILE))
+        self.song_index.close()
+        await super().stop()
+
+    async def save_md5_index(self):
+        """
+        Save the MD5 index whenever it changed, every `MD5_INDEX_SAVE_INTERVAL` seconds.
+
+        :return: None
+        """
+        while True:
+            await asyncio.sleep(self.MD5_INDEX_SAVE_INTERVAL)
+            await self.md5_cache.save(self.executors.get(ExecutorRegistry.FILE))
+
+    def file_index(self, directory: str) -> FileIndex:
+        """
+        Retrieve the index of a directory, creating an empty one if necessary.
+
+        :param directory: The directory.
+        :return: The directory's index.
+        """
+        index = self.file_indexes.get(directory)
+        if index is None:
+            index = self.file_indexes[directory] = FileIndex(directory, self.shard_depth)
+        return index
+
+    async def sync_file_index(self, index: FileIndex):
+        """
+        Rebuild an index from its directory on the file I/O pool. Concurrent calls for the same index share one scan.
+
+        :param index: The index to rebuild.
+        :return: None
+        """
+        scan = self._file_index_scans.get(index.directory)
+        if scan is None:
+            scan = asyncio.ensure_future(self.run_in_executor(ExecutorRegistry.FILE, index.scan))
+            self._file_index_scans[index.directory] = scan
+            try:
+                index.replace(*await scan)
+            finally:
+                self._file_index_scans.pop(index.directory, None)
+        else:
+            await scan
+
+    async def sync_file_indexes(self):
+        """
+        Rebuild every index from its directory every `FILE_INDEX_SYNC_INTERVAL` seconds, picking up files changed
+        outside the service.
+
+        :return: None
+        """
+        while True:
+            await asyncio.sleep(self.FILE_INDEX_SYNC_INTERVAL)
+            for index in list(self.file_indexes.values()):
+                try:
+                    await self.sync_file_index(index)
+                except Exception as e:
+                    logger.error(f"An error occurred while indexing {index.directory}: {str(e)}")
+
+    def shard_dir(self, directory: str, file_id: str) -> str:
+        """
+        :param directory: The top directory of the store.
+        :param file_id: The ID of the file.
+        :return: The shard directory new files with this ID are stored in.
+        """
+        return shard_dir(directory, file_id, self.shard_depth)
+
+    async def find_file(self, directory: str, file_id: str) -> Optional[IndexedFile]:
+        """
+        Find the file with the given ID in a directory without listing it. If the file is not indexed, only its shard
+        directory is listed, then the flat files of the directory if they changed since it was last indexed, so files
+        not migrated to shard directories yet are still found.
+
+        :param directory: The directory to search.
+        :param file_id: The ID of the file, its name without the extension.
+        :return: The indexed file, or None if there is no file with that ID.
+        """
+        index = self.file_index(directory)
+        entry = index.get(file_id)
+        if entry is None:
+            path = await self.run_in_executor(ExecutorRegistry.FILE, index.find_in_shard, file_id)
+            if path is not None:
+                index.add(file_id, path)
+                entry = index.get(file_id)
+        if entry is None and index.needs_scan():
+            await self.sync_file_index(index)
+            entry = index.get(file_id)
+        return entry
+
+    async def migrate_file_layout(self):
+        """
+        Move the files stored flat in the music, image and blob directories into their shard directories, in batches
+        of `MIGRATION_BATCH_SIZE` every `MIGRATION_PAUSE` seconds, while files keep being served from either path.
+
+        :return: None
+        """
+        for directory in (self.music_dir, self.image_dir, self.blob_dir):
+            total = 0
+            while True:
+                try:
+                    moved = await self.run_in_executor(ExecutorRegistry.FILE, migrate_batch, directory,
+                                                       self.shard_depth, self.MIGRATION_BATCH_SIZE)
+                except Exception as e:
+                    logger.error(f"An error occurred while migrating {directory} to shard directories: {str(e)}")
+                    break
+                if not moved:
+                    break
+                index = self.file_indexes.get(directory)
+                for file_id, old_path, new_path in moved:
+                    self.md5_cache.move(old_path, new_path)
+                    if index is not None:
+                        index.remove(file_id)
+                total += len(moved)
+                await asyncio.sleep(self.MIGRATION_PAUSE)
+            if total:
+                logger.info(f"Moved {total} files of {directory} into shard directories")
+
+    def start_replica_repair(self) -> bool:
+        """
+        Start copying the songs stored here to their replicas in the background, unless a repair is already running.
+
+        :return: True if a repair was started.
+        """
+        if self._replica_repair is not None and not self._replica_repair.done():
+            return False
+        self._replica_repair = asyncio.create_task(self.repair_replicas())
+        return True
+
+    async def repair_replicas_periodically(self):
+        """
+        Repair the replicas of the songs stored here every `REPLICA_REPAIR_INTERVAL` seconds, catching up on any
+        copy that failed or any file service that left without the main service noticing.
+
+        :return: None
+        """
+        while True:
+            await asyncio.sleep(self.REPLICA_REPAIR_INTERVAL)
+            if self.start_replica_repair():
+                await self._replica_repair
+
+    async def repair_replicas(self) -> int:
+        """
+        Copy every song stored here to the file services the ring places it on that are missing it, such as the
+        replacement of a file service that left. Each file service is asked which songs it is missing in batches of
+        `REPLICA_REPAIR_BATCH_SIZE`, and content it already stores is linked rather than sent again.
+
+        :return: The number of songs copied.
+        """
+        try:
+            ring, replication_factor = await self.fetch_file_ring()
+        except Exception as e:
+            logger.error(f"Failed to fetch the file service ring: {e}")
+            return 0
+
+        # a full pass, so make sure it sees every song on disk
+        music_index = self.file_index(self.music_dir)
+        await self.sync_file_index(music_index)
+
+        songs_by_node = defaultdict(list)
+        for song_id in music_index.ids():
+            for node in ring.get_nodes(song_id, replication_factor):
+                if node != self.service_url:
+                    songs_by_node[node].append(song_id)
+
+        copied = 0
+        for node, song_ids in songs_by_node.items():
+            for start in range(0, len(song_ids), self.REPLICA_REPAIR_BATCH_SIZE):
+                batch = song_ids[start:start + self.REPLICA_REPAIR_BATCH_SIZE]
+                try:
+                    response, _ = await self.service_exception_handling(node, "replication/missing", "POST",
+                                                                        data={"song_ids": batch})
+                except Exception as e:
+                    logger.error(f"Failed to check the replicas stored by {node}: {e}")
+                    break
+                for song_id in response["missing"]:
+                    try:
+                        if await self.copy_song(node, song_id):
+                            copied += 1
+                    except Exception as e:
+                        logger.error(f"Failed to copy song {song_id} to {node}: {e}")
+
+        if copied:
+            logger.info(f"Copied {copied} songs to their replicas")
+        return copied
+
+    async def copy_song(self, node: str, song_id: str) -> bool:
+        """
+        Copy a song and its image to another file service through resumable uploads, completed with its
+        `upload/song/complete` endpoint, linking the song's content instead if that service already stores it.
+
+        :param node: The URL of the file service to copy the song to.
+        :param song_id: The ID of the song.
+        :return: True if the song was copied, False if it is not stored here.
+        """
+        mp3 = await self.find_file(self.music_dir, song_id)
+        image = await self.find_file(self.image_dir, song_id)
+        if mp3 is None or image is None:
+            return False
+
+        md5 = await self.md5_cache.get_md5(mp3.path)
+        image_md5 = await self.md5_cache.get_md5(image.path)
+        params = {"song_id": song_id, "mp3_extension": mp3.extension, "image_extension": image.extension,
+                  "image_upload_id": await self.upload_file(node, image.path, image.size, image_md5)}
+        try:
+            await self.service_exception_handling(node, f"blobs/{md5}", "GET")
+            params["mp3_md5"] = md5
+        except HTTPException as e:
+            if e.status_code != 404:
+                raise
+            params["mp3_upload_id"] = await self.upload_file(node, mp3.path, mp3.size, md5)
+        await self.service_exception_handling(node, "upload/song/complete", "POST", params=params)
+        return True
+
+    async def upload_file(self, node: str, path: str, size: int, md5: str) -> str:
+        """
+        Send a stored file to another file service through a resumable upload session, reading it in
+        `REPLICA_UPLOAD_CHUNK_SIZE` chunks on the file I/O pool. When a chunk fails, the offset the other service
+        reached is queried and the upload resumes from there, so only the missing bytes are sent again. Up to
+        `REPLICA_UPLOAD_ATTEMPTS` failures are resumed before giving up.
+
+        :param node: The URL of the file service.
+        :param path: The path to the file.
+        :param size: The size of the file in bytes.
+        :param md5: The MD5 hash of the file, which the other service checks when the upload is completed.
+        :return: The ID of the completed upload session.
+        :raises HTTPException: If the upload cannot be started or fails too often.
+        """
+        session, _ = await self.service_exception_handling(node, "uploads", "POST",
+                                                           params={"length": size, "md5": md5})
+        upload_id, offset = session["upload_id"], session["offset"]
+
+        fd = await self.run_in_executor(ExecutorRegistry.FILE, os.open, path, os.O_RDONLY)
+        try:
+            failures = 0
+            while offset < size:
+                chunk = await self.run_in_executor(ExecutorRegistry.FILE, os.pread, fd,
+                                                   min(self.REPLICA_UPLOAD_CHUNK_SIZE, size - offset), offset)
+                try:
+                    response, _ = await self.service_exception_handling(
+                        node, f"uploads/{upload_id}", "PATCH", params={"offset": offset}, content=chunk)
+                    offset = response["offset"]
+                except HTTPException as e:
+                    # 409 means the offset moved, such as after a chunk was cut off, the others are worth retrying
+                    failures += 1
+                    if e.status_code not in (409, 500, 503) or failures >= self.REPLICA_UPLOAD_ATTEMPTS:
+                        raise
+                    logger.warning(f"Copy of {path} failed at offset {offset}, resuming: {e.detail}")
+                    session, _ = await self.service_exception_handling(node, f"uploads/{upload_id}", "GET")
+                    offset = session["offset"]
+        finally:
+            os.close(fd)
+        return upload_id
+
+    async def reconcile_song_index_periodically(self):
+        """
+        Reconcile the song index with the database service every `SONG_INDEX_RECONCILE_INTERVAL` seconds.
+
+        :return: None
+        """
+        while True:
+            await asyncio.sleep(self.SONG_INDEX_RECONCILE_INTERVAL)
+            try:
+                await self.reconcile_song_index()
+            except Exception as e:
+                logger.error(f"An error occurred while reconciling the song index: {str(e)}")
+
+    async def reconcile_song_index(self) -> int:
+        """
+        Check the MD5 hash of every indexed song not reconciled in the last `SONG_INDEX_RECONCILE_AGE` seconds
+        against the database service, in batches of `SONG_INDEX_RECONCILE_BATCH_SIZE`, songs never reconciled first.
+
+        :return: The number of songs checked.
+        """
+        before = time.time() - self.SONG_INDEX_RECONCILE_AGE
+        checked = 0
+        while song_ids := await self.run_in_executor(ExecutorRegistry.FILE, self.song_index.stale, before,
+                                                     self.SONG_INDEX_RECONCILE_BATCH_SIZE):
+            db_service = await self.get_service_url(ServiceType.DATABASE_SERVICE)
+            response, _ = await self.service_exception_handling(db_service, "songs/md5", "POST",
+                                                                data={"song_ids": song_ids})
+            corrected, removed = await self.run_in_executor(ExecutorRegistry.FILE, self.song_index.reconcile,
+                                                            song_ids, response["songs"])
+            if corrected or removed:
+                logger.warning(f"Song index reconciliation corrected {corrected} and removed {removed} songs")
+            checked += len(song_ids)
+        return checked
+
+    async def scrub_periodically(self):
+        """
+        Scrub the stored songs every `SCRUB_INTERVAL` seconds, starting one interval after the service starts so a
+        restart does not read the whole store at boot. A pass interrupted by a restart resumes from the position
+        saved in the song index.
+
+        :return: None
+        """
+        try:
+            self.scrub_stats["position"] = await self.run_in_executor(ExecutorRegistry.FILE, self.song_index.get_state,
+                                                                      self.SCRUB_POSITION_KEY)
+        except Exception as e:
+            logger.error(f"Failed to load the scrub position: {str(e)}")
+        while True:
+            await asyncio.sleep(self.SCRUB_INTERVAL)
+            try:
+                await self.scrub()
+            except Exception as e:
+                logger.error(f"An error occurred while scrubbing stored songs: {str(e)}")
+
+    async def save_scrub_position(self, position: Optional[str]):
+        """
+        Record the last song scrubbed in the song index, so a restart resumes the pass from there.
+
+        :param position: The ID of the last song scrubbed, or None once a pass is complete.
+        :return: None
+        """
+        self.scrub_stats["position"] = position
+        try:
+            await self.run_in_executor(ExecutorRegistry.FILE, self.song_index.set_state, self.SCRUB_POSITION_KEY,
+                                       position)
+        except Exception as e:
+            logger.error(f"Failed to save the scrub position: {str(e)}")
+
+    async def scrub(self) -> int:
+        """
+        Read back every stored song and check it against its expected MD5 hash, quarantining the songs that do not
+        match. Songs are walked in order of ID from the position the last pass stopped at, which is saved after
+        every batch, so an interrupted pass resumes where it left off. Reads are limited to `scrub_rate` bytes per
+        second over `scrub_concurrency` files at once, paced chunk by chunk, leaving the disk to downloads.
+
+        :return: The number of songs quarantined.
+        """
+        music_index = self.file_index(self.music_dir)
+        await self.sync_file_index(music_index)
+        position = self.scrub_stats["position"]
+        song_ids = sorted(song_id for song_id in music_index.ids() if position is None or song_id > position)
+
+        semaphore = asyncio.Semaphore(self.scrub_concurrency)
+        quarantined = 0
+        for start in range(0, len(song_ids), self.SCRUB_BATCH_SIZE):
+            batch = song_ids[start:start + self.SCRUB_BATCH_SIZE]
+            expected_md5s = await self.expected_md5s(batch)
+            results = await asyncio.gather(*(self.scrub_song(song_id, expected_md5s.get(song_id), semaphore)
+                                             for song_id in batch))
+            quarantined += sum(results)
+            await self.save_scrub_position(batch[-1])
+
+        await self.save_scrub_position(None)
+        self.scrub_stats["passes"] += 1
+        return quarantined
+
+    async def expected_md5s(self, song_ids):
+        """
+        Look up the MD5 hash each song should have, from the song index, or from the database service for the songs
+        not indexed yet, which are then indexed.
+
+        :param song_ids: The IDs of the songs.
+        :return: The expected MD5 hash of each song, by song ID. Songs whose hash is unknown are left out.
+        """
+        def lookup():
+            return {song_id: self.song_index.get(song_id) for song_id in song_ids}
+
+        expected = {song_id: metadata[0] for song_id, metadata in
+                    (await self.run_in_executor(ExecutorRegistry.FILE, lookup)).items() if metadata is not None}
+        missing = [song_id for song_id in song_ids if song_id not in expected]
+        if missing:
+            try:
+                db_service = await self.get_service_url(ServiceType.DATABASE_SERVICE)
+                response, _ = await self.service_exception_handling(db_service, "songs/md5", "POST",
+                                                                    data={"song_ids": missing})
+            except Exception as e:
+                logger.error(f"Failed to fetch the MD5 hashes of {len(missing)} songs to scrub: {e}")
+                return expected
+            for song_id, md5 in response["songs"].items():
+                song_file = await self.find_file(self.music_dir, song_id)
+                if song_file is not None:
+                    await self.run_in_executor(ExecutorRegistry.FILE, self.song_index.put, song_id, md5,
+                                               song_file.size, time.time())
+                expected[song_id] = md5
+        return expected
+
+    async def scrub_md5(self, path: str, size: int) -> str:
+        """
+        Hash a file from disk in `SCRUB_READ_SIZE` chunks on the file I/O pool, pacing every chunk with `pace_scrub`
+        so even a large file is read at no more than `scrub_rate` bytes per second.
+
+        :param path: The path to the file.
+        :param size: The size of the file in bytes, used to reserve the budget of its last chunk.
+        :return: The MD5 hash of the file.
+        :raises OSError: If the file cannot be read.
+        """
+        def read_and_hash(fd, offset):
+            chunk = os.pread(fd, self.SCRUB_READ_SIZE, offset)
+            hash_md5.update(chunk)
+            return len(chunk)
+
+        hash_md5 = hashlib.md5()
+        fd = await self.run_in_executor(ExecutorRegistry.FILE, os.open, path, os.O_RDONLY)
+        try:
+            offset = 0
+            while True:
+                await self.pace_scrub(min(self.SCRUB_READ_SIZE, max(size - offset, 0)))
+                read = await self.run_in_executor(ExecutorRegistry.FILE, read_and_hash, fd, offset)
+                if not read:
+                    return hash_md5.hexdigest()
+                offset += read
+        finally:
+            os.close(fd)
+
+    async def pace_scrub(self, size: int):
+        """
+        Wait until reading `size` more bytes keeps the scrubber under `scrub_rate` bytes per second. Each read reserves
+        its share of the budget in turn, so the limit holds however many files are hashed at once.
+
+        :param size: The number of bytes about to be read.
+        :return: None
+        """
+        now = time.monotonic()
+        start = max(now, self._scrub_next_read)
+        self._scrub_next_read = start + size / self.scrub_rate
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def scrub_song(self, song_id: str, expected_md5: Optional[str], semaphore: asyncio.Semaphore) -> bool:
+        """
+        Hash a stored song from disk, bypassing the MD5 cache, and quarantine it if it does not match its expected
+        MD5 hash.
+
+        :param song_id: The ID of the song.
+        :param expected_md5: The MD5 hash the song should have, or None if it is unknown.
+        :param semaphore: The semaphore limiting the number of files hashed at once.
+        :return: True if the song was quarantined.
+        """
+        async with semaphore:
+            song_file = await self.find_file(self.music_dir, song_id)
+            if song_file is None:
+                return False
+            try:
+                md5 = await self.scrub_md5(song_file.path, song_file.size)
+            except FileNotFoundError:
+                # deleted since it was listed
+                return False
+            except Exception as e:
+                logger.error(f"Failed to scrub song {song_id} at {song_file.path}: {str(e)}")
+                self.scrub_stats["errors"] += 1
+                failures = self.scrub_stats["failures"]
+                failures.append({"song_id": song_id, "path": song_file.path, "error": str(e), "time": time.time()})
+                del failures[:-self.SCRUB_FINDINGS_KEPT]
+                return False
+
+        self.scrub_stats["files_checked"] += 1
+        self.scrub_stats["bytes_checked"] += song_file.size
+        if expected_md5 is None:
+            self.scrub_stats["unverified"] += 1
+            return False
+        if md5 == expected_md5:
+            return False
+
+        self.scrub_stats["mismatches"] += 1
+        try:
+            quarantine_path = await self.run_in_executor(ExecutorRegistry.FILE, self.quarantine_sync, song_file.path,
+                                                         expected_md5)
+        except Exception as e:
+            logger.error(f"Failed to quarantine corrupted song {song_id}: {str(e)}")
+            self.scrub_stats["errors"] += 1
+            return False
+        self.file_index(self.music_dir).remove(song_id)
+        self.md5_cache.forget(song_file.path)
+        findings = self.scrub_stats["findings"]
+        findings.append({"song_id": song_id, "expected": expected_md5, "actual": md5, "path": quarantine_path,
+                         "time": time.time()})
+        del findings[:-self.SCRUB_FINDINGS_KEPT]
+        logger.error(f"Song {song_id} does not match its MD5 hash, moved it to {quarantine_path}")
+        # the song is now missing here, so its other replicas copy it back
+        return True
+
+    def quarantine_sync(self, path: str, expected_md5: str) -> str:
+        """
+        Move a corrupted file into the quarantine directory. If the file is the blob stored for its expected content,
+        the blob is dropped as well, so new uploads of that content are not linked to the corrupted copy.
+
+        :param path: The path of the file.
+        :param expected_md5: The MD5 hash the file should have.
+        :return: The path the file was moved to.
+        """
+        os.makedirs(self.quarantine_dir, exist_ok=True)
+        with self._blob_lock:
+            blob_path = self.find_blob_sync(expected_md5)
+            if blob_path is not None and os.path.samefile(blob_path, path):
+                os.remove(blob_path)
+        quarantine_path = os.path.join(self.quarantine_dir, f"{int(time.time())}-{os.path.basename(path)}")
+        os.rename(path, quarantine_path)
+        return quarantine_path
+
+    def thumbnail_path(self, image_id: str, size: int) -> str:
+        """
+        :param image_id: The ID of the image.
+        :param size: The size in pixels of the longest side of the thumbnail.
+        :return: The path the thumbnail is stored at.
+        """
+        return os.path.join(self.shard_dir(self.thumbnail_dir, image_id),
+                            f"{image_id}-{size}.{self.THUMBNAIL_FORMAT}")
+
+    def queue_thumbnails(self, image_id: str):
+        """
+        Queue an image for its thumbnails to be generated in the background.
+
+        :param image_id: The ID of the image.
+        :return: None
+        """
+        if self.thumbnail_stats["supported"]:
+            self.thumbnail_queue.put_nowait(image_id)
+
+    async def generate_queued_thumbnails(self):
+        """
+        Generate the thumbnails of the queued images one at a time, so uploads do not wait for them.
+
+        :return: None
+        """
+        while True:
+            image_id = await self.thumbnail_queue.get()
+            try:
+                await self.generate_thumbnails(image_id)
+            except Exception as e:
+                logger.error(f"An error occurred while generating the thumbnails of {image_id}: {str(e)}")
+            finally:
+                self.thumbnail_queue.task_done()
+
+    async def generate_thumbnails(self, image_id: str) -> bool:
+        """
+        Generate every thumbnail of an image on the CPU pool. Concurrent calls for the same image share one job.
+
+        :param image_id: The ID of the image.
+        :return: True if the thumbnails were generated, False if Pillow is not installed, the image is not stored or
+                 it cannot be decoded.
+        """
+        if not self.thumbnail_stats["supported"]:
+            return False
+        job = self._thumbnail_jobs.get(image_id)
+        if job is None:
+            job = self._thumbnail_jobs[image_id] = asyncio.ensure_future(self._generate_thumbnails(image_id))
+            job.add_done_callback(lambda _: self._thumbnail_jobs.pop(image_id, None))
+        return await asyncio.shield(job)
+
+    async def _generate_thumbnails(self, image_id: str) -> bool:
+        """
+        :param image_id: The ID of the image.
+        :return: True if the thumbnails were generated.
+        """
+        image = await self.find_file(self.image_dir, image_id)
+        if image is None:
+            return False
+        targets = [(size, self.thumbnail_path(image_id, size)) for size in self.THUMBNAIL_SIZES]
+        try:
+            await self.run_in_executor(ExecutorRegistry.CPU, make_thumbnails, image.path, targets,
+                                       self.THUMBNAIL_FORMAT, self.THUMBNAIL_QUALITY)
+        except Exception as e:
+            self.thumbnail_stats["failed"] += 1
+            logger.error(f"Failed to generate the thumbnails of {image.path}: {str(e)}")
+            return False
+        self.thumbnail_stats["generated"] += 1
+        return True
+
+    async def find_thumbnail(self, image_id: str, size: int) -> Optional[IndexedFile]:
+        """
+        Find a thumbnail of an image, generating the image's thumbnails first if they do not exist yet, which
+        backfills the images stored before thumbnails were generated on upload.
+
+        :param image_id: The ID of the image.
+        :param size: The size in pixels of the longest side of the thumbnail, one of `THUMBNAIL_SIZES`.
+        :return: The thumbnail, or None if it cannot be generated.
+        """
+        path = self.thumbnail_path(image_id, size)
+        for attempt in range(2):
+            try:
+                stat_result = await self.run_in_executor(ExecutorRegistry.FILE, os.stat, path)
+                return IndexedFile(path, self.THUMBNAIL_FORMAT, stat_result.st_size, stat_result.st_mtime)
+            except FileNotFoundError:
+                if attempt or not await self.generate_thumbnails(image_id):
+                    return None
+                self.thumbnail_stats["backfilled"] += 1
+
+    async def remove_thumbnails(self, image_id: str):
+        """
+        Remove the thumbnails of an image, if any, and their MD5 cache entries. A job generating them is waited for
+        first, so it cannot write thumbnails of the old image back afterwards.
+
+        :param image_id: The ID of the image.
+        :return: None
+        """
+        job = self._thumbnail_jobs.get(image_id)
+        if job is not None:
+            await asyncio.wait([job])
+
+        def remove(path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        for size in self.THUMBNAIL_SIZES:
+            path = self.thumbnail_path(image_id, size)
+            await self.run_in_executor(ExecutorRegistry.FILE, remove, path)
+            self.md5_cache.forget(path)
+
+    async def fetch_service_data(self):
+        """
+        Fetches service data, including the MD5 cache counters under "md5_cache", the counters of each directory
+        index under "file_index", the counters of the song index under "song_index", the progress, findings and read
+        failures of the scrubber under "scrubber", the counters of the image cache under "image_cache" and those of
+        the thumbnail generator under "thumbnails".
+
+        :return: A dictionary containing the service data.
+        :rtype: dict
+        """
+        data = await super().fetch_service_data()
+        data["md5_cache"] = self.md5_cache.stats()
+        data["file_index"] = {directory: index.stats() for directory, index in self.file_indexes.items()}
+        data["song_index"] = await self.run_in_executor(ExecutorRegistry.FILE, self.song_index.stats)
+        data["scrubber"] = dict(self.scrub_stats, findings=list(self.scrub_stats["findings"]),
+                                failures=list(self.scrub_stats["failures"]))
+        data["image_cache"] = self.image_cache.stats()
+        data["thumbnails"] = dict(self.thumbnail_stats, queued=self.thumbnail_queue.qsize())
+        return data
+
+    def store_upload_sync(self, source, directory: str, file_name: str):
+        """
+        Copy an uploaded file into a directory in fixed-size chunks, computing its MD5 hash on the way.
+
+        The file is written to a temporary file in the target directory and moved into place through the blob store
+        once complete, so readers never see a partially written file and a failed upload leaves nothing behind.
+
+        :param source: The binary file object to read the upload from.
+        :param directory: The directory to store the file in.
+        :param file_name: The name to store the file under.
+        :return: A tuple of the MD5 hash of the file and its size in bytes.
+        :raises UploadTooLargeException: If the file is larger than `max_upload_size`.
+        """
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=".part")
+        hash_md5 = hashlib.md5()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as target:
+                while chunk := source.read(self.UPLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > self.max_upload_size:
+                        raise UploadTooLargeException(
+                            f"{file_name} exceeds the maximum upload size of {self.max_upload_size} bytes")
+                    hash_md5.update(chunk)
+                    target.write(chunk)
+                target.flush()
+                os.fsync(target.fileno())
+            self.store_blob_sync(temp_path, hash_md5.hexdigest(), os.path.join(directory, file_name))
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError as e:
+                logger.error(f"An error occurred while removing partial upload {temp_path}: {str(e)}")
+            raise
+
+        return hash_md5.hexdigest(), size
+
+    async def store_upload(self, upload_file: UploadFile, directory: str, file_name: str):
+        """
+        Stream an uploaded file into a directory on the file I/O pool, without holding it in memory.
+
+        :param upload_file: The uploaded file.
+        :param directory: The directory to store the file in.
+        :param file_name: The name to store the file under.
+        :return: A tuple of the MD5 hash of the file and its size in bytes.
+        :raises UploadTooLargeException: If the file is larger than `max_upload_size`.
+        """
+        return await self.run_in_executor(ExecutorRegistry.FILE, self.store_upload_sync, upload_file.file, directory,
+                                          file_name)
+
+    async def expire_upload_sessions(self):
+        """
+        Remove the upload sessions abandoned for longer than `UPLOAD_SESSION_TTL` seconds, every
+        `UPLOAD_SESSION_EXPIRY_INTERVAL` seconds.
+
+        :return: None
+        """
+        while True:
+            try:
+                removed = await self.run_in_executor(ExecutorRegistry.FILE, self.upload_sessions.expire)
+                if removed:
+                    logger.info(f"Removed {removed} expired upload sessions")
+            except Exception as e:
+                logger.error(f"An error occurred while removing expired upload sessions: {str(e)}")
+            await asyncio.sleep(self.UPLOAD_SESSION_EXPIRY_INTERVAL)
+
+    async def append_upload(self, upload_id: str, offset: int, stream) -> int:
+        """
+        Append a request body to an upload session as it arrives, writing it in `UPLOAD_CHUNK_SIZE` pieces on the
+        file I/O pool. If the client disconnects, the part received so far is kept and the upload resumes from there.
+
+        :param upload_id: The ID of the session.
+        :param offset: The offset the body starts at, which must be the session's current offset.
+        :param stream: The asynchronous iterator of the body's chunks.
+        :return: The new offset of the session.
+        :raises FileNotFoundError: If there is no such session.
+        :raises ValueError: If the offset is not the current offset, or the body runs past the upload's length.
+        """
+        buffer = bytearray()
+        try:
+            async for chunk in stream:
+                buffer += chunk
+                if len(buffer) >= self.UPLOAD_CHUNK_SIZE:
+                    offset = await self.run_in_executor(ExecutorRegistry.FILE, self.upload_sessions.append,
+                                                        upload_id, offset, bytes(buffer))
+                    buffer.clear()
+        except ClientDisconnect:
+            logger.info(f"Client disconnected from upload {upload_id} at offset {offset + len(buffer)}")
+        return await self.run_in_executor(ExecutorRegistry.FILE, self.upload_sessions.append, upload_id, offset,
+                                          bytes(buffer), True)
+
+    async def finish_upload(self, upload_id: str):
+        """
+        Check that an upload session is complete and matches its expected MD5 hash, reading it on the file I/O pool.
+
+        :param upload_id: The ID of the session.
+        :return: A tuple of the path of the uploaded file, its MD5 hash and its size in bytes.
+        :raises FileNotFoundError: If there is no such session.
+        :raises ValueError: If the upload is incomplete or does not match its expected MD5 hash.
+        """
+        return await self.run_in_executor(ExecutorRegistry.FILE, self.upload_sessions.finish, upload_id)
+
+    async def store_finished_upload(self, upload_id: str, finished, directory: str, file_name: str):
+        """
+        Move a finished upload into a directory through the blob store and end its session.
+
+        :param upload_id: The ID of the session.
+        :param finished: The tuple returned by `finish_upload` for the session.
+        :param directory: The directory to store the file in.
+        :param file_name: The name to store the file under.
+        :return: A tuple of the MD5 hash of the file and its size in bytes.
+        """
+        def store():
+            os.makedirs(directory, exist_ok=True)
+            self.store_blob_sync(path, md5, os.path.join(directory, file_name))
+            self.upload_sessions.discard(upload_id)
+
+        path, md5, size = finished
+        await self.run_in_executor(ExecutorRegistry.FILE, store)
+        return md5, size
+
+    @staticmethod
+    def is_md5(value: str) -> bool:
+        """
+        :param value: The value to check.
+        :return: True if the value is a lowercase hexadecimal MD5 hash, and so safe to use as a blob name.
+        """
+        return value is not None and re.fullmatch(r"[0-9a-f]{32}", value) is not None
+
+    def blob_path(self, md5: str) -> str:
+        """
+        :param md5: The MD5 hash of the content.
+        :return: The path new blobs storing the content are written to, in the blob directory's shard directories.
+        """
+        return os.path.join(self.shard_dir(self.blob_dir, md5), md5)
+
+    def find_blob_sync(self, md5: str) -> Optional[str]:
+        """
+        :param md5: The MD5 hash of the content.
+        :return: The path of the blob storing the content, in its shard directory or flat if it was not migrated yet,
+                 or None if the content is not stored.
+        """
+        for path in (self.blob_path(md5), os.path.join(self.blob_dir, md5)):
+            if os.path.exists(path):
+                return path
+        return None
+
+    @staticmethod
+    def replace_with_link_sync(source: str, target: str):
+        """
+        Atomically replace a file with a hardlink to another file.
+
+        :param source: The file to link to.
+        :param target: The path to replace.
+        :return: None
+        :raises FileNotFoundError: If the source does not exist.
+        """
+        link_path = os.path.join(os.path.dirname(target), f".link-{os.urandom(6).hex()}")
+        os.link(source, link_path)
+        try:
+            os.replace(link_path, target)
+        except BaseException:
+            os.remove(link_path)
+            raise
+
+    def store_blob_sync(self, temp_path: str, md5: str, target: str) -> bool:
+        """
+        Move a fully written file into place, storing its content once in the blob store.
+
+        The file becomes the blob for its content if there is none yet, and is hardlinked to the target. If the
+        content is already stored, the target is linked to the existing blob and the new copy discarded. Each blob's
+        link count is one more than the number of files using it, so blobs are reference counted by the filesystem.
+        If the filesystem cannot hardlink, the file is stored without deduplication. Blobs are linked under the blob
+        lock, so they cannot be released meanwhile.
+
+        :param temp_path: The path of the written file, in the target's directory.
+        :param md5: The MD5 hash of the file.
+        :param target: The path to store the file under.
+        :return: True if the content was already stored and the file was deduplicated.
+        """
+        blob_path = self.blob_path(md5)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        with self._blob_lock:
+            for _ in range(2):
+                existing_blob = self.find_blob_sync(md5)
+                if existing_blob is not None:
+                    try:
+                        self.replace_with_link_sync(existing_blob, target)
+                    except FileNotFoundError:
+                        # the blob was migrated since, look again
+                        continue
+                    os.remove(temp_path)
+                    return True
+                try:
+                    os.link(temp_path, blob_path)
+                    break
+                except FileExistsError:
+                    continue
+                except OSError as e:
+                    logger.warning(f"Storing {target} without deduplication: {str(e)}")
+                    break
+        os.replace(temp_path, target)
+        return False
+
+    async def link_blob(self, md5: str, directory: str, file_name: str) -> int:
+        """
+        Store a file whose content is already in the blob store, without transferring it again.
+
+        :param md5: The MD5 hash of the content.
+        :param directory: The directory to store the file in.
+        :param file_name: The name to store the file under.
+        :return: The size of the file in bytes.
+        :raises FileNotFoundError: If no blob stores the content.
+        """
+        def link():
+            os.makedirs(directory, exist_ok=True)
+            with self._blob_lock:
+                blob_path = self.find_blob_sync(md5)
+                if blob_path is None:
+                    raise FileNotFoundError(f"No blob stores {md5}")
+                self.replace_with_link_sync(blob_path, target)
+
+        target = os.path.join(directory, file_name)
+        await self.run_in_executor(ExecutorRegistry.FILE, link)
+        return os.stat(target).st_size
+
+    def release_blob_sync(self, md5: str) -> bool:
+        """
+        Remove a blob if no file uses it anymore. The link count is checked and the blob removed under the blob lock,
+        so no file can be linked to it in between.
+
+        :param md5: The MD5 hash of the content.
+        :return: True if the blob was removed.
+        """
+        with self._blob_lock:
+            blob_path = self.find_blob_sync(md5)
+            if blob_path is None:
+                return False
+            try:
+                if os.stat(blob_path).st_nlink > 1:
+                    return False
+                os.remove(blob_path)
+            except FileNotFoundError:
+                return False
+        return True
+
+    async def release_blob(self, md5: str) -> bool:
+        """
+        Remove a blob on the file I/O pool if no file uses it anymore.
+
+        :param md5: The MD5 hash of the content.
+        :return: True if the blob was removed.
+        """
+        return await self.run_in_executor(ExecutorRegistry.FILE, self.release_blob_sync, md5)
@@ -1,4 +1,5 @@
 import asyncio
+import os
 import secrets
 import time
 from datetime import datetime
@@ -9,6 +10,7 @@ from fastapi import HTTPException, Request
 from fastapi.logger import logger
 from httpx import HTTPStatusError
 
+from classes.HashRing import HashRing
 from classes.ServiceInfo import ServiceInfo
 from classes.enum.ServiceType import ServiceType
 from classes.exception.FailedServiceCreationException import FailedServiceCreationException
@@ -30,6 +32,7 @@ class MainService(BaseService):
     -----------
     - `services` (Dict[str, ServiceInfo]): A dictionary that stores the services associated with the MainService instance.
     - `secret_key` (str): A secret key generated using the `secrets` module.
+    - `file_ring` (HashRing): The consistent-hash ring placing song IDs on the registered file services.
 
     Methods:
     --------
@@ -43,12 +46,18 @@ class MainService(BaseService):
     - `verify_ip(request: Request)`: Verify if the client IP in the request is allowed to access the service.
     - `update_or_add_service(service: ServiceInfo)`: Update or add a service to the system.
     - `del_service(url: str)`: Remove a service from the collection.
+    - `file_ring_data()`: Describe the file service ring so other services can place song IDs on it.
+    - `request_file_repair()`: Ask every file service to re-replicate the songs it stores.
     """
 
+    FILE_REPLICATION_FACTOR = 2  # file services storing each song
+
     def __init__(self):
         super().__init__(ServiceType.MAIN_SERVICE)
         self.services: Dict[str, ServiceInfo] = {}
         self.secret_key = secrets.token_hex(32)
+        self.file_replication_factor = int(os.getenv("FILE_REPLICATION_FACTOR", self.FILE_REPLICATION_FACTOR))
+        self.file_ring = HashRing()
 
     async def start_background_tasks(self):
         """
@@ -247,6 +256,9 @@ class MainService(BaseService):
                 else:
                     self.services[service.url].creation_time = datetime.now()
 
+                if service.type == ServiceType.FILE_SERVICE.name:
+                    self.file_ring.add(service.url)
+
                 logger.info(f"Service {service.name} {action}.")
             except Exception as e:
                 raise
@@ -278,6 +290,42 @@ class MainService(BaseService):
                 logger.error(error_message)
                 raise ValueError(error_message)
 
+            file_node_left = service.type == ServiceType.FILE_SERVICE.name
+            if file_node_left:
+                self.file_ring.remove(url)
+
+        if file_node_left and len(self.file_ring) > 0:
+            # the songs the node stored are now short of a replica
+            self.tasks.append(asyncio.create_task(self.request_file_repair()))
+
+    def file_ring_data(self):
+        """
+        Describe the file service ring, from which any service can rebuild it and place song IDs identically.
+
+        :return: A dictionary containing the following information:
+                 - "nodes": The URLs of the file services on the ring.
+                 - "replication_factor": The number of file services storing each song.
+                 - "virtual_nodes": The number of points each file service owns on the ring.
+        :rtype: dict
+        """
+        return {
+            "nodes": self.file_ring.nodes,
+            "replication_factor": self.file_replication_factor,
+            "virtual_nodes": self.file_ring.virtual_nodes,
+        }
+
+    async def request_file_repair(self):
+        """
+        Ask every file service on the ring to copy the songs it stores to any of their replicas missing them.
+
+        :return: None
+        """
+        for url in self.file_ring.nodes:
+            try:
+                await self.service_exception_handling(url, "replication/repair", "POST")
+            except Exception as e:
+                logger.error(f"Failed to request replica repair from {url}: {e}")
+
     async def get_service(self, service_type: ServiceType):
         """
         Retrieve the optimal service instance for the given service type.
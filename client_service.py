@@ -1,3 +1,4 @@
+import asyncio
 import os
 import time
 from typing import Optional
@@ -12,6 +13,9 @@ from classes.enum.ServiceType import ServiceType
 from classes.services.ClientService import ClientService
 from utils import service_utils
 
+SONGS_PAGE_SIZE = 50
+SEARCH_RESULTS_LIMIT = 50
+
 service = ClientService()
 templates = Jinja2Templates(directory="templates")
 
@@ -77,11 +81,12 @@ async def root(request: Request):
 
 
 @app.get("/home")
-async def home(request: Request, _=Depends(validate_user_session)):
+async def home(request: Request, _=Depends(validate_user_session), cursor: Optional[str] = None):
     """
     :param request: Request object representing the incoming request
     :param _: User session validation dependency
-    :return: TemplateResponse with home.html template, songs list, and error message (if any)
+    :param cursor: The cursor of the page of songs to display, or None for the first page
+    :return: TemplateResponse with home.html template, songs list, next page cursor and error message (if any)
     """
     result = await endpoint_setup(request, "/home")
     if result:
@@ -89,17 +94,22 @@ async def home(request: Request, _=Depends(validate_user_session)):
     error = ''
     try:
         db_service_url = await service.get_service_url(ServiceType.DATABASE_SERVICE)
-        file_service_url = await service.get_service_url(ServiceType.FILE_SERVICE)
         # check if this service is best to handle the request
-        params = {"username": request.cookies.get('username')}
+        params = {"username": request.cookies.get('username'), "limit": SONGS_PAGE_SIZE}
+        if cursor:
+            params["cursor"] = cursor
         req = await service.service_exception_handling(db_service_url, "songs", "GET", params=params)
-        songs = req[0]
+        songs = req[0]["songs"]
+        # link each song to the primary file service storing it
+        placement = await service.get_file_placement([song.get("song_id") for song in songs])
         for song in songs:
             song_id = song.get("song_id")
+            file_service_url = placement[song_id][0]
             song["song_url"] = f"http://{file_service_url}/download/song?song_id={song_id}"
-            song["image_url"] = f"http://{file_service_url}/download/image?id={song_id}"
+            song["image_url"] = f"http://{file_service_url}/download/image?id={song_id}&size=64"
 
-        return templates.TemplateResponse("home.html", {"request": request, "songs": songs, "error": error})
+        return templates.TemplateResponse("home.html", {"request": request, "songs": songs, "error": error,
+                                                        "cursor": cursor, "next_cursor": req[0].get("next_cursor")})
     except HTTPException as e:
         if e.status_code != 404 and e.status_code != 400:
             logger.debug(f"Error getting playlists: {e.detail}")
@@ -357,9 +367,11 @@ async def upload_song(request: Request, _=Depends(validate_user_session), song_n
     9. Makes an API call to the database service to create the song using the `service.service_exception_handling` function.
     10. Reads the contents of the image file and MP3 file.
     11. Resets the pointers of the image file and MP3 file.
-    12. Constructs a files dictionary with the image file and MP3 file contents.
-    13. Constructs a data dictionary with the song ID.
-    14. Makes an API call to the file service to upload the song using the `service.service_exception_handling` function.
+    12. Constructs a data dictionary with the song ID and the file extensions.
+    13. Sends the files to each file service the file service ring places the song on through resumable upload sessions using the `service.upload_resumable` function, and stores the
+    * song with the file service's `upload/song/complete` endpoint, succeeding if at least one stores it. A failed chunk is resumed from the offset the file service reached, so only the
+    * missing bytes are sent again, and the MP3 file is checked against its MD5 hash before it is stored. If a file service already stores an MP3 file with the same MD5 hash, only the
+    * image is sent to it and the stored MP3 content is linked to the new song.
     15. Creates a redirect response to the home page with the status code 303.
     16. Retrieves the auth token and username from the request cookies.
     17. Sets the auth token and username as cookies in the redirect response.
@@ -385,7 +397,6 @@ async def upload_song(request: Request, _=Depends(validate_user_session), song_n
             raise HTTPException(status_code=422, detail="Invalid Audio File Type")
 
         db_service_url = await service.get_service_url(ServiceType.DATABASE_SERVICE)
-        file_service_url = await service.get_service_url(ServiceType.FILE_SERVICE)
 
         # Generate a unique ID for the song
         song_id = f"sg_{int(time.time() * 1000)}_{os.urandom(6).hex()}"
@@ -400,17 +411,40 @@ async def upload_song(request: Request, _=Depends(validate_user_session), song_n
         mp3_content = await mp3_file.read()
         await image.seek(0)
         await mp3_file.seek(0)
-        # get name of the files with extension
-        image_name = image.filename
-        mp3_name = mp3_file.filename
-
-        # Make sure service_exception_handling can handle file uploads correctly
-        files = {
-            "image_file": (image_name, image_content, image.content_type),
-            "mp3_file": (mp3_name, mp3_content, mp3_file.content_type)
-        }
-        data = {"song_id": song_id}
-        await service.service_exception_handling(file_service_url, "upload/song", "PUT", params=data, files=files)
+        # get the extensions of the files
+        image_extension = image.filename.split(".")[-1]
+        mp3_extension = mp3_file.filename.split(".")[-1]
+        data = {"song_id": song_id, "image_extension": image_extension, "mp3_extension": mp3_extension}
+
+        async def upload_to(file_service_url):
+            # files are sent through resumable upload sessions, so a failed chunk only resends what is missing
+            image_upload_id = await service.upload_resumable(file_service_url, image_content)
+            if await service.blob_exists(file_service_url, md5):
+                # the file service already stores this content, link it instead of sending it again
+                try:
+                    await service.service_exception_handling(
+                        file_service_url, "upload/song/complete", "POST",
+                        params={**data, "image_upload_id": image_upload_id, "mp3_md5": md5})
+                    return
+                except HTTPException as e:
+                    # the content was removed since it was checked
+                    if e.status_code != 404:
+                        raise
+            mp3_upload_id = await service.upload_resumable(file_service_url, mp3_content, md5)
+            await service.service_exception_handling(
+                file_service_url, "upload/song/complete", "POST",
+                params={**data, "image_upload_id": image_upload_id, "mp3_upload_id": mp3_upload_id})
+
+        # store the song on every file service the ring places it on. One copy is enough to succeed, the file
+        # services copy it to the replicas that missed it
+        replicas = (await service.get_file_placement([song_id]))[song_id]
+        results = await asyncio.gather(*(upload_to(url) for url in replicas), return_exceptions=True)
+        failures = [result for result in results if isinstance(result, BaseException)]
+        for url, result in zip(replicas, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Failed to upload song {song_id} to {url}: {result}")
+        if len(failures) == len(replicas):
+            raise failures[0]
         redirect_response = RedirectResponse(url="/home", status_code=303)
         # get token and username from request
 
@@ -523,14 +557,17 @@ async def create_service(request: Request, _=Depends(validate_user_session), ser
 
 
 @app.get("/songs")
-async def get_songs(request: Request, _=Depends(validate_user_session)):
+async def get_songs(request: Request, _=Depends(validate_user_session), cursor: Optional[str] = None,
+                    q: Optional[str] = None):
     """
-    Fetches songs from the database service, adds URLs for song and image download,
-    and returns the songs rendered in a template response.
+    Fetches a page of songs, or the songs matching a search, from the database service, adds URLs for song and
+    image download, and returns the songs rendered in a template response.
 
     :param request: The request object containing information about the HTTP request.
     :param _: The dependency object for validating user session.
-    :return: A TemplateResponse object with the rendered songs, request, and error (if any).
+    :param cursor: The cursor of the page of songs to display, or None for the first page.
+    :param q: The search text. When provided, the best matches are displayed instead of a page of the catalogue.
+    :return: A TemplateResponse object with the rendered songs, request, next page cursor and error (if any).
     """
     error = ''
 
@@ -540,16 +577,30 @@ async def get_songs(request: Request, _=Depends(validate_user_session)):
 
     try:
         db_service_url = await service.get_service_url(ServiceType.DATABASE_SERVICE)
-        file_service_url = await service.get_service_url(ServiceType.FILE_SERVICE)
 
-        req = await service.service_exception_handling(db_service_url, "songs", "GET")
-        songs = req[0]
+        if q:
+            params = {"q": q, "limit": SEARCH_RESULTS_LIMIT}
+            req = await service.service_exception_handling(db_service_url, "songs/search", "GET", params=params)
+            songs = req[0]
+            next_cursor = None
+        else:
+            params = {"limit": SONGS_PAGE_SIZE}
+            if cursor:
+                params["cursor"] = cursor
+            req = await service.service_exception_handling(db_service_url, "songs", "GET", params=params)
+            songs = req[0]["songs"]
+            next_cursor = req[0].get("next_cursor")
+
+        # link each song to the primary file service storing it
+        placement = await service.get_file_placement([song.get("song_id") for song in songs])
         for song in songs:
             song_id = song.get("song_id")
+            file_service_url = placement[song_id][0]
             song["song_url"] = f"http://{file_service_url}/download/song?song_id={song_id}"
-            song["image_url"] = f"http://{file_service_url}/download/image?id={song_id}"
+            song["image_url"] = f"http://{file_service_url}/download/image?id={song_id}&size=64"
 
-        return templates.TemplateResponse("songs.html", {"request": request, "songs": songs, "error": error})
+        return templates.TemplateResponse("songs.html", {"request": request, "songs": songs, "error": error,
+                                                         "cursor": cursor, "next_cursor": next_cursor, "q": q})
     except HTTPException as e:
         if e.status_code != 404 and e.status_code != 400:
             logger.debug(f"Error getting songs: {e.detail}")
@@ -1,19 +1,76 @@
-from typing import Optional
+import json
+import sqlite3
+from typing import List, Optional
 
-from fastapi import HTTPException, Request
+from fastapi import HTTPException, Query, Request
+from starlette.responses import StreamingResponse
 
 from utils.DatabaseAsyncQuery import create_user, get_user, create_song, get_song, create_playlist, get_playlists, \
-    add_song_to_playlist, get_user_by_password, get_songs, remove_song_from_playlist, get_playlist_songs
+    add_song_to_playlist, get_user_by_password, get_songs, remove_song_from_playlist, get_playlist_songs, \
+    encode_songs_cursor, search_songs, create_songs, stream_songs, get_songs_by_playlist, stream_playlists, \
+    stream_songs_by_playlist, get_song_md5s
 from classes.pydantic.Playlist import Playlist
 from classes.pydantic.Song import Song
+from classes.pydantic.SongIds import SongIds
 from classes.pydantic.UserAccount import UserAccount
 from classes.services.DatabaseService import DatabaseService
 
+SONGS_PAGE_LIMIT = 50
+MAX_SONGS_PAGE_LIMIT = 500
+SEARCH_LIMIT = 20
+MAX_BULK_CREATE_SONGS = 100000
+MAX_SEARCH_LIMIT = 100
+MAX_SONG_MD5_IDS = 1000
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
 service = DatabaseService()
 
 app = service.app
 
 
+def song_to_dict(row):
+    """
+    :param row: A row of the songs table.
+    :return: A dictionary representing the song, without the uploader's username.
+    """
+    return {"song_id": row[0], "song_name": row[1], "artist": row[2], "md5": row[3], "username": None}
+
+
+def playlist_to_dict(row):
+    """
+    :param row: A row of the playlists table.
+    :return: A dictionary representing the playlist.
+    """
+    return {"playlist_id": row[0], "playlist_name": row[1], "username": row[2]}
+
+
+def wants_stream(request: Request, stream: bool):
+    """
+    :param request: The incoming request.
+    :param stream: The value of the `stream` query parameter.
+    :return: True if the client asked for an NDJSON stream, either with `?stream=true` or an Accept header.
+    """
+    return stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def ndjson_response(batches, to_dict):
+    """
+    Stream rows to the client as newline-delimited JSON, one object per line.
+
+    The batches are read from a worker thread as the response is sent, so only one batch is held in memory and the
+    first rows go out before the query has finished.
+
+    :param batches: A generator of lists of rows.
+    :param to_dict: The function converting a row into a JSON-serializable dictionary.
+    :return: A StreamingResponse with the NDJSON media type.
+    """
+    def lines():
+        for rows in batches:
+            yield "".join(json.dumps(to_dict(row)) + "\n" for row in rows).encode("utf-8")
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
+
+
 @app.get("/")
 async def root():
     """
@@ -40,22 +97,15 @@ async def create_user_endpoint(user: UserAccount):
     if user is None:
         raise HTTPException(status_code=400, detail="Invalid Request")
 
-    try:
-        result = await get_user(user.username)
-        if result:
-            raise HTTPException(status_code=409, detail="User already exists")
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
     try:
         result = await create_user(user.username, user.password, user.salt, user.email)
+    except sqlite3.IntegrityError:
+        raise HTTPException(status_code=400, detail="Could not create user")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    if not result:
-        raise HTTPException(status_code=400, detail="Could not create user")
+    if result is None:
+        raise HTTPException(status_code=409, detail="User already exists")
     return {"detail": "User created successfully"}
 
 
@@ -136,12 +186,10 @@ async def create_song_endpoint(song: Song):
     This method is used to create a new song in the system. It takes a Song object as input, which contains the necessary information about the song. The method first checks if the given
     * song is None. If it is, an HTTPException with a status code of 400 and detail message of "Invalid Request" is raised.
 
-    Next, it checks if a song with the same artist and name already exists by calling the get_songs method. If an exception occurs during the database query, an HTTPException with a status
-    * code of 500 and the exception message is raised.
-
-    If a song with the same artist and name is found, an HTTPException with a status code of 409 and detail message of "Song already exists" is raised.
+    The song is then inserted by calling the create_song method, which skips the insert in the same statement if a song with the same ID or the same artist and name already exists. In
+    * that case an HTTPException with a status code of 409 and detail message of "Song already exists" is raised.
 
-    If no existing song is found, the method proceeds to create a new song by calling the create_song method. If an exception occurs during the creation process, an HTTPException with a
+    If the song is missing required fields, an HTTPException with a status code of 422 is raised. If any other exception occurs during the creation process, an HTTPException with a
     * status code of 500 and the exception message is raised.
 
     If the song creation is successful, a dictionary containing the detail message "Song created successfully" and the ID of the newly created song is returned.
@@ -150,23 +198,60 @@ async def create_song_endpoint(song: Song):
     """
     if song is None:
         raise HTTPException(status_code=400, detail="Invalid Request")
-    # check if song with artist and name already exists
+
     try:
-        result = await get_songs(song.song_name, song.artist)
+        result = await create_song(song.song_id, song.song_name, song.artist, song.md5, song.username)
+    except sqlite3.IntegrityError:
+        raise HTTPException(status_code=422, detail="Could not create song")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    if result:
+    if result is None:
         raise HTTPException(status_code=409, detail="Song already exists")
 
+    return {"detail": "Song created successfully", "song_id": result}
+
+
+@app.post("/songs/bulk_create")
+async def bulk_create_songs_endpoint(songs: List[Song]):
+    """
+    Create many songs in a single transaction.
+
+    :param songs: The Song objects to create. Each must have a song ID, name, artist, MD5 and username.
+    :return: A dictionary with the number of songs created and found as duplicates, and under "results" the status
+             of each song in request order: "created", "duplicate" when a song with the same ID or name and artist
+             already exists, or "invalid" when required fields are missing.
+    :raises HTTPException 400: If no songs are provided.
+    :raises HTTPException 413: If more than MAX_BULK_CREATE_SONGS songs are provided.
+    :raises HTTPException 500: If an error occurs while creating the songs.
+    """
+    if not songs:
+        raise HTTPException(status_code=400, detail="Invalid Request")
+    if len(songs) > MAX_BULK_CREATE_SONGS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_CREATE_SONGS} songs can be created at once")
+
+    rows = [(song.song_id, song.song_name, song.artist, song.md5, song.username) for song in songs]
+    valid_rows = [row for row in rows if all(value is not None for value in row)]
+
     try:
-        result = await create_song(song.song_id, song.song_name, song.artist, song.md5, song.username)
+        created = await create_songs(valid_rows) if valid_rows else []
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    if not result:
-        raise HTTPException(status_code=422, detail="Could not create song")
 
-    return {"detail": "Song created successfully", "song_id": result}
+    created = iter(created)
+    results = []
+    for row in rows:
+        if any(value is None for value in row):
+            status = "invalid"
+        else:
+            status = "created" if next(created) else "duplicate"
+        results.append({"song_id": row[0], "status": status})
+
+    return {
+        "created": sum(1 for result in results if result["status"] == "created"),
+        "duplicates": sum(1 for result in results if result["status"] == "duplicate"),
+        "results": results
+    }
 
 
 @app.get("/songs/song")
@@ -195,27 +280,152 @@ async def get_song_endpoint(song_id: str):
     return song_json
 
 
+@app.post("/songs/md5")
+async def get_song_md5s_endpoint(song_ids: SongIds):
+    """
+    This method retrieves the MD5 hashes of several songs at once, so the file services can reconcile the hashes
+    they keep locally in a single request.
+
+    :param song_ids: The IDs of the songs, at most MAX_SONG_MD5_IDS.
+    :return: A dictionary with the MD5 hash of each song that exists under "songs", by song ID. Songs that do not
+             exist are left out.
+    :raises HTTPException 400: If too many song IDs are given.
+    :raises HTTPException 500: If an error occurs while retrieving the hashes.
+    """
+    if len(song_ids.song_ids) > MAX_SONG_MD5_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SONG_MD5_IDS} song IDs can be looked up at once")
+
+    try:
+        rows = await get_song_md5s(song_ids.song_ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {"songs": {song_id: md5 for song_id, md5 in rows}}
+
+
 @app.get("/songs")
-async def get_songs_endpoint(name: Optional[str] = None, artist: Optional[str] = None, username: Optional[str] = None):
+async def get_songs_endpoint(request: Request, name: Optional[str] = None, artist: Optional[str] = None,
+                             username: Optional[str] = None,
+                             limit: int = Query(SONGS_PAGE_LIMIT, ge=1, le=MAX_SONGS_PAGE_LIMIT),
+                             cursor: Optional[str] = None, stream: bool = False):
     """
-    This method is the endpoint for retrieving songs. It accepts two optional parameters.
+    This method is the endpoint for retrieving songs one page at a time. It accepts optional filters and paging parameters.
+
+    When `stream` is true or the request accepts "application/x-ndjson", every matching song after the cursor is
+    streamed instead as one JSON object per line, ignoring `limit`.
 
+    :param request: The incoming request.
     :param name: The name of the song to filter by. Defaults to None if not provided.
     :param artist: The name of the artist to filter by. Defaults to None if not provided.
-    :return: A list of dictionaries representing each song that matches the given criteria.
+    :param username: The username of the uploader to filter by. Defaults to None if not provided.
+    :param limit: The maximum number of songs to return in the page.
+    :param cursor: The `next_cursor` of the previous page. Defaults to None for the first page.
+    :param stream: Whether to stream every matching song as NDJSON.
+    :return: A dictionary with the page of songs under "songs" and the cursor of the next page under "next_cursor",
+             which is None on the last page.
+    :raises HTTPException 400: If the cursor is invalid.
     :raises HTTPException 500: If there is an error while retrieving songs from the database.
     :raises HTTPException 404: If no songs are found matching the given criteria.
     """
+    if wants_stream(request, stream):
+        try:
+            return ndjson_response(stream_songs(name, artist, username, cursor), song_to_dict)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
     try:
-        songs_sql = await get_songs(name, artist, username)
+        songs_sql = await get_songs(name, artist, username, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    if not songs_sql or len(songs_sql) == 0:
+    if not songs_sql and cursor is None:
         raise HTTPException(status_code=404, detail="No songs found with that name")
 
-    songs = [Song(song_id=row[0], song_name=row[1], artist=row[2], md5=row[3]).dict() for row in songs_sql]
-    return songs
+    songs = [song_to_dict(row) for row in songs_sql]
+    next_cursor = None
+    if len(songs_sql) == limit:
+        next_cursor = encode_songs_cursor(songs_sql[-1][1], songs_sql[-1][0])
+    return {"songs": songs, "next_cursor": next_cursor}
+
+
+@app.get("/songs/search")
+async def search_songs_endpoint(q: str = Query(..., min_length=1),
+                                limit: int = Query(SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT)):
+    """
+    Search songs by name and artist using the full-text index.
+
+    :param q: The search text. Every word must match the start of a word in the song name or artist.
+    :param limit: The maximum number of songs to return.
+    :return: A list of dictionaries representing the matching songs, best match first.
+    :raises HTTPException 500: If there is an error while searching the database.
+    """
+    try:
+        songs_sql = await search_songs(q, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return [song_to_dict(row) for row in songs_sql]
+
+
+@app.get("/playlists")
+async def get_playlists_endpoint(request: Request, username: Optional[str] = None,
+                                 playlist_name: Optional[str] = None, stream: bool = False):
+    """
+    Retrieve the playlists matching the given filters.
+
+    When `stream` is true or the request accepts "application/x-ndjson", the playlists are streamed as one JSON
+    object per line.
+
+    :param request: The incoming request.
+    :param username: The username of the playlists' owner to filter by. Defaults to None if not provided.
+    :param playlist_name: The name of the playlists to filter by. Defaults to None if not provided.
+    :param stream: Whether to stream the playlists as NDJSON.
+    :return: A list of dictionaries representing the playlists.
+    :raises HTTPException 404: If no playlists are found matching the given criteria.
+    :raises HTTPException 500: If there is an error while retrieving playlists from the database.
+    """
+    if wants_stream(request, stream):
+        return ndjson_response(stream_playlists(username, playlist_name), playlist_to_dict)
+
+    try:
+        playlists_sql = await get_playlists(username, playlist_name)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not playlists_sql:
+        raise HTTPException(status_code=404, detail="No playlists found")
+    return [playlist_to_dict(row) for row in playlists_sql]
+
+
+@app.get("/playlists/playlist/songs")
+async def get_playlist_songs_endpoint(request: Request, playlist_id: str, stream: bool = False):
+    """
+    Retrieve the songs of a playlist in playlist order.
+
+    When `stream` is true or the request accepts "application/x-ndjson", the songs are streamed as one JSON object
+    per line.
+
+    :param request: The incoming request.
+    :param playlist_id: The ID of the playlist.
+    :param stream: Whether to stream the songs as NDJSON.
+    :return: A list of dictionaries representing the songs in the playlist.
+    :raises HTTPException 400: If the playlist ID is empty.
+    :raises HTTPException 500: If there is an error while retrieving the songs from the database.
+    """
+    if playlist_id == "":
+        raise HTTPException(status_code=400, detail="Invalid Request")
+
+    if wants_stream(request, stream):
+        return ndjson_response(stream_songs_by_playlist(playlist_id), song_to_dict)
+
+    try:
+        songs_sql = await get_songs_by_playlist(playlist_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return [song_to_dict(row) for row in songs_sql]
 
 
 @app.delete("/stop")
@@ -1,13 +1,25 @@
+import hashlib
 import os
+import re
 import shutil
+import time
+from mimetypes import guess_type
+from typing import List, Optional
 
-import aiofiles as aiofiles
-from fastapi import UploadFile, File, HTTPException
-from starlette.responses import FileResponse, StreamingResponse
+from fastapi import UploadFile, File, HTTPException, Query, Request
+from fastapi.logger import logger
+from starlette.responses import JSONResponse, Response, StreamingResponse
 from starlette.staticfiles import StaticFiles
 
+from classes.ArchiveStream import ArchiveStream
+from classes.ExecutorRegistry import ExecutorRegistry
+from classes.FileRangeResponse import FileRangeResponse
+from classes.ImageCache import CachedImage
 from classes.enum.ServiceType import ServiceType
+from classes.exception.UploadTooLargeException import UploadTooLargeException
+from classes.pydantic.SongIds import SongIds
 from classes.services.FileService import FileService
+from utils.http_utils import etag_matches, http_date, is_not_modified, parse_range_header
 
 service = FileService()
 os.makedirs(service.file_dir, exist_ok=True)
@@ -24,77 +36,311 @@ async def root():
     """
     return await service.fetch_service_data()
 
+async def store_song(song_id: str, mp3_extension: str, image_extension: str, store_mp3, store_image):
+    """
+    Store the MP3 and image files of a song in the shard directories derived from its ID, record their MD5 hashes and
+    index them, and record the MP3 file's MD5 hash and size in the song index. If the image cannot be stored, the MP3
+    file is removed again.
+
+    :param song_id: The ID of the song.
+    :param mp3_extension: The extension to store the MP3 file under.
+    :param image_extension: The extension to store the image file under.
+    :param store_mp3: A coroutine function storing the MP3 file under a directory and file name, returning its MD5
+                      hash and size in bytes.
+    :param store_image: A coroutine function storing the image file the same way.
+    :return: A tuple of the MD5 hash and size in bytes of the stored MP3 file.
+    """
+    mp3_name = f"{song_id}.{mp3_extension}"
+    image_name = f"{song_id}.{image_extension}"
+
+    # files are stored in shard directories derived from the song ID, keeping each directory small
+    mp3_dir = service.shard_dir(service.music_dir, song_id)
+    image_dir = service.shard_dir(service.image_dir, song_id)
+    mp3_file_path = os.path.join(mp3_dir, mp3_name)
+    image_file_path = os.path.join(image_dir, image_name)
+
+    md5, size = await store_mp3(mp3_dir, mp3_name)
+    service.md5_cache.record(mp3_file_path, md5)
+    try:
+        image_md5, _ = await store_image(image_dir, image_name)
+    except BaseException:
+        # do not keep a song without its image
+        os.remove(mp3_file_path)
+        await service.release_blob(md5)
+        raise
+    service.md5_cache.record(image_file_path, image_md5)
+    service.file_index(service.music_dir).add(song_id, mp3_file_path)
+    service.file_index(service.image_dir).add(song_id, image_file_path)
+    await forget_image(song_id)
+    service.queue_thumbnails(song_id)
+    # downloads are verified against the hash received here, reconciled with the database in the background
+    await service.run_in_executor(ExecutorRegistry.FILE, service.song_index.put, song_id, md5, size)
+    return md5, size
+
+async def forget_image(image_id: str):
+    """
+    Remove the thumbnails of an image and drop it and its thumbnails from the image cache, after it was replaced or
+    deleted.
+
+    :param image_id: The ID of the image.
+    :return: None
+    """
+    await service.remove_thumbnails(image_id)
+    for size in (None, *service.THUMBNAIL_SIZES):
+        service.image_cache.invalidate((image_id, size))
+
 @app.put("/upload/song")
-async def upload_file(song_id: str, mp3_file: UploadFile = File(...), image_file: UploadFile = File(...)):
+async def upload_file(song_id: str, mp3_file: Optional[UploadFile] = File(None), image_file: UploadFile = File(...),
+                      mp3_md5: Optional[str] = None, mp3_extension: str = "mp3"):
     """
     :param song_id: The ID of the song being uploaded.
-    :param mp3_file: The MP3 file to be uploaded.
+    :param mp3_file: The MP3 file to be uploaded. Can be left out if `mp3_md5` names content already stored.
     :param image_file: The image file associated with the song.
-    :return: None
+    :param mp3_md5: The MD5 hash of an MP3 file already in the blob store, to store instead of uploading it again.
+    :param mp3_extension: The extension to store the MP3 file under when it is not uploaded.
+    :return: A dictionary with the detail of the upload, and the MD5 hash and size in bytes of the stored MP3 file
+             so the caller can verify it without reading the file back.
 
     This method is used to upload a song file and its associated image file. It saves the files to the appropriate directories on the server.
 
-    If any of the parameters (`song_id`, `mp3_file`, `image_file`) is `None`, it will raise a `HTTPException` with a status code of 400 indicating an invalid request.
+    If `song_id` or `image_file` is `None`, or neither `mp3_file` nor `mp3_md5` is provided, it will raise a `HTTPException` with a status code of 400 indicating an invalid request.
+
+    It extracts the file extensions from the `mp3_file` and `image_file` filenames and constructs the file names from the `song_id` and the extracted extensions. The files are stored in
+    * shard directories nested under the music and image directories by the hash of the `song_id`, so no single directory grows to hold every song.
 
-    The method first creates the necessary directories (`service.image_dir`, `service.music_dir`) if they do not exist.
+    Each file is streamed to a temporary file in its directory in fixed-size chunks, hashing it on the way, and renamed into place once complete. Memory use per upload is constant
+    * regardless of the file size, and a failed upload never leaves a partial file behind. Files are stored once per content in the blob store and hardlinked into place, so an
+    * upload whose content is already stored takes no extra space.
 
-    It then extracts the file extensions from the `mp3_file` and `image_file` filenames.
+    If `mp3_md5` is given instead of `mp3_file`, the stored content with that hash is linked into place without being transferred. If it is not stored, a `HTTPException` with a
+    * status code of 404 is raised and the caller should upload the file.
 
-    Next, it constructs file paths for the MP3 file and the image file using the `song_id` and the extracted extensions.
+    If a file is larger than `service.max_upload_size`, nothing is stored and a `HTTPException` with a status code of 413 is raised.
 
-    The method saves the MP3 file by opening a binary file for writing and writing the contents of the `mp3_file` to the buffer. It then saves the buffer to disk.
+    If any other exception occurs during the file saving process, it will be logged and a `HTTPException` with a status code of 500 will be raised.
+    """
+    if song_id is None or image_file is None or (mp3_file is None and not service.is_md5(mp3_md5)):
+        raise HTTPException(status_code=400, detail="Invalid Request")
 
-    The file pointer for the MP3 file is then reset to the beginning, in case it needs to be read again.
+    # extract extension from mp3 file and image file
+    if mp3_file is not None:
+        mp3_extension = mp3_file.filename.split(".")[-1]
+    image_extension = image_file.filename.split(".")[-1]
 
-    The same process is then repeated for the image file.
+    async def store_mp3(directory, file_name):
+        if mp3_file is not None:
+            return await service.store_upload(mp3_file, directory, file_name)
+        return mp3_md5, await service.link_blob(mp3_md5, directory, file_name)
 
-    If any exception occurs during the file saving process, it will be logged and a `HTTPException` with a status code of 500 will be raised.
+    try:
+        md5, size = await store_song(song_id, mp3_extension, image_extension, store_mp3,
+                                     lambda directory, file_name: service.store_upload(image_file, directory, file_name))
+    except UploadTooLargeException as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    except Exception as e:
+        # Log the exception or send it back in the response
+        print(f"Error saving files: {e}")
+        raise HTTPException(status_code=500, detail=f"Error saving files: {e}")
 
-    Note: This method uses async/await syntax for asynchronous file operations.
+    return {"detail": "Files uploaded successfully", "md5": md5, "size": size}
+
+@app.post("/uploads", status_code=201)
+async def create_upload(length: int, md5: Optional[str] = None):
+    """
+    Start a resumable upload. The file is then sent in any number of `PATCH /uploads/{upload_id}` requests, each
+    appending at the current offset, and stored with `POST /upload/song/complete`. Unfinished sessions are removed
+    after `service.UPLOAD_SESSION_TTL` seconds.
+
+    :param length: The size of the file in bytes.
+    :param md5: The MD5 hash the file must have, checked when the upload is completed.
+    :return: A dictionary with the ID of the upload session, its offset and the file's length.
+    :raises HTTPException: If the length or hash is invalid (400) or the file is larger than
+                           `service.max_upload_size` (413).
     """
-    if song_id is None or mp3_file is None or image_file is None:
+    if length < 0 or (md5 is not None and not service.is_md5(md5)):
         raise HTTPException(status_code=400, detail="Invalid Request")
+    try:
+        upload_id = await service.run_in_executor(ExecutorRegistry.FILE, service.upload_sessions.create, length, md5,
+                                                  service.max_upload_size)
+    except UploadTooLargeException as e:
+        raise HTTPException(status_code=413, detail=str(e))
 
+    return {"upload_id": upload_id, "offset": 0, "length": length}
+
+async def get_upload_session(upload_id: str) -> dict:
+    """
+    :param upload_id: The ID of the upload session.
+    :return: The state of the upload session, as returned by `UploadSessionStore.get`.
+    :raises HTTPException: If the ID is invalid (400) or there is no such session (404).
+    """
+    if not service.upload_sessions.is_upload_id(upload_id):
+        raise HTTPException(status_code=400, detail="Invalid Request")
     try:
-        os.makedirs(service.image_dir, exist_ok=True)
-        os.makedirs(service.music_dir, exist_ok=True)
+        return await service.run_in_executor(ExecutorRegistry.FILE, service.upload_sessions.get, upload_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
 
-        # extract extension from mp3 file and image file
-        mp3_extension = mp3_file.filename.split(".")[-1]
-        image_extension = image_file.filename.split(".")[-1]
+@app.api_route("/uploads/{upload_id}", methods=["GET", "HEAD"])
+async def get_upload(upload_id: str):
+    """
+    Retrieve the offset of a resumable upload, the number of bytes received so far, so an interrupted upload can
+    resume from there.
+
+    :param upload_id: The ID of the upload session.
+    :return: A dictionary with the ID of the upload session, its offset and the file's length. The offset is also
+             sent in the Upload-Offset header.
+    :raises HTTPException: If the ID is invalid (400) or there is no such session (404).
+    """
+    session = await get_upload_session(upload_id)
+    body = {"upload_id": upload_id, "offset": session["offset"], "length": session["length"]}
+    return JSONResponse(body, headers={"Upload-Offset": str(session["offset"])})
 
-        mp3_name = f"{song_id}.{mp3_extension}"
-        image_name = f"{song_id}.{image_extension}"
+@app.patch("/uploads/{upload_id}")
+async def append_upload(request: Request, upload_id: str, offset: int):
+    """
+    Append the request body to a resumable upload. The body is written to disk as it arrives, and if the request is
+    interrupted the bytes received are kept, so the client only resends from the offset returned by
+    `GET /uploads/{upload_id}`.
+
+    :param request: The incoming request, whose body is the next part of the file.
+    :param upload_id: The ID of the upload session.
+    :param offset: The offset the body starts at, which must be the session's current offset.
+    :return: A dictionary with the ID of the upload session and its new offset.
+    :raises HTTPException: If the ID is invalid or the body runs past the file's length (400), there is no such
+                           session (404), or the offset is not the current offset or another request is appending to
+                           the session (409).
+    """
+    session = await get_upload_session(upload_id)
+    if offset != session["offset"] or upload_id in service.uploads_in_progress:
+        raise HTTPException(status_code=409, detail=f"Upload is at offset {session['offset']}",
+                            headers={"Upload-Offset": str(session["offset"])})
 
-        # Construct file paths
-        mp3_file_path = os.path.join(service.music_dir, mp3_name)
-        image_file_path = os.path.join(service.image_dir, image_name)
+    service.uploads_in_progress.add(upload_id)
+    try:
+        new_offset = await service.append_upload(upload_id, offset, request.stream())
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        service.uploads_in_progress.discard(upload_id)
+
+    return {"upload_id": upload_id, "offset": new_offset}
+
+@app.delete("/uploads/{upload_id}")
+async def delete_upload(upload_id: str):
+    """
+    Abandon a resumable upload, removing what was received of it.
 
-        # Save MP3 file
-        async with aiofiles.open(mp3_file_path, "wb") as buffer:
-            content = await mp3_file.read()  # Read content
-            await buffer.write(content)  # Save to disk
+    :param upload_id: The ID of the upload session.
+    :return: A dictionary with the detail of the deletion.
+    :raises HTTPException: If the ID is invalid (400) or there is no such session (404).
+    """
+    await get_upload_session(upload_id)
+    await service.run_in_executor(ExecutorRegistry.FILE, service.upload_sessions.discard, upload_id)
+    return {"detail": "Upload deleted"}
+
+@app.post("/upload/song/complete")
+async def complete_upload(song_id: str, image_upload_id: str, image_extension: str,
+                          mp3_upload_id: Optional[str] = None, mp3_md5: Optional[str] = None,
+                          mp3_extension: str = "mp3"):
+    """
+    Store a song from resumable uploads, as `PUT /upload/song` does from a single request.
 
-        # Reset file pointer if needed
-        await mp3_file.seek(0)
+    Both uploads must be complete, and each is checked against the MD5 hash given when it was started before anything
+    is stored. The uploaded files are renamed into place through the blob store without being copied again.
 
-        # Save Image file
-        async with aiofiles.open(image_file_path, "wb") as buffer:
-            content = await image_file.read()  # Read content
-            await buffer.write(content)  # Save to disk
+    :param song_id: The ID of the song.
+    :param image_upload_id: The ID of the upload session of the image file.
+    :param image_extension: The extension to store the image file under.
+    :param mp3_upload_id: The ID of the upload session of the MP3 file. Can be left out if `mp3_md5` names content
+                          already stored.
+    :param mp3_md5: The MD5 hash of an MP3 file already in the blob store, to store instead of uploading it again.
+    :param mp3_extension: The extension to store the MP3 file under.
+    :return: A dictionary with the detail of the upload, and the MD5 hash and size in bytes of the stored MP3 file.
+    :raises HTTPException: If the request is invalid (400), an upload or the blob is not found (404), an upload is
+                           incomplete (409) or does not match its MD5 hash (422), or the files cannot be stored (500).
+    """
+    if not song_id or (mp3_upload_id is None and not service.is_md5(mp3_md5)):
+        raise HTTPException(status_code=400, detail="Invalid Request")
 
-        # Reset file pointer if needed
-        await image_file.seek(0)
+    upload_ids = [upload_id for upload_id in (mp3_upload_id, image_upload_id) if upload_id is not None]
+    finished = {}
+    for upload_id in upload_ids:
+        session = await get_upload_session(upload_id)
+        if session["offset"] != session["length"]:
+            raise HTTPException(status_code=409, detail=f"Upload {upload_id} is incomplete",
+                                headers={"Upload-Offset": str(session["offset"])})
+        try:
+            finished[upload_id] = await service.finish_upload(upload_id)
+        except ValueError as e:
+            # the received file is corrupt, it has to be uploaded again
+            await service.run_in_executor(ExecutorRegistry.FILE, service.upload_sessions.discard, upload_id)
+            raise HTTPException(status_code=422, detail=str(e))
+
+    async def store_mp3(directory, file_name):
+        if mp3_upload_id is not None:
+            return await service.store_finished_upload(mp3_upload_id, finished[mp3_upload_id], directory, file_name)
+        return mp3_md5, await service.link_blob(mp3_md5, directory, file_name)
+
+    async def store_image(directory, file_name):
+        return await service.store_finished_upload(image_upload_id, finished[image_upload_id], directory, file_name)
 
+    try:
+        md5, size = await store_song(song_id, mp3_extension, image_extension, store_mp3, store_image)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Blob not found")
     except Exception as e:
-        # Log the exception or send it back in the response
-        print(f"Error saving files: {e}")
+        logger.error(f"Error saving files: {e}")
         raise HTTPException(status_code=500, detail=f"Error saving files: {e}")
 
+    return {"detail": "Files uploaded successfully", "md5": md5, "size": size}
+
+@app.api_route("/blobs/{md5}", methods=["GET", "HEAD"])
+async def get_blob(md5: str):
+    """
+    Check whether content is already stored, so a client can skip uploading it.
+
+    :param md5: The MD5 hash of the content.
+    :return: A dictionary with the MD5 hash, the size in bytes of the content and the number of files using it.
+    :raises HTTPException: If the hash is invalid (400) or the content is not stored (404).
+    """
+    if not service.is_md5(md5):
+        raise HTTPException(status_code=400, detail="Invalid Request")
+    try:
+        blob_stat = os.stat(service.find_blob_sync(md5) or service.blob_path(md5))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Blob not found")
+
+    return {"md5": md5, "size": blob_stat.st_size, "references": blob_stat.st_nlink - 1}
+
+async def remove_stored_file(directory: str, file_id: str, path: str):
+    """
+    Remove a stored file and its index and MD5 cache entries, and release its blob if no other file uses it.
+
+    :param directory: The directory the file is stored in.
+    :param file_id: The ID of the file.
+    :param path: The path to the file.
+    :return: None
+    """
+    try:
+        md5 = await service.md5_cache.get_md5(path)
+    except Exception as e:
+        logger.error(f"Error hashing {path}, its blob is kept: {e}")
+        md5 = None
+    os.remove(path)
+    service.file_index(directory).remove(file_id)
+    service.md5_cache.forget(path)
+    if md5 is not None:
+        await service.release_blob(md5)
+
 @app.delete("/delete/song")
 async def delete_file(song_id: str):
     """
-    Delete the MP3 and image files associated with the provided song ID.
+    Delete the MP3 and image files associated with the provided song ID, whatever their extensions, and the stored
+    content of each file no other song uses.
 
     :param song_id: The ID of the song.
     :type song_id: str
@@ -105,18 +351,17 @@ async def delete_file(song_id: str):
     if song_id is None or song_id == "":
         raise HTTPException(status_code=400, detail="Invalid Request")
     try:
-        mp3_file_path = os.path.join(service.music_dir, f"{song_id}.mp3")
-        image_file_path = os.path.join(service.image_dir, f"{song_id}.jpg")
-
-        if os.path.exists(mp3_file_path):
-            os.remove(mp3_file_path)
-        else:
+        mp3_file = await service.find_file(service.music_dir, song_id)
+        if mp3_file is None:
             raise HTTPException(status_code=404, detail="MP3 file not found")
+        await remove_stored_file(service.music_dir, song_id, mp3_file.path)
+        await service.run_in_executor(ExecutorRegistry.FILE, service.song_index.remove, song_id)
 
-        if os.path.exists(image_file_path):
-            os.remove(image_file_path)
-        else:
+        image_file = await service.find_file(service.image_dir, song_id)
+        if image_file is None:
             raise HTTPException(status_code=404, detail="Image file not found")
+        await remove_stored_file(service.image_dir, song_id, image_file.path)
+        await forget_image(song_id)
     except HTTPException:
         raise
     except Exception as e:
@@ -124,45 +369,21 @@ async def delete_file(song_id: str):
         raise HTTPException(status_code=500, detail=f"Error deleting files: {e}")
 
     return {"detail": "Files deleted successfully"}
-@app.get("/download/song")
-async def download_file(song_id: str):
+async def fetch_song_md5(song_id: str) -> str:
     """
-    :param song_id: The ID of the song to be downloaded.
-    :return: Returns a StreamingResponse object that streams the file for download.
-
-    This method is used to download a song file based on its ID. It first checks if the song ID is valid, and then searches for the file location in the music directory. If the file is found
-    *, it checks the MD5 checksum of the file against the one stored in the database. If the checksums match, it creates a StreamingResponse object to stream the file for download. The file
-    * is streamed in chunks of 64KB.
-
-    If the song ID is invalid or the file is not found, a HTTPException is raised with the appropriate status code (400 or 404). If there is an error retrieving the song information from
-    * the database or calculating the MD5 checksum, a HTTPException is raised with a status code of 500.
-
-    The content-disposition header of the response is set to suggest the original file name for download.
+    Retrieve the MD5 hash of a song from the database service.
 
-    Example usage:
-
-        response = download_file(song_id="123")
-        return response
+    :param song_id: The ID of the song.
+    :return: The MD5 hash of the song.
+    :raises HTTPException 404: If the song or its MD5 is not found in the database.
+    :raises HTTPException 500: If the database cannot be reached.
     """
-    if song_id is None or song_id == "":
-        raise HTTPException(status_code=400, detail="Invalid Request")
-
-    # Find file with song_id, exclude the extension and return any file with that name
-    file_location = [f for f in os.listdir(service.music_dir) if f.split(".")[0] == song_id]
-    if len(file_location) == 0:
-        raise HTTPException(status_code=404, detail="No Songs Found")
-
-    file_location = os.path.join(service.music_dir, file_location[0])
-
-    if not os.path.exists(file_location):
-        raise HTTPException(status_code=404, detail="File not found")
-
-    # check if md5 is the same as the one in the database
-    # if not, return error
     try:
         db_service = await service.get_service_url(ServiceType.DATABASE_SERVICE)
         song = await service.service_exception_handling(
             db_service, "songs/song", "GET", params={"song_id": song_id})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -173,29 +394,175 @@ async def download_file(song_id: str):
 
     if md5 is None:
         raise HTTPException(status_code=404, detail="MD5 not found")
+    return md5
+
+
+async def verify_song_md5(song_id: str, file_location: str):
+    """
+    Check the MD5 hash and size of a song file against the ones recorded in the song index when it was uploaded.
+
+    Songs uploaded before the song index existed are looked up in the database once and then recorded, so downloads
+    only wait on the local disk. The song index is reconciled with the database in the background.
+
+    :param song_id: The ID of the song.
+    :param file_location: The path to the song file.
+    :return: None
+    :raises HTTPException 404: If the song is not indexed and its MD5 is not found in the database.
+    :raises HTTPException 422: If the file does not match the recorded size or MD5.
+    :raises HTTPException 500: If the song index or the database cannot be read or the file cannot be hashed.
+    """
     try:
-        file_md5 = await service.calculate_md5(file_location)
+        metadata = await service.run_in_executor(ExecutorRegistry.FILE, service.song_index.get, song_id)
+        file_size = os.path.getsize(file_location)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if metadata is None:
+        md5 = await fetch_song_md5(song_id)
+        try:
+            await service.run_in_executor(ExecutorRegistry.FILE, service.song_index.put, song_id, md5, file_size,
+                                          time.time())
+        except Exception as e:
+            logger.error(f"Error indexing song {song_id}: {e}")
+    else:
+        md5, size = metadata
+        if file_size != size:
+            raise HTTPException(status_code=422, detail="Size mismatch")
+
+    try:
+        # only hashes the file if it changed since it was last verified
+        file_md5 = await service.md5_cache.get_md5(file_location)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if file_md5 != md5:
+        raise HTTPException(status_code=422, detail="MD5 mismatch")
+
 
-        if file_md5 != md5:
-            raise HTTPException(status_code=422, detail="MD5 mismatch")
+async def cache_headers(path: str, mtime: float, stored_md5: Optional[str] = None,
+                        hash_missing: bool = True) -> dict:
+    """
+    Build the validator and caching headers of a stored file. Stored files never change under the same ID, so
+    clients may cache them for as long as they like.
+
+    The ETag is taken from the MD5 cache if the file did not change since it was last hashed, or else from the
+    stored hash given, so answering a conditional or range request does not read the file. The file is only hashed
+    if neither is known and `hash_missing` is set.
+
+    :param path: The path to the file.
+    :param mtime: The modification time of the file.
+    :param stored_md5: Optional. The MD5 hash recorded for the file, such as the song index's.
+    :param hash_missing: Whether to hash the file if its MD5 hash is not known. If not, the ETag is left out.
+    :return: A dictionary with a strong ETag derived from the file's MD5 hash if it is known, Last-Modified and
+             Cache-Control.
+    :raises HTTPException 500: If the file cannot be hashed.
+    """
+    try:
+        md5 = service.md5_cache.peek(path) or stored_md5
+        if md5 is None and hash_missing:
+            # only hashes the file if it changed since it was last hashed
+            md5 = await service.md5_cache.get_md5(path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    # Asynchronous generator to stream the file
-    async def file_streamer(filepath):
-        async with aiofiles.open(filepath, "rb") as file:
-            chunk = await file.read(64 * 1024)  # Read in chunks of 64KB
-            while chunk:
-                yield chunk
-                chunk = await file.read(64 * 1024)
+    headers = {"Last-Modified": http_date(mtime), "Cache-Control": service.CACHE_CONTROL}
+    if md5 is not None:
+        headers["ETag"] = f'"{md5}"'
+    return headers
+
+
+@app.get("/download/song")
+async def download_file(request: Request, song_id: str):
+    """
+    :param request: The incoming request, whose Range and If-Range headers select the bytes to send, and whose
+                    If-None-Match and If-Modified-Since headers make the download conditional.
+    :param song_id: The ID of the song to be downloaded.
+    :return: Returns a FileRangeResponse object that sends the file, or the requested part of it, for download, or
+             an empty 304 Not Modified response if the client's copy is current.
+
+    This method is used to download a song file based on its ID. It first checks if the song ID is valid, and then searches for the file location in the music directory. If the file is found
+    *, it checks the MD5 checksum and size of the file against the ones recorded in the song index when it was uploaded, without asking the database; the file is only rehashed if its inode, size or modification time changed since it was last verified. If the checksums match, it creates a FileRangeResponse object to send the file for download, with sendfile when the server supports it.
+
+    Responses carry a strong ETag derived from the file's MD5 hash, Last-Modified and a long-lived Cache-Control header. If the If-None-Match or If-Modified-Since header shows the
+    * client already has the file, a 304 Not Modified response is sent without the file. The ETag comes from the MD5 cache or the song index, so conditional and range requests never
+    * read the whole file to build it. Only a plain download of a file whose hash is unknown hashes it, when it is verified anyway, and other requests for such a file are sent without
+    * an ETag.
+
+    A single byte range may be requested with the Range header, in which case only those bytes are read and sent with a 206 Partial Content status, so seeking and resuming cost only the
+    * bytes requested. Range requests skip the MD5 check, which would read the whole file, and every request skips it when
+    * `service.verify_downloads` is off, leaving corrupted files to the background scrubber. If an If-Range header is sent and matches neither the file's ETag nor its Last-Modified date, the
+    * whole file is sent instead. A request for several ranges, or a range starting past the end of the file, is rejected with a 416 status.
+
+    If the song ID is invalid or the file is not found, a HTTPException is raised with the appropriate status code (400 or 404). If there is an error retrieving the song information from
+    * the song index or the database or calculating the MD5 checksum, a HTTPException is raised with a status code of 500.
+
+    The content-disposition header of the response is set to suggest the original file name for download.
+
+    Example usage:
+
+        response = download_file(request, song_id="123")
+        return response
+    """
+    if song_id is None or song_id == "":
+        raise HTTPException(status_code=400, detail="Invalid Request")
+
+    # Find the file with song_id whatever its extension, from the index of the music directory
+    song_file = await service.find_file(service.music_dir, song_id)
+    if song_file is None:
+        raise HTTPException(status_code=404, detail="No Songs Found")
+
+    file_location = song_file.path
+    size = song_file.size
+    try:
+        metadata = await service.run_in_executor(ExecutorRegistry.FILE, service.song_index.get, song_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    # a recorded hash only stands for the file while the sizes agree
+    stored_md5 = metadata[0] if metadata is not None and metadata[1] == size else None
+    # a plain download is hashed anyway when it is verified, but otherwise the ETag must not cost a read of the file
+    plain = not any(header in request.headers for header in ("range", "if-none-match", "if-modified-since"))
+    validators = await cache_headers(file_location, song_file.mtime, stored_md5,
+                                     hash_missing=plain and service.verify_downloads)
+    etag = validators.get("ETag")
+    if is_not_modified(request.headers, etag, song_file.mtime):
+        return Response(status_code=304, headers=validators)
+
+    # a range only applies to the version of the file the client already has part of
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range == validators["Last-Modified"] or (etag is not None and
+                                                                      etag_matches(if_range, etag, weak=False)):
+        try:
+            byte_range = parse_range_header(request.headers.get("range"), size)
+        except ValueError as e:
+            raise HTTPException(status_code=416, detail=str(e), headers={"Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        if service.verify_downloads:
+            await verify_song_md5(song_id, file_location)
+        start, end = 0, size - 1
+    else:
+        start, end = byte_range
 
     # Get the original file name to suggest as download name
     file_name = os.path.basename(file_location)
 
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(end - start + 1),
+        "Content-Disposition": f"attachment; filename={file_name}",
+        **validators,
+    }
+    if byte_range is not None:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
     try:
-        # Create the StreamingResponse, setting the media type and content-disposition header for download
-        response = StreamingResponse(file_streamer(file_location), media_type="application/octet-stream")
-        response.headers["Content-Disposition"] = f"attachment; filename={file_name}"
+        # Create the response, setting the media type and content-disposition header for download. The file is sent
+        # with sendfile when the server supports it, and read in large chunks on the file pool otherwise
+        response = FileRangeResponse(file_location, end - start + 1, offset=start,
+                                     status_code=200 if byte_range is None else 206,
+                                     media_type="application/octet-stream", headers=headers,
+                                     executor=service.executors.get(ExecutorRegistry.FILE))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -203,43 +570,295 @@ async def download_file(song_id: str):
 
 
 @app.get("/download/image")
-async def download_image(id: str):
+async def download_image(request: Request, id: str, size: Optional[int] = None):
     """
+    :param request: The incoming request, whose If-None-Match and If-Modified-Since headers make the download
+                    conditional.
     :param id: The ID of the image to be downloaded.
-    :return: The image file as a FileResponse object.
+    :param size: Optional. The size in pixels of the longest side of a thumbnail to download instead of the image,
+                 one of `service.THUMBNAIL_SIZES`.
+    :return: The image file as a FileRangeResponse object, or from memory as a Response object, or an empty 304 Not
+             Modified response if the client's copy is current.
 
     The `download_image` method is an asynchronous function that is used to download an image file based on its ID. It takes in a single parameter `id`, which represents the ID of the image
     * to be downloaded.
 
     The method first checks if the `id` parameter is None. If it is, it raises an HTTPException with a status code of 400 and the detail message "Invalid Request".
 
-    Next, the method attempts to find the file location of the image based on the provided ID. It searches for files in the `service.image_dir` directory and checks if the file's name matches
-    * the ID. If no file is found, it raises an HTTPException with a status code of 404 and the detail message "File not found".
+    Next, the method looks up the image with the provided ID in the index of the `service.image_dir` directory, which only lists the directory if it changed since it was last indexed. If no
+    * file is found, it raises an HTTPException with a status code of 404 and the detail message "No Images Found".
+
+    Finally, if all checks pass, the method returns the image file as a FileRangeResponse object, which allows the file to be downloaded by the client. The response carries a strong
+    * ETag derived from the image's MD5 hash, Last-Modified and a long-lived Cache-Control header, so pages listing many songs only fetch each cover once. If the If-None-Match or
+    * If-Modified-Since header shows the client already has the image, a 304 Not Modified response is sent without it.
 
-    If a matching file is found, the method constructs the full file location path by joining the `service.image_dir` directory path and the file name. It then checks if the image file actually
-    * exists at the constructed file location. If the file does not exist, it raises an HTTPException with a status code of 404 and the detail message "Image not found".
+    If a `size` is given, the thumbnail of that size is sent instead, a WebP image generated in the background when the image was uploaded. Images stored before thumbnails
+    * were generated get theirs on the first request for one. If thumbnails cannot be generated, because Pillow is not installed or the image cannot be decoded, the full image is sent
+    * with an ETag of its own and `service.FALLBACK_CACHE_CONTROL`, so clients revalidate it and switch to the thumbnail once it exists.
 
-    Finally, if all checks pass, the method returns the image file as a FileResponse object, which allows the file to be downloaded by the client.
+    Images requested repeatedly are kept in memory with their headers by `service.image_cache`, up to its byte budget, and served without looking them up or reading them from disk.
+    * Uploading or deleting a song drops its image from the cache.
 
     Note: This method may raise an HTTPException with a status code of 500 and an error message if any unexpected exceptions occur during the execution of the method.
     """
-    if id is None or id == "":
+    if id is None or id == "" or (size is not None and size not in service.THUMBNAIL_SIZES):
         raise HTTPException(status_code=400, detail="Invalid Request")
-    try:
-        file_location = [f for f in os.listdir(service.image_dir) if f.split(".")[0] == id]
 
-        if len(file_location) == 0:
+    cached = service.image_cache.get((id, size))
+    if cached is not None:
+        if is_not_modified(request.headers, cached.headers["ETag"], cached.mtime):
+            return Response(status_code=304, headers=cached.headers)
+        return Response(cached.content, media_type=cached.media_type, headers=cached.headers)
+
+    # an upload or deletion while the image is read discards it rather than caching a stale copy
+    version = service.image_cache.version
+    try:
+        image_file = await service.find_file(service.image_dir, id)
+        if image_file is None:
             raise HTTPException(status_code=404, detail="No Images Found")
+        thumbnail = await service.find_thumbnail(id, size) if size is not None else None
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if thumbnail is not None:
+        image_file = thumbnail
+    validators = await cache_headers(image_file.path, image_file.mtime)
+    if size is not None and thumbnail is None:
+        # the full image stands in for the thumbnail, under its own ETag and only until the thumbnail exists
+        validators["ETag"] = f'{validators["ETag"][:-1]}-{size}"'
+        validators["Cache-Control"] = service.FALLBACK_CACHE_CONTROL
+    admitted = service.image_cache.admits((id, size), image_file.size)
+    if is_not_modified(request.headers, validators["ETag"], image_file.mtime):
+        return Response(status_code=304, headers=validators)
+
+    media_type = guess_type(image_file.path)[0] or "application/octet-stream"
+    if admitted:
+        try:
+            content = await service.run_in_executor(ExecutorRegistry.FILE, read_file, image_file.path)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        service.image_cache.put((id, size), CachedImage(content, media_type, validators, image_file.mtime), version)
+        return Response(content, media_type=media_type, headers=validators)
+
+    return FileRangeResponse(image_file.path, image_file.size, headers=validators, media_type=media_type,
+                             executor=service.executors.get(ExecutorRegistry.FILE))
+
+
+def read_file(path: str) -> bytes:
+    """
+    :param path: The path to the file.
+    :return: The contents of the file.
+    """
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def read_and_hash(fd: int, length: int, offset: int, hash_md5):
+    """
+    Read part of a file and add it to a running MD5 hash, on the file I/O pool.
+
+    :param fd: The file descriptor to read from.
+    :param length: The number of bytes to read.
+    :param offset: The offset to read from.
+    :param hash_md5: The running MD5 hash of the file, or None if it is not being hashed.
+    :return: The bytes read.
+    """
+    chunk = os.pread(fd, length, offset)
+    if hash_md5 is not None:
+        hash_md5.update(chunk)
+    return chunk
+
+
+def archive_name(name: str) -> str:
+    """
+    :param name: A name for an archive entry, such as a song name.
+    :return: The name with path separators and control characters replaced, so it cannot escape the archive.
+    """
+    return re.sub(r'[\\/\x00-\x1f]', "_", name).strip(". ") or "_"
+
+
+async def find_bundle_files(entries) -> list:
+    """
+    :param entries: A list of tuples of the ID of each song and its name in the archive, without extension.
+    :return: A list of tuples of the ID, file and archive entry name of each song.
+    :raises HTTPException 404: If a song is not stored, listing all the songs that are not.
+    """
+    files = []
+    missing = []
+    for song_id, name in entries:
+        song_file = await service.find_file(service.music_dir, song_id)
+        if song_file is None:
+            missing.append(song_id)
+            continue
+        files.append((song_id, song_file, f"{name}.{song_file.extension}"))
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Songs not found: {', '.join(missing)}")
+    return files
+
+
+async def bundle_response(files: list, expected_md5s: dict, format: str, file_name: str) -> StreamingResponse:
+    """
+    Stream an archive of stored songs, read sequentially in `service.UPLOAD_CHUNK_SIZE` chunks and encoded as they
+    are read, so memory use is constant and nothing is staged on disk.
+
+    When `service.verify_downloads` is on, each song is checked against its expected MD5 hash like a single download.
+    Songs whose hash is cached are checked before the response starts. The others are hashed in the same pass as
+    they are sent, and a mismatch aborts the archive, so the client never receives a complete but corrupted one.
+
+    :param files: The songs to send, as returned by `find_bundle_files`.
+    :param expected_md5s: The expected MD5 hash of each song, by song ID.
+    :param format: The archive format, "zip" or "tar".
+    :param file_name: The name to suggest for the archive, without extension.
+    :return: The streaming response.
+    :raises HTTPException 404: If the expected MD5 hash of a song is unknown.
+    :raises HTTPException 422: If a song does not match its cached MD5 hash.
+    """
+    # None means the song is sent without being hashed
+    to_hash = {}
+    if service.verify_downloads:
+        for song_id, song_file, _ in files:
+            expected = expected_md5s.get(song_id)
+            if expected is None:
+                raise HTTPException(status_code=404, detail=f"MD5 not found for {song_id}")
+            cached = service.md5_cache.peek(song_file.path)
+            if cached is None:
+                to_hash[song_id] = expected
+            elif cached != expected:
+                raise HTTPException(status_code=422, detail=f"MD5 mismatch for {song_id}")
+
+    async def stream():
+        archive = ArchiveStream(format)
+        try:
+            for song_id, song_file, name in files:
+                yield archive.begin_entry(name, song_file.size, song_file.mtime)
+                expected = to_hash.get(song_id)
+                hash_md5 = hashlib.md5() if expected is not None else None
+                fd = os.open(song_file.path, os.O_RDONLY)
+                try:
+                    if hasattr(os, "posix_fadvise"):
+                        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                    offset = 0
+                    while offset < song_file.size:
+                        chunk = await service.run_in_executor(
+                            ExecutorRegistry.FILE, read_and_hash, fd,
+                            min(service.UPLOAD_CHUNK_SIZE, song_file.size - offset), offset, hash_md5)
+                        if not chunk:
+                            raise RuntimeError(f"{song_file.path} was truncated while it was sent")
+                        offset += len(chunk)
+                        yield archive.write(chunk)
+                finally:
+                    os.close(fd)
+                if hash_md5 is not None:
+                    if hash_md5.hexdigest() != expected:
+                        raise RuntimeError(f"MD5 mismatch for {song_id}, aborting the archive")
+                    service.md5_cache.record(song_file.path, expected)
+                yield archive.end_entry()
+            yield archive.close()
+        except BaseException:
+            archive.abort()
+            raise
+
+    headers = {"Content-Disposition": f"attachment; filename={file_name}.{format}"}
+    length = ArchiveStream.content_length(
+        format, ((name, song_file.size, song_file.mtime) for _, song_file, name in files))
+    if length is not None:
+        headers["Content-Length"] = str(length)
+    return StreamingResponse(stream(), media_type=ArchiveStream.FORMATS[format], headers=headers)
+
+
+@app.get("/download/bundle")
+async def download_bundle(ids: List[str] = Query(...), format: str = "zip"):
+    """
+    Download several songs as a single zip or tar archive, streamed as it is built.
+
+    :param ids: The IDs of the songs, as repeated or comma separated values.
+    :param format: The archive format, "zip" or "tar".
+    :return: A streaming response sending the archive, with the songs named by their IDs in the order given.
+    :raises HTTPException 400: If no or more than `service.BUNDLE_MAX_SONGS` songs are requested, or the format is
+                               not supported.
+    :raises HTTPException 404: If a song is not stored or its expected MD5 hash is unknown.
+    :raises HTTPException 422: If a song does not match its cached MD5 hash.
+    """
+    song_ids = list(dict.fromkeys(song_id for value in ids for song_id in value.split(",") if song_id))
+    if not song_ids or len(song_ids) > service.BUNDLE_MAX_SONGS or format not in ArchiveStream.FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid Request")
+
+    files = await find_bundle_files([(song_id, song_id) for song_id in song_ids])
+    expected_md5s = await service.expected_md5s(song_ids) if service.verify_downloads else {}
+    return await bundle_response(files, expected_md5s, format, "songs")
+
 
-        file_location = os.path.join(service.image_dir, file_location[0])
-        if not os.path.exists(file_location):
-            raise HTTPException(status_code=404, detail="Image not found")
+@app.get("/download/playlist")
+async def download_playlist(playlist_id: str, format: str = "zip"):
+    """
+    Download the songs of a playlist as a single zip or tar archive, streamed as it is built. The songs are named by
+    their position, artist and name, in playlist order, and checked against the MD5 hashes the database returns with
+    the playlist.
+
+    Only songs stored by this file service can be bundled. With several file services, the ring places a playlist's
+    songs on different ones, and this returns a 404 listing the songs stored elsewhere.
+
+    :param playlist_id: The ID of the playlist.
+    :param format: The archive format, "zip" or "tar".
+    :return: A streaming response sending the archive.
+    :raises HTTPException 400: If the playlist ID or the format is invalid, or the playlist has more than
+                               `service.BUNDLE_MAX_SONGS` songs.
+    :raises HTTPException 404: If the playlist is empty or a song is not stored.
+    :raises HTTPException 422: If a song does not match its cached MD5 hash.
+    :raises HTTPException 500: If the database cannot be reached.
+    """
+    if not playlist_id or format not in ArchiveStream.FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid Request")
+    try:
+        db_service = await service.get_service_url(ServiceType.DATABASE_SERVICE)
+        songs, _ = await service.service_exception_handling(db_service, "playlists/playlist/songs", "GET",
+                                                            params={"playlist_id": playlist_id})
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    return FileResponse(file_location)
+    if not songs:
+        raise HTTPException(status_code=404, detail="Playlist is empty")
+    if len(songs) > service.BUNDLE_MAX_SONGS:
+        raise HTTPException(status_code=400, detail="Playlist is too large to bundle")
+
+    entries = [(song["song_id"], archive_name(f"{position:02d} - {song['artist']} - {song['song_name']}"))
+               for position, song in enumerate(songs, start=1)]
+    files = await find_bundle_files(entries)
+    expected_md5s = {song["song_id"]: song["md5"] for song in songs}
+    return await bundle_response(files, expected_md5s, format, archive_name(playlist_id))
+
+
+@app.post("/replication/missing")
+async def get_missing_replicas(song_ids: SongIds):
+    """
+    Check which of the given songs this file service is missing, so another file service can copy them here.
+
+    :param song_ids: The IDs of the songs the ring places on this file service.
+    :return: A dictionary with the IDs of the songs whose MP3 or image file is not stored here.
+    """
+    missing = []
+    for song_id in song_ids.song_ids:
+        if await service.find_file(service.music_dir, song_id) is None or \
+                await service.find_file(service.image_dir, song_id) is None:
+            missing.append(song_id)
+    return {"missing": missing}
+
+
+@app.post("/replication/repair")
+async def repair_replicas():
+    """
+    Start copying the songs stored here to the file services the ring places them on that are missing them, as
+    requested by the main service when a file service leaves the ring.
+
+    :return: A dictionary with the detail of the request.
+    """
+    if service.start_replica_repair():
+        return {"detail": "Replica repair started"}
+    return {"detail": "Replica repair already running"}
 
 
 @app.get("/stop")
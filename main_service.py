@@ -98,6 +98,36 @@ async def get_services():
     return {"services": [service.to_dict() for service in service.services.values()]}
 
 
+@app.get("/file_ring")
+async def get_file_ring():
+    """
+    Retrieve the consistent-hash ring placing song IDs on the file services, so services can find the replicas of a
+    song without asking for each one.
+
+    :return: A dictionary with the URLs of the file services on the ring, the replication factor and the number of
+             virtual nodes per file service.
+    """
+    return service.file_ring_data()
+
+
+@app.get("/file_ring/placement")
+async def get_file_placement(key: str):
+    """
+    Retrieve the file services storing a song.
+
+    :param key: The ID of the song.
+    :return: A dictionary with the song ID and the URLs of the file services storing it, the primary first.
+    :raises HTTPException: If the request is invalid (400) or there are no file services (404).
+    """
+    if key is None or key == "":
+        raise HTTPException(status_code=400, detail="Invalid Request")
+
+    nodes = service.file_ring.get_nodes(key, service.file_replication_factor)
+    if not nodes:
+        raise HTTPException(status_code=404, detail="No file services found")
+    return {"key": key, "nodes": nodes}
+
+
 @app.get("/secret_key")
 async def get_secret_key():
     """
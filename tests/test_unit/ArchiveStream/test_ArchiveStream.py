@@ -0,0 +1,55 @@
+import io
+import tarfile
+import unittest
+import zipfile
+
+from classes.ArchiveStream import ArchiveStream
+
+ENTRIES = [("01 - song.mp3", b"Fake MP3 data" * 100, 1700000000), ("02 - song.mp3", b"x", 1700000000)]
+
+
+def build(format):
+    archive = ArchiveStream(format)
+    parts = []
+    for name, data, mtime in ENTRIES:
+        parts.append(archive.begin_entry(name, len(data), mtime))
+        # written in several chunks, as read from disk
+        parts.extend(archive.write(data[start:start + 100]) for start in range(0, len(data), 100))
+        parts.append(archive.end_entry())
+    parts.append(archive.close())
+    return b"".join(parts)
+
+
+class TestArchiveStream(unittest.TestCase):
+    def test_zip_entries_are_stored(self):
+        with zipfile.ZipFile(io.BytesIO(build("zip"))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual([info.compress_type for info in archive.infolist()], [zipfile.ZIP_STORED] * 2)
+            self.assertEqual([archive.read(name) for name, _, _ in ENTRIES], [data for _, data, _ in ENTRIES])
+
+    def test_tar_matches_its_content_length(self):
+        data = build("tar")
+
+        self.assertEqual(len(data), ArchiveStream.content_length(
+            "tar", [(name, len(content), mtime) for name, content, mtime in ENTRIES]))
+        with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+            self.assertEqual([archive.extractfile(name).read() for name, _, _ in ENTRIES],
+                             [content for _, content, _ in ENTRIES])
+
+    def test_zip_length_is_unknown(self):
+        self.assertIsNone(ArchiveStream.content_length("zip", []))
+
+    def test_abort_mid_entry(self):
+        archive = ArchiveStream("zip")
+        archive.begin_entry("song.mp3", 10, 1700000000)
+        archive.write(b"12345")
+        archive.abort()
+        self.assertIsNone(archive._entry)
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            ArchiveStream("rar")
+
+
+if __name__ == '__main__':
+    unittest.main()
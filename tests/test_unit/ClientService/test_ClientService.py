@@ -3,7 +3,7 @@ import hashlib
 import unittest
 from unittest.mock import AsyncMock, patch
 
-from fastapi import UploadFile  # Assuming UploadFile is from FastAPI
+from fastapi import HTTPException, UploadFile  # Assuming UploadFile is from FastAPI
 
 from classes.services.ClientService import ClientService, ServiceType, logger
 
@@ -75,3 +75,33 @@ class TestClientService(unittest.IsolatedAsyncioTestCase):
 
         # Assuming self.service_url is defined and has a fallback value
         self.assertEqual(result, service.service_url)
+
+    @patch('os.path.isdir', return_value=True)
+    @patch('builtins.open', unittest.mock.mock_open(
+        read_data='{"main_service_url": "http://example.com"}'))
+    async def test_upload_resumable_resends_only_missing_bytes(self, mock_isdir):
+        service = ClientService()
+        service.UPLOAD_CHUNK_SIZE = 4
+        content = b"0123456789"
+        received = bytearray()
+        sent = []
+
+        async def mock_service_exception_handling(url, endpoint, method, params=None, content=None, **kwargs):
+            if method == "POST":
+                return {"upload_id": "u1", "offset": 0}, 201
+            if method == "GET":
+                return {"upload_id": "u1", "offset": len(received)}, 200
+            sent.append(content)
+            if len(sent) == 2:
+                # the connection drops after half of the second chunk reached the file service
+                received.extend(content[:2])
+                raise HTTPException(status_code=500, detail="Connection reset")
+            received.extend(content)
+            return {"upload_id": "u1", "offset": len(received)}, 200
+
+        with patch.object(service, "service_exception_handling", side_effect=mock_service_exception_handling):
+            upload_id = await service.upload_resumable("file.com", content, "md5")
+
+        self.assertEqual(upload_id, "u1")
+        self.assertEqual(bytes(received), content)
+        self.assertEqual(sent, [b"0123", b"4567", b"6789"])
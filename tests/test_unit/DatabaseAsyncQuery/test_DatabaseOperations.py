@@ -39,7 +39,8 @@ class TestDatabaseOperations(unittest.IsolatedAsyncioTestCase):
 
         # Assertions
         mock_cursor.execute.assert_called_with(
-            "INSERT INTO users (username, password, salt, email) VALUES (?, ?, ?, ?)",
+            "INSERT INTO users (username, password, salt, email) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT DO NOTHING RETURNING username",
             ("test_user", "password123", "salt123", "test@example.com")
         )
         self.assertTrue(mock_conn.commit.called)
@@ -80,7 +81,7 @@ class TestDatabaseOperations(unittest.IsolatedAsyncioTestCase):
     async def test_create_song(self, mock_connect, mock_run_in_executor):
         mock_conn = MagicMock()
         mock_cursor = MagicMock()
-        mock_cursor.lastrowid = 1  # Simulate successful row insertion
+        mock_cursor.fetchall.return_value = [("song_id",)]  # Simulate successful row insertion
         mock_connect.return_value = mock_conn
         mock_conn.cursor.return_value = mock_cursor
 
@@ -89,9 +90,10 @@ class TestDatabaseOperations(unittest.IsolatedAsyncioTestCase):
         mock_run_in_executor.side_effect = async_wrapper
 
         result = await create_song("song_id", "song_name", "artist", "md5hash", "test_user")
-        self.assertTrue(result)
+        self.assertEqual(result, "song_id")
         mock_cursor.execute.assert_called_with(
-            "INSERT INTO songs (song_id, song_name, artist, md5, username) VALUES (?, ?, ?, ?, ?)",
+            "INSERT INTO songs (song_id, song_name, artist, md5, username) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT DO NOTHING RETURNING song_id",
             ("song_id", "song_name", "artist", "md5hash", "test_user")
         )
 
@@ -228,8 +230,10 @@ class TestDatabaseOperations(unittest.IsolatedAsyncioTestCase):
 
         result = await add_song_to_playlist("playlist_id", "song_id")
         self.assertTrue(result)
-        mock_cursor.execute.assert_called_with("INSERT INTO playlist_songs (playlist_id, song_id) VALUES (?, ?)",
-                                               ("playlist_id", "song_id"))
+        mock_cursor.execute.assert_called_with(
+            "INSERT INTO playlist_songs (playlist_id, song_id, position) VALUES (?, ?, "
+            "(SELECT COALESCE(MAX(position) + 1, 0) FROM playlist_songs WHERE playlist_id = ?))",
+            ("playlist_id", "song_id", "playlist_id"))
 
     @patch('utils.DatabaseAsyncQuery.run_in_executor', new_callable=MagicMock)
     @patch('sqlite3.connect')
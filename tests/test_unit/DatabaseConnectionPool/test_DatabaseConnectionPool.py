@@ -0,0 +1,54 @@
+import os
+import sqlite3
+import threading
+import unittest
+from tempfile import TemporaryDirectory
+
+from classes.DatabaseConnectionPool import DatabaseConnectionPool
+
+
+class TestDatabaseConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.pool = DatabaseConnectionPool(os.path.join(self.tmp_dir.name, "test.db"))
+        self.pool.open()
+
+    def tearDown(self):
+        self.pool.close()
+        self.tmp_dir.cleanup()
+
+    def test_open_enables_wal(self):
+        with self.pool.writer() as conn:
+            mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode.lower(), "wal")
+
+    def test_reader_is_reused_per_thread(self):
+        self.assertIs(self.pool.reader(), self.pool.reader())
+
+        readers = []
+        thread = threading.Thread(target=lambda: readers.append(self.pool.reader()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(readers[0], self.pool.reader())
+
+    def test_reader_is_read_only(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            self.pool.reader().execute("CREATE TABLE test (id TEXT)")
+
+    def test_writer_rolls_back_on_error(self):
+        with self.pool.writer() as conn:
+            conn.execute("CREATE TABLE test (id TEXT)")
+            conn.commit()
+
+        with self.assertRaises(ValueError):
+            with self.pool.writer() as conn:
+                conn.execute("INSERT INTO test (id) VALUES ('a')")
+                raise ValueError()
+
+        self.assertEqual(self.pool.reader().execute("SELECT COUNT(*) FROM test").fetchone()[0], 0)
+
+    def test_close_rejects_new_connections(self):
+        self.pool.close()
+        self.assertFalse(self.pool.is_open)
+        with self.assertRaises(RuntimeError):
+            self.pool.reader()
@@ -0,0 +1,122 @@
+import os
+import sqlite3
+import unittest
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from utils import DatabaseAsyncQuery
+from utils.DatabaseMigrations import MIGRATIONS, apply_migrations_sync, get_schema_version
+
+
+class TestDatabaseMigrations(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.database_file = os.path.join(self.tmp_dir.name, "media_db.db")
+        self.patcher = patch.object(DatabaseAsyncQuery, "DATABASE_FILE", self.database_file)
+        self.patcher.start()
+        DatabaseAsyncQuery.create_tables_sync()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.tmp_dir.cleanup()
+
+    def connect(self):
+        return sqlite3.connect(self.database_file)
+
+    def test_migrations_upgrade_existing_database(self):
+        conn = self.connect()
+        conn.executemany("INSERT INTO playlist_songs (playlist_id, song_id) VALUES (?, ?)",
+                         [("pl_1", "sg_1"), ("pl_1", "sg_2"), ("pl_1", "sg_1"), ("pl_2", "sg_1")])
+        conn.commit()
+        conn.close()
+
+        self.assertEqual(apply_migrations_sync(), MIGRATIONS[-1][0])
+
+        conn = self.connect()
+        rows = conn.execute("SELECT playlist_id, song_id, position FROM playlist_songs "
+                            "ORDER BY playlist_id, position").fetchall()
+        self.assertEqual(rows, [("pl_1", "sg_1", 0), ("pl_1", "sg_2", 1), ("pl_2", "sg_1", 0)])
+        with self.assertRaises(sqlite3.IntegrityError):
+            conn.execute("INSERT INTO playlist_songs (playlist_id, song_id, position) VALUES ('pl_1', 'sg_1', 5)")
+
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertTrue({"idx_songs_username_name_id", "idx_songs_artist_name_id", "idx_songs_name_id",
+                         "idx_users_email", "idx_playlist_songs_position"} <= indexes)
+        conn.close()
+
+    def test_migrations_are_only_applied_once(self):
+        apply_migrations_sync()
+        apply_migrations_sync()
+
+        conn = self.connect()
+        self.assertEqual(get_schema_version(conn), MIGRATIONS[-1][0])
+        conn.close()
+
+    def test_add_song_to_playlist_appends_position(self):
+        apply_migrations_sync()
+
+        DatabaseAsyncQuery.add_song_to_playlist_sync("pl_1", "sg_1")
+        DatabaseAsyncQuery.add_song_to_playlist_sync("pl_1", "sg_2")
+
+        self.assertEqual(DatabaseAsyncQuery.get_playlist_songs_sync("pl_1"), [("pl_1", "sg_1", 0), ("pl_1", "sg_2", 1)])
+
+    def test_full_text_index_follows_song_changes(self):
+        apply_migrations_sync()
+
+        DatabaseAsyncQuery.create_song_sync("sg_1", "Blue Monday", "New Order", "md5_1", "testuser")
+        DatabaseAsyncQuery.create_song_sync("sg_2", "Blue Moon", "Billie Holiday", "md5_2", "testuser")
+        DatabaseAsyncQuery.create_song_sync("sg_3", "Ceremony", "New Order", "md5_3", "testuser")
+
+        self.assertEqual({row[0] for row in DatabaseAsyncQuery.search_songs_sync("blu", 10)}, {"sg_1", "sg_2"})
+        self.assertEqual([row[0] for row in DatabaseAsyncQuery.search_songs_sync("new ord cere", 10)], ["sg_3"])
+        self.assertEqual(DatabaseAsyncQuery.search_songs_sync('"AND* (', 10), [])
+
+        conn = self.connect()
+        conn.execute("UPDATE songs SET song_name = 'Temptation' WHERE song_id = 'sg_1'")
+        conn.execute("DELETE FROM songs WHERE song_id = 'sg_2'")
+        conn.commit()
+        conn.close()
+
+        self.assertEqual(DatabaseAsyncQuery.search_songs_sync("blue", 10), [])
+        self.assertEqual([row[0] for row in DatabaseAsyncQuery.search_songs_sync("tempt", 10)], ["sg_1"])
+
+    def test_insert_songs_reports_duplicates(self):
+        apply_migrations_sync()
+        DatabaseAsyncQuery.create_song_sync("sg_1", "Blue Monday", "New Order", "md5_1", "testuser")
+
+        created = DatabaseAsyncQuery.commit_write(DatabaseAsyncQuery.insert_songs, [
+            ("sg_2", "Ceremony", "New Order", "md5_2", "testuser"),
+            ("sg_1", "Temptation", "New Order", "md5_3", "testuser"),
+            ("sg_3", "Blue Monday", "New Order", "md5_4", "testuser"),
+            ("sg_4", "Ceremony", "New Order", "md5_5", "testuser"),
+            ("sg_5", "Regret", "New Order", "md5_6", "testuser"),
+        ])
+
+        self.assertEqual(created, [True, False, False, False, True])
+        self.assertEqual(len(DatabaseAsyncQuery.get_songs_sync(None, "New Order")), 3)
+
+    def test_stream_songs_yields_batches_in_order(self):
+        apply_migrations_sync()
+        DatabaseAsyncQuery.commit_write(DatabaseAsyncQuery.insert_songs, [
+            (f"sg_{i}", f"Song {i:02d}", "New Order", f"md5_{i}", "testuser") for i in range(5)])
+
+        batches = list(DatabaseAsyncQuery.stream_songs(None, "New Order", batch_size=2))
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual([row[0] for batch in batches for row in batch], [f"sg_{i}" for i in range(5)])
+
+        cursor = DatabaseAsyncQuery.encode_songs_cursor("Song 02", "sg_2")
+        rows = [row for batch in DatabaseAsyncQuery.stream_songs(None, None, cursor=cursor) for row in batch]
+        self.assertEqual([row[0] for row in rows], ["sg_3", "sg_4"])
+
+    def test_create_song_and_user_skip_existing_rows(self):
+        apply_migrations_sync()
+
+        self.assertEqual(DatabaseAsyncQuery.create_user_sync("testuser", "hash", "salt", "a@b.c"), "testuser")
+        self.assertIsNone(DatabaseAsyncQuery.create_user_sync("testuser", "other", "salt", "d@e.f"))
+        self.assertEqual(DatabaseAsyncQuery.get_user_sync("testuser"), ("testuser", "a@b.c", "salt"))
+
+        self.assertEqual(DatabaseAsyncQuery.create_song_sync("sg_1", "Ceremony", "New Order", "md5_1", "testuser"),
+                         "sg_1")
+        self.assertIsNone(DatabaseAsyncQuery.create_song_sync("sg_2", "Ceremony", "New Order", "md5_2", "testuser"))
+        self.assertIsNone(DatabaseAsyncQuery.create_song_sync("sg_1", "Regret", "New Order", "md5_3", "testuser"))
+        self.assertEqual(len(DatabaseAsyncQuery.get_songs_sync(None, "New Order")), 1)
@@ -0,0 +1,56 @@
+import asyncio
+import os
+import sqlite3
+import unittest
+from tempfile import TemporaryDirectory
+
+from classes.DatabaseConnectionPool import DatabaseConnectionPool
+from classes.DatabaseWriteQueue import DatabaseWriteQueue
+
+
+def insert_row(conn, row_id):
+    conn.execute("INSERT INTO test (id) VALUES (?)", (row_id,))
+    return row_id
+
+
+class TestDatabaseWriteQueue(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.pool = DatabaseConnectionPool(os.path.join(self.tmp_dir.name, "test.db"))
+        self.pool.open()
+        with self.pool.writer() as conn:
+            conn.execute("CREATE TABLE test (id TEXT PRIMARY KEY)")
+            conn.commit()
+        self.write_queue = DatabaseWriteQueue(self.pool, max_batch_size=50, commit_latency=0.05)
+        self.write_queue.start()
+
+    async def asyncTearDown(self):
+        await self.write_queue.stop()
+        self.pool.close()
+        self.tmp_dir.cleanup()
+
+    async def test_writes_are_batched(self):
+        results = await asyncio.gather(*[self.write_queue.submit(insert_row, str(i)) for i in range(20)])
+
+        self.assertEqual(results, [str(i) for i in range(20)])
+        self.assertEqual(self.pool.reader().execute("SELECT COUNT(*) FROM test").fetchone()[0], 20)
+        stats = self.write_queue.stats()
+        self.assertEqual(stats["operations_committed"], 20)
+        self.assertLess(stats["batches_committed"], 20)
+
+    async def test_failed_write_only_affects_its_caller(self):
+        results = await asyncio.gather(self.write_queue.submit(insert_row, "a"),
+                                       self.write_queue.submit(insert_row, "a"),
+                                       self.write_queue.submit(insert_row, "b"),
+                                       return_exceptions=True)
+
+        self.assertEqual(results[0], "a")
+        self.assertIsInstance(results[1], sqlite3.IntegrityError)
+        self.assertEqual(results[2], "b")
+        self.assertEqual(self.pool.reader().execute("SELECT COUNT(*) FROM test").fetchone()[0], 2)
+        self.assertEqual(self.write_queue.stats()["operations_failed"], 1)
+
+    async def test_submit_after_stop_raises(self):
+        await self.write_queue.stop()
+        with self.assertRaises(RuntimeError):
+            await self.write_queue.submit(insert_row, "a")
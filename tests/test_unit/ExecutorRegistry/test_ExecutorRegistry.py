@@ -0,0 +1,41 @@
+import asyncio
+import threading
+import unittest
+
+from classes.ExecutorRegistry import ExecutorRegistry
+
+
+class TestExecutorRegistry(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.registry = ExecutorRegistry({ExecutorRegistry.DB: 2, ExecutorRegistry.CPU: 1})
+
+    async def asyncTearDown(self):
+        self.registry.shutdown()
+
+    async def test_pools_run_on_separate_threads(self):
+        db_thread = await self.registry.run(ExecutorRegistry.DB, lambda: threading.current_thread().name)
+        cpu_thread = await self.registry.run(ExecutorRegistry.CPU, lambda: threading.current_thread().name)
+
+        self.assertTrue(db_thread.startswith("db-pool"))
+        self.assertTrue(cpu_thread.startswith("cpu-pool"))
+
+    async def test_saturated_pool_does_not_block_other_pools(self):
+        release = threading.Event()
+        blocked = [asyncio.ensure_future(self.registry.run(ExecutorRegistry.CPU, release.wait)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(await self.registry.run(ExecutorRegistry.DB, sum, [1, 2]), 3)
+        stats = self.registry.stats()
+        self.assertEqual(stats[ExecutorRegistry.CPU]["active"], 1)
+        self.assertEqual(stats[ExecutorRegistry.CPU]["queue_depth"], 2)
+
+        release.set()
+        await asyncio.gather(*blocked)
+        stats = self.registry.stats()[ExecutorRegistry.CPU]
+        self.assertEqual((stats["queue_depth"], stats["completed"]), (0, 3))
+        self.assertGreater(stats["max_wait_ms"], 0)
+
+    async def test_unused_pool_reports_empty_stats(self):
+        self.assertEqual(self.registry.stats()[ExecutorRegistry.DB]["completed"], 0)
+        with self.assertRaises(KeyError):
+            self.registry.get(ExecutorRegistry.FILE)
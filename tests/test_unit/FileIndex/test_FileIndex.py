@@ -0,0 +1,66 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+from classes.FileIndex import FileIndex
+
+
+class TestFileIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.index = FileIndex(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, name, content=b"data"):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, "wb") as file:
+            file.write(content)
+        return path
+
+    def rescan(self):
+        self.index.replace(*self.index.scan())
+
+    def test_scan_indexes_files_by_id_and_skips_hidden_files(self):
+        path = self.write("sg_1.mp3")
+        self.write(".upload-abc.part")
+        self.write(".md5_index.json")
+
+        self.rescan()
+
+        entry = self.index.get("sg_1")
+        self.assertEqual((entry.path, entry.extension, entry.size), (path, "mp3", 4))
+        self.assertEqual(self.index.stats()["entries"], 1)
+        self.assertFalse(self.index.needs_scan())
+
+    def test_directory_change_requires_a_rescan(self):
+        self.rescan()
+        self.assertIsNone(self.index.get("sg_1"))
+
+        self.write("sg_1.flac")
+        os.utime(self.tmp_dir.name, ns=(0, 0))
+
+        self.assertTrue(self.index.needs_scan())
+        self.rescan()
+        self.assertEqual(self.index.get("sg_1").extension, "flac")
+
+    def test_deleted_file_is_dropped(self):
+        path = self.write("sg_1.mp3")
+        self.rescan()
+        os.remove(path)
+
+        self.assertIsNone(self.index.get("sg_1"))
+        self.assertEqual(self.index.stats()["entries"], 0)
+
+    def test_add_and_remove(self):
+        path = self.write("sg_1.mp3", b"longer data")
+        self.index.add("sg_1", path)
+        self.assertEqual(self.index.get("sg_1").size, 11)
+
+        self.index.remove("sg_1")
+        self.assertIsNone(self.index.get("sg_1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
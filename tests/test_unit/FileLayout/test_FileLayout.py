@@ -0,0 +1,62 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+from classes.FileIndex import FileIndex
+from utils.FileLayout import migrate_batch, shard_dir
+
+
+class TestFileLayout(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.directory = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(b"data")
+
+    def test_shard_dir(self):
+        path = shard_dir(self.directory, "sg_1", 2)
+        self.assertEqual(os.path.relpath(path, self.directory).count(os.sep), 1)
+        self.assertEqual(path, shard_dir(self.directory, "sg_1", 2))
+        self.assertEqual(shard_dir(self.directory, "sg_1", 0), self.directory)
+
+    def test_migrate_batch_moves_flat_files_in_batches(self):
+        for song_id in ("sg_1", "sg_2", "sg_3"):
+            self.write(os.path.join(self.directory, f"{song_id}.mp3"))
+        self.write(os.path.join(self.directory, ".md5_index.json"))
+
+        first = migrate_batch(self.directory, 2, 2)
+        second = migrate_batch(self.directory, 2, 2)
+
+        self.assertEqual((len(first), len(second)), (2, 1))
+        self.assertEqual(migrate_batch(self.directory, 2, 2), [])
+        for file_id, old_path, new_path in first + second:
+            self.assertEqual(new_path, os.path.join(shard_dir(self.directory, file_id, 2), f"{file_id}.mp3"))
+            self.assertFalse(os.path.exists(old_path))
+            self.assertTrue(os.path.exists(new_path))
+        self.assertEqual(os.listdir(self.directory).count(".md5_index.json"), 1)
+
+    def test_index_finds_files_before_and_after_migration(self):
+        flat_path = os.path.join(self.directory, "sg_1.mp3")
+        self.write(flat_path)
+        sharded_path = os.path.join(shard_dir(self.directory, "sg_2", 2), "sg_2.mp3")
+        self.write(sharded_path)
+
+        index = FileIndex(self.directory, 2)
+        index.replace(*index.scan())
+        self.assertEqual(index.get("sg_1").path, flat_path)
+        self.assertEqual(index.get("sg_2").path, sharded_path)
+
+        migrate_batch(self.directory, 2, 10)
+
+        self.assertIsNone(index.get("sg_1"))
+        self.assertEqual(index.find_in_shard("sg_1"), os.path.join(shard_dir(self.directory, "sg_1", 2), "sg_1.mp3"))
+
+
+if __name__ == '__main__':
+    unittest.main()
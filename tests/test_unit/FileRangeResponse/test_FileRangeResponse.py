@@ -0,0 +1,60 @@
+import asyncio
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+from classes.FileRangeResponse import FileRangeResponse
+
+
+class TestFileRangeResponse(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "sg_1.mp3")
+        self.content = os.urandom(FileRangeResponse.chunk_size * 2 + 10)
+        with open(self.path, "wb") as file:
+            file.write(self.content)
+        self.messages = []
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    async def receive(self):
+        await asyncio.Event().wait()
+
+    async def send(self, message):
+        if message["type"] == FileRangeResponse.ZERO_COPY_EXTENSION:
+            file = message["file"]
+            message = dict(message, body=os.pread(file.fileno(), message["count"], message["offset"]))
+        self.messages.append(message)
+
+    async def test_range_is_read_in_chunks_without_zero_copy(self):
+        offset, length = 5, FileRangeResponse.chunk_size + 100
+        response = FileRangeResponse(self.path, length, offset=offset, status_code=206)
+
+        await response({"type": "http", "method": "GET", "extensions": {}}, self.receive, self.send)
+
+        self.assertEqual(self.messages[0]["status"], 206)
+        self.assertIn((b"content-length", str(length).encode()), self.messages[0]["headers"])
+        bodies = self.messages[1:]
+        self.assertEqual([message["more_body"] for message in bodies], [True, False])
+        self.assertEqual(b"".join(message["body"] for message in bodies), self.content[offset:offset + length])
+
+    async def test_file_is_handed_to_the_server_with_zero_copy(self):
+        response = FileRangeResponse(self.path, len(self.content))
+
+        scope = {"type": "http", "method": "GET", "extensions": {FileRangeResponse.ZERO_COPY_EXTENSION: {}}}
+        await response(scope, self.receive, self.send)
+
+        self.assertEqual(len(self.messages), 2)
+        self.assertEqual(self.messages[1]["type"], FileRangeResponse.ZERO_COPY_EXTENSION)
+        self.assertEqual(self.messages[1]["body"], self.content)
+
+    async def test_truncated_file_raises(self):
+        response = FileRangeResponse(self.path, len(self.content) + 1)
+
+        with self.assertRaises(Exception):
+            await response({"type": "http", "method": "GET"}, self.receive, self.send)
+
+
+if __name__ == '__main__':
+    unittest.main()
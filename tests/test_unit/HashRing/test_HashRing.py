@@ -0,0 +1,46 @@
+import unittest
+
+from classes.HashRing import HashRing
+
+
+class TestHashRing(unittest.TestCase):
+    def setUp(self):
+        self.nodes = [f"localhost:{port}" for port in range(9001, 9006)]
+        self.keys = [f"sg_{i}" for i in range(2000)]
+
+    def test_placement_is_distinct_and_deterministic(self):
+        ring = HashRing(self.nodes)
+        rebuilt = HashRing(reversed(self.nodes))
+
+        for key in self.keys[:100]:
+            placement = ring.get_nodes(key, 3)
+            self.assertEqual(len(set(placement)), 3)
+            self.assertEqual(placement, rebuilt.get_nodes(key, 3))
+
+    def test_replication_factor_is_capped_by_the_number_of_nodes(self):
+        self.assertEqual(len(HashRing(self.nodes[:2]).get_nodes("sg_1", 3)), 2)
+        self.assertEqual(HashRing().get_nodes("sg_1", 3), [])
+
+    def test_removing_a_node_only_moves_its_keys(self):
+        ring = HashRing(self.nodes)
+        before = {key: ring.get_nodes(key, 1)[0] for key in self.keys}
+
+        ring.remove(self.nodes[0])
+
+        for key in self.keys:
+            if before[key] != self.nodes[0]:
+                self.assertEqual(ring.get_nodes(key, 1)[0], before[key])
+        owned = sum(1 for owner in before.values() if owner == self.nodes[0])
+        self.assertLess(abs(owned - len(self.keys) / len(self.nodes)), len(self.keys) / len(self.nodes) / 2)
+
+    def test_secondary_replica_takes_over_from_a_removed_primary(self):
+        ring = HashRing(self.nodes)
+        placement = ring.get_nodes("sg_1", 2)
+
+        ring.remove(placement[0])
+
+        self.assertEqual(ring.get_nodes("sg_1", 2)[0], placement[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+
+from utils.http_utils import etag_matches, http_date, is_not_modified
+
+
+class TestIsNotModified(unittest.TestCase):
+    def test_if_none_match(self):
+        self.assertTrue(is_not_modified({"if-none-match": '"a", "b"'}, '"b"', 0))
+        self.assertTrue(is_not_modified({"if-none-match": 'W/"b"'}, '"b"', 0))
+        self.assertTrue(is_not_modified({"if-none-match": "*"}, '"b"', 0))
+        self.assertFalse(is_not_modified({"if-none-match": '"a"'}, '"b"', 0))
+
+    def test_if_none_match_takes_precedence_over_if_modified_since(self):
+        headers = {"if-none-match": '"a"', "if-modified-since": http_date(1000)}
+        self.assertFalse(is_not_modified(headers, '"b"', 1000))
+
+    def test_if_modified_since(self):
+        self.assertTrue(is_not_modified({"if-modified-since": http_date(1000)}, '"b"', 1000.5))
+        self.assertFalse(is_not_modified({"if-modified-since": http_date(1000)}, '"b"', 1001))
+        self.assertFalse(is_not_modified({"if-modified-since": "yesterday"}, '"b"', 0))
+        self.assertFalse(is_not_modified({}, '"b"', 0))
+
+    def test_strong_comparison_rejects_weak_tags(self):
+        self.assertTrue(etag_matches('"b"', '"b"', weak=False))
+        self.assertFalse(etag_matches('W/"b"', '"b"', weak=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
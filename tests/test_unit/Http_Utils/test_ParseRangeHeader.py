@@ -0,0 +1,23 @@
+import unittest
+
+from utils.http_utils import parse_range_header
+
+
+class TestParseRangeHeader(unittest.TestCase):
+    def test_single_ranges(self):
+        self.assertEqual(parse_range_header("bytes=0-9", 100), (0, 9))
+        self.assertEqual(parse_range_header("bytes=90-", 100), (90, 99))
+        self.assertEqual(parse_range_header("bytes=90-200", 100), (90, 99))
+        self.assertEqual(parse_range_header("bytes=-10", 100), (90, 99))
+        self.assertEqual(parse_range_header("bytes=-500", 100), (0, 99))
+
+    def test_missing_or_malformed_headers_are_ignored(self):
+        for header in (None, "", "items=0-9", "bytes=a-b", "bytes=9-0", "bytes=5"):
+            self.assertIsNone(parse_range_header(header, 100), header)
+
+    def test_unsatisfiable_and_multiple_ranges_are_rejected(self):
+        for header in ("bytes=100-", "bytes=-0", "bytes=0-1,5-6"):
+            with self.assertRaises(ValueError):
+                parse_range_header(header, 100)
+        with self.assertRaises(ValueError):
+            parse_range_header("bytes=-10", 0)
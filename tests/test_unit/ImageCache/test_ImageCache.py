@@ -0,0 +1,66 @@
+import unittest
+
+from classes.ImageCache import CachedImage, ImageCache
+
+
+def image(size: int) -> CachedImage:
+    return CachedImage(b"x" * size, "image/jpeg", {"ETag": '"md5"'}, 0.0)
+
+
+class TestImageCache(unittest.TestCase):
+    def test_image_is_admitted_after_repeated_requests(self):
+        cache = ImageCache(admit_after=2)
+
+        self.assertFalse(cache.admits("a", 10))
+        self.assertTrue(cache.admits("a", 10))
+
+    def test_large_image_is_never_admitted(self):
+        cache = ImageCache(max_entry_size=10, admit_after=1)
+
+        self.assertFalse(cache.admits("a", 11))
+        self.assertEqual(cache.stats()["rejections"], 1)
+
+    def test_least_recently_used_images_are_evicted_to_fit_the_budget(self):
+        cache = ImageCache(max_bytes=25)
+        cache.put("a", image(10), cache.version)
+        cache.put("b", image(10), cache.version)
+        cache.get("a")
+        cache.put("c", image(10), cache.version)
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["bytes"], 20)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_invalidate_drops_the_image_and_reads_in_progress(self):
+        cache = ImageCache()
+        cache.put("a", image(10), cache.version)
+        version = cache.version
+
+        cache.invalidate("a")
+        cache.put("a", image(10), version)
+
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["bytes"], 0)
+        self.assertEqual(cache.stats()["invalidations"], 1)
+
+    def test_invalidating_another_image_keeps_reads_in_progress(self):
+        cache = ImageCache()
+        version = cache.version
+
+        cache.invalidate("b")
+        cache.put("a", image(10), version)
+
+        self.assertIsNotNone(cache.get("a"))
+
+    def test_hit_rate(self):
+        cache = ImageCache()
+        cache.put("a", image(10), cache.version)
+        cache.get("a")
+        cache.get("b")
+
+        self.assertEqual(cache.stats()["hit_rate"], 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from classes.ServiceInfo import ServiceInfo
+from classes.enum.ServiceType import ServiceType
+from classes.services.MainService import MainService
+
+
+class TestMainServiceFileRing:
+    @pytest.mark.asyncio
+    async def test_file_services_join_and_leave_the_ring(self):
+        service_instance = MainService()
+        for url in ("localhost:9001", "localhost:9002"):
+            await service_instance.update_or_add_service(
+                ServiceInfo(name=url, service_type=ServiceType.FILE_SERVICE.name, url=url))
+        await service_instance.update_or_add_service(
+            ServiceInfo(name="auth", service_type=ServiceType.AUTH_SERVICE.name, url="localhost:9003"))
+
+        assert service_instance.file_ring_data()["nodes"] == ["localhost:9001", "localhost:9002"]
+
+        with patch.object(service_instance, "request_file_repair", new_callable=AsyncMock) as mock_repair:
+            await service_instance.del_service("localhost:9001")
+            await service_instance.tasks[-1]
+
+        assert service_instance.file_ring_data()["nodes"] == ["localhost:9002"]
+        mock_repair.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_removing_the_last_file_service_requests_no_repair(self):
+        service_instance = MainService()
+        await service_instance.update_or_add_service(
+            ServiceInfo(name="file", service_type=ServiceType.FILE_SERVICE.name, url="localhost:9001"))
+
+        with patch.object(service_instance, "request_file_repair", new_callable=AsyncMock) as mock_repair:
+            await service_instance.del_service("localhost:9001")
+
+        assert service_instance.file_ring_data()["nodes"] == []
+        mock_repair.assert_not_called()
@@ -0,0 +1,54 @@
+import asyncio
+import hashlib
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+from classes.Md5VerificationCache import Md5VerificationCache
+
+
+class TestMd5VerificationCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp_dir.name, "song.mp3")
+        self.write(b"Fake MP3 data")
+        self.hashed = 0
+        self.cache = Md5VerificationCache(os.path.join(self.tmp_dir.name, ".md5_index.json"), self.hash_file)
+
+    async def asyncTearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, content):
+        with open(self.file_path, "wb") as file:
+            file.write(content)
+
+    async def hash_file(self, path):
+        self.hashed += 1
+        await asyncio.sleep(0.01)
+        with open(path, "rb") as file:
+            return hashlib.md5(file.read()).hexdigest()
+
+    async def test_file_is_hashed_once_until_it_changes(self):
+        expected = hashlib.md5(b"Fake MP3 data").hexdigest()
+        results = await asyncio.gather(*[self.cache.get_md5(self.file_path) for _ in range(5)])
+        self.assertEqual(results, [expected] * 5)
+        self.assertEqual(await self.cache.get_md5(self.file_path), expected)
+        self.assertEqual(self.hashed, 1)
+        self.assertEqual(self.cache.stats()["coalesced"], 4)
+
+        self.write(b"Changed MP3 data")
+        os.utime(self.file_path, ns=(0, 0))
+        self.assertEqual(await self.cache.get_md5(self.file_path), hashlib.md5(b"Changed MP3 data").hexdigest())
+        self.assertEqual(self.hashed, 2)
+
+    async def test_recorded_hash_survives_a_restart(self):
+        self.cache.record(self.file_path, "recorded_md5")
+        await self.cache.save()
+
+        restarted = Md5VerificationCache(self.cache.index_file, self.hash_file)
+        self.assertEqual(restarted.load(), 1)
+        self.assertEqual(await restarted.get_md5(self.file_path), "recorded_md5")
+        self.assertEqual(self.hashed, 0)
+
+        restarted.forget(self.file_path)
+        self.assertEqual(await restarted.get_md5(self.file_path), hashlib.md5(b"Fake MP3 data").hexdigest())
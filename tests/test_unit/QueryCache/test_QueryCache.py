@@ -0,0 +1,95 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from classes.QueryCache import QueryCache
+from utils import DatabaseAsyncQuery
+from utils.DatabaseMigrations import apply_migrations_sync
+
+
+class TestQueryCache(unittest.TestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = QueryCache(max_entries=2)
+        cache.put("a", 1, [], cache.version)
+        cache.put("b", 2, [], cache.version)
+        cache.get("a")
+        cache.put("c", 3, [], cache.version)
+
+        self.assertEqual(cache.get("a"), (True, 1))
+        self.assertEqual(cache.get("b"), (False, None))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_expired_entry_is_a_miss(self):
+        cache = QueryCache(ttl=10)
+        with patch("classes.QueryCache.time.monotonic", return_value=100):
+            cache.put("a", 1, [], cache.version)
+        with patch("classes.QueryCache.time.monotonic", return_value=111):
+            self.assertEqual(cache.get("a"), (False, None))
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    def test_invalidate_drops_only_tagged_entries(self):
+        cache = QueryCache()
+        cache.put("song", 1, [("song", "sg_1")], cache.version)
+        cache.put("songs", [1], [("songs", "testuser")], cache.version)
+        cache.put("other", 2, [("song", "sg_2")], cache.version)
+
+        cache.invalidate(("song", "sg_1"), ("songs", "testuser"))
+
+        self.assertEqual(cache.get("song"), (False, None))
+        self.assertEqual(cache.get("songs"), (False, None))
+        self.assertEqual(cache.get("other"), (True, 2))
+        self.assertEqual(cache.stats()["invalidations"], 2)
+
+    def test_result_read_before_invalidation_is_not_stored(self):
+        cache = QueryCache()
+        version = cache.version
+        cache.invalidate(("song", "sg_1"))
+        cache.put("song", None, [("song", "sg_1")], version)
+
+        self.assertEqual(cache.get("song"), (False, None))
+
+    def test_result_read_before_unrelated_invalidation_is_stored(self):
+        cache = QueryCache()
+        version = cache.version
+        cache.invalidate(("song", "sg_2"))
+        cache.put("song", 1, [("song", "sg_1")], version)
+
+        self.assertEqual(cache.get("song"), (True, 1))
+
+    def test_result_read_before_forgotten_invalidations_is_not_stored(self):
+        cache = QueryCache(max_tracked_tags=1)
+        version = cache.version
+        cache.invalidate(("song", "sg_1"))
+        cache.invalidate(("song", "sg_2"))
+        cache.put("song", 1, [("song", "sg_1")], version)
+
+        self.assertEqual(cache.get("song"), (False, None))
+
+
+class TestQueryCacheReads(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.patcher = patch.object(DatabaseAsyncQuery, "DATABASE_FILE", os.path.join(self.tmp_dir.name, "media_db.db"))
+        self.patcher.start()
+        DatabaseAsyncQuery.create_tables_sync()
+        apply_migrations_sync()
+        self.cache = QueryCache()
+        DatabaseAsyncQuery.set_query_cache(self.cache)
+
+    async def asyncTearDown(self):
+        DatabaseAsyncQuery.set_query_cache(None)
+        self.patcher.stop()
+        self.tmp_dir.cleanup()
+
+    async def test_writes_invalidate_cached_reads(self):
+        self.assertIsNone(await DatabaseAsyncQuery.get_song("sg_1"))
+        self.assertEqual(await DatabaseAsyncQuery.get_songs(None, None, "testuser"), [])
+
+        await DatabaseAsyncQuery.create_song("sg_1", "Ceremony", "New Order", "md5_1", "testuser")
+
+        self.assertEqual((await DatabaseAsyncQuery.get_song("sg_1"))[0], "sg_1")
+        self.assertEqual(len(await DatabaseAsyncQuery.get_songs(None, None, "testuser")), 1)
+        await DatabaseAsyncQuery.get_song("sg_1")
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 4))
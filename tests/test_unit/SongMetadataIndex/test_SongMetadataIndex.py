@@ -0,0 +1,61 @@
+import os
+import time
+import unittest
+from tempfile import TemporaryDirectory
+
+from classes.SongMetadataIndex import SongMetadataIndex
+
+
+class TestSongMetadataIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.database_file = os.path.join(self.tmp_dir.name, ".song_index.sqlite3")
+        self.index = SongMetadataIndex(self.database_file)
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp_dir.cleanup()
+
+    def test_entries_survive_reopening(self):
+        self.index.put("sg_1", "md5_1", 10)
+        self.assertEqual(self.index.get("sg_1"), ("md5_1", 10))
+        self.assertIsNone(self.index.get("sg_2"))
+        self.index.close()
+
+        reopened = SongMetadataIndex(self.database_file)
+        self.assertEqual(reopened.get("sg_1"), ("md5_1", 10))
+        reopened.close()
+
+    def test_stale_returns_unreconciled_songs_first(self):
+        now = time.time()
+        self.index.put("sg_old", "md5", 1, now - 100)
+        self.index.put("sg_new", "md5", 1)
+        self.index.put("sg_recent", "md5", 1, now)
+
+        self.assertEqual(self.index.stale(now - 10, 10), ["sg_new", "sg_old"])
+        self.assertEqual(self.index.stale(now - 10, 1), ["sg_new"])
+
+    def test_reconcile_corrects_and_removes_songs(self):
+        self.index.put("sg_1", "md5_1", 1)
+        self.index.put("sg_2", "stale_md5", 1)
+        self.index.put("sg_3", "md5_3", 1)
+
+        corrected, removed = self.index.reconcile(["sg_1", "sg_2", "sg_3"], {"sg_1": "md5_1", "sg_2": "md5_2"})
+
+        self.assertEqual((corrected, removed), (1, 1))
+        self.assertEqual(self.index.get("sg_2"), ("md5_2", 1))
+        self.assertIsNone(self.index.get("sg_3"))
+        self.assertEqual(self.index.stale(time.time() - 10, 10), [])
+        self.assertEqual(self.index.stats()["entries"], 2)
+
+    def test_state_survives_reopening(self):
+        self.index.set_state("scrub_position", "sg_1")
+        self.index.close()
+
+        self.assertEqual(self.index.get_state("scrub_position"), "sg_1")
+        self.index.set_state("scrub_position", None)
+        self.assertIsNone(self.index.get_state("scrub_position"))
+
+
+if __name__ == '__main__':
+    unittest.main()
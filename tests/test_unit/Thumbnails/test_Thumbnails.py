@@ -0,0 +1,34 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+from utils.Thumbnails import make_thumbnails, thumbnails_supported
+
+
+class TestThumbnails(unittest.TestCase):
+    @unittest.skipUnless(thumbnails_supported(), "Pillow is not installed")
+    def test_thumbnails_keep_the_aspect_ratio(self):
+        from PIL import Image
+
+        with TemporaryDirectory() as tmp_dir:
+            source_path = os.path.join(tmp_dir, "image.png")
+            Image.new("RGB", (1000, 500), "red").save(source_path)
+            targets = [(64, os.path.join(tmp_dir, "a", "image-64.webp")),
+                       (256, os.path.join(tmp_dir, "a", "image-256.webp"))]
+
+            make_thumbnails(source_path, targets, "webp", 80)
+
+            with Image.open(targets[0][1]) as small, Image.open(targets[1][1]) as large:
+                self.assertEqual(small.size, (64, 32))
+                self.assertEqual(large.size, (256, 128))
+                self.assertEqual(small.format, "WEBP")
+            self.assertEqual(sorted(os.listdir(os.path.join(tmp_dir, "a"))), ["image-256.webp", "image-64.webp"])
+
+    @unittest.skipIf(thumbnails_supported(), "Pillow is installed")
+    def test_thumbnails_require_pillow(self):
+        with self.assertRaises(RuntimeError):
+            make_thumbnails("image.png", [(64, "image-64.webp")], "webp", 80)
+
+
+if __name__ == '__main__':
+    unittest.main()
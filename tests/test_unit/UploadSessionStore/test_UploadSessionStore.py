@@ -0,0 +1,69 @@
+import hashlib
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+from classes.UploadSessionStore import UploadSessionStore
+from classes.exception.UploadTooLargeException import UploadTooLargeException
+
+
+class TestUploadSessionStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = TemporaryDirectory()
+        self.store = UploadSessionStore(self.tmp_dir.name, ttl=60)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_chunks_are_appended_at_the_current_offset(self):
+        upload_id = self.store.create(10, hashlib.md5(b"0123456789").hexdigest())
+
+        self.assertEqual(self.store.append(upload_id, 0, b"0123"), 4)
+        with self.assertRaises(ValueError):
+            self.store.append(upload_id, 0, b"0123")
+        with self.assertRaises(ValueError):
+            self.store.append(upload_id, 4, b"4567890")
+        self.assertEqual(self.store.append(upload_id, 4, b"456789", sync=True), 10)
+
+        path, md5, size = self.store.finish(upload_id)
+        with open(path, "rb") as file:
+            self.assertEqual(file.read(), b"0123456789")
+        self.assertEqual((md5, size), (hashlib.md5(b"0123456789").hexdigest(), 10))
+
+    def test_offset_survives_a_new_store(self):
+        upload_id = self.store.create(10)
+        self.store.append(upload_id, 0, b"012")
+
+        session = UploadSessionStore(self.tmp_dir.name, ttl=60).get(upload_id)
+
+        self.assertEqual((session["offset"], session["length"]), (3, 10))
+
+    def test_finish_rejects_incomplete_and_mismatched_uploads(self):
+        upload_id = self.store.create(4, hashlib.md5(b"abcd").hexdigest())
+        self.store.append(upload_id, 0, b"abc")
+        with self.assertRaises(ValueError):
+            self.store.finish(upload_id)
+
+        self.store.append(upload_id, 3, b"x")
+        with self.assertRaises(ValueError):
+            self.store.finish(upload_id)
+
+    def test_create_rejects_uploads_larger_than_the_maximum(self):
+        with self.assertRaises(UploadTooLargeException):
+            self.store.create(11, max_length=10)
+
+    def test_expire_removes_old_sessions(self):
+        old_id = self.store.create(1)
+        self.store.ttl = -1
+        self.assertEqual(self.store.expire(), 1)
+        with self.assertRaises(FileNotFoundError):
+            self.store.get(old_id)
+
+        self.store.ttl = 60
+        kept_id = self.store.create(1)
+        self.assertEqual(self.store.expire(), 0)
+        self.assertEqual(self.store.get(kept_id)["offset"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
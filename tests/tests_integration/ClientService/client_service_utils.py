@@ -8,7 +8,8 @@ from classes.enum.ServiceType import ServiceType
 from tests.tests_integration.utils import MockRedirectResponse, mock_service_url_side_effect
 
 
-def mock_service_exception_handling_side_effect(service_url, operation, method, data=None, params=None, files=None):
+def mock_service_exception_handling_side_effect(service_url, operation, method, data=None, params=None, files=None,
+                                                content=None):
     # Example logic to return different values based on parameters
 
     if operation == "validate_user" and method == "POST":
@@ -37,6 +38,18 @@ def mock_service_exception_handling_side_effect(service_url, operation, method,
     if operation == "songs/song/create" and method == "POST":
         return {"detail": "Song created"}, 200
 
+    if operation.startswith("blobs/") and method == "GET":
+        raise HTTPException(status_code=404, detail="Blob not found")
+
+    if operation == "uploads" and method == "POST":
+        return {"upload_id": "mockupload", "offset": 0, "length": params["length"]}, 201
+
+    if operation == "uploads/mockupload" and method == "PATCH":
+        return {"upload_id": "mockupload", "offset": params["offset"] + len(content)}, 200
+
+    if operation == "upload/song/complete" and method == "POST":
+        return {"detail": "Files uploaded successfully"}, 200
+
     if operation == "upload/song" and method == "POST":
         return {"detail": "song uploaded"}, 200
 
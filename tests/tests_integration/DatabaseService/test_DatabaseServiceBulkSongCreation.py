@@ -0,0 +1,56 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from database_service import app
+from fastapi.testclient import TestClient
+import os
+
+os.environ["DEBUG"] = "True"
+client = TestClient(app)
+
+
+def song(song_id, **overrides):
+    data = {"song_id": song_id, "song_name": f"name {song_id}", "artist": "artist", "md5": "md5",
+            "username": "testuser"}
+    data.update(overrides)
+    return data
+
+
+@pytest.fixture
+def mock_create_songs():
+    with patch("database_service.create_songs", new_callable=AsyncMock) as mock_create_songs:
+        mock_create_songs.return_value = [True, False]
+        yield mock_create_songs
+
+
+@pytest.fixture
+def mock_create_songs_exception():
+    with patch("database_service.create_songs", new_callable=AsyncMock) as mock_create_songs:
+        mock_create_songs.side_effect = Exception("Internal Server Error")
+        yield
+
+
+def test_database_service_bulk_create_songs(mock_create_songs):
+    response = client.post("/songs/bulk_create", json=[song("sg_1"), song("sg_2", md5=None), song("sg_3")])
+    assert response.status_code == 200
+    assert response.json() == {
+        "created": 1,
+        "duplicates": 1,
+        "results": [{"song_id": "sg_1", "status": "created"},
+                    {"song_id": "sg_2", "status": "invalid"},
+                    {"song_id": "sg_3", "status": "duplicate"}]
+    }
+    mock_create_songs.assert_awaited_once_with([("sg_1", "name sg_1", "artist", "md5", "testuser"),
+                                                ("sg_3", "name sg_3", "artist", "md5", "testuser")])
+
+
+def test_database_service_bulk_create_songs_empty(mock_create_songs):
+    response = client.post("/songs/bulk_create", json=[])
+    assert response.status_code == 400
+
+
+def test_database_service_bulk_create_songs_exception(mock_create_songs_exception):
+    response = client.post("/songs/bulk_create", json=[song("sg_1")])
+    assert response.status_code == 500
+    assert response.json() == {"detail": "Internal Server Error"}
@@ -6,8 +6,7 @@ from database_service import app
 from fastapi.testclient import TestClient
 import os
 import json
-
-from tests.tests_integration.DatabaseService.database_service_utils import mock_get_user, mock_get_user_failure
+import sqlite3
 
 os.environ["DEBUG"] = "True"
 client = TestClient(app)
@@ -24,6 +23,12 @@ def mock_create_user_failure():
         mock_create_user.return_value = None
         yield
 
+@pytest.fixture
+def mock_create_user_integrity_error():
+    with patch("database_service.create_user",  new_callable=AsyncMock) as mock_create_user:
+        mock_create_user.side_effect = sqlite3.IntegrityError("NOT NULL constraint failed: users.email")
+        yield
+
 @pytest.fixture
 def mock_create_user_exception():
     with patch("database_service.create_user",  new_callable=AsyncMock) as mock_create_user:
@@ -31,20 +36,20 @@ def mock_create_user_exception():
         yield
 
 
-def test_database_service_create_user_success(mock_create_user, mock_get_user_failure):
+def test_database_service_create_user_success(mock_create_user):
     response = client.post("/users/user/create", json={"username": "testuser2", "password": "testpassword", "email": "testemail"})
     response_data = json.loads(response.text)
     assert response.status_code == 200
     assert response_data["detail"] == "User created successfully"
 
-def test_database_service_create_user_already_exists(mock_create_user, mock_get_user):
+def test_database_service_create_user_already_exists(mock_create_user_failure):
     response = client.post("/users/user/create", json={"username": "testuser", "password": "testpassword", "email": "testemail"})
     response_data = json.loads(response.text)
     assert response.status_code == 409
     assert response_data["detail"] == "User already exists"
 
 
-def test_database_service_create_user_failure(mock_create_user_failure, mock_get_user_failure):
+def test_database_service_create_user_failure(mock_create_user_integrity_error):
     response = client.post("/users/user/create", json={},)
     assert response.status_code == 422
 
@@ -54,7 +59,7 @@ def test_database_service_create_user_failure(mock_create_user_failure, mock_get
     assert response_data["detail"] == "Could not create user"
 
 
-def test_database_service_create_user_exception(mock_create_user_exception, mock_get_user_failure):
+def test_database_service_create_user_exception(mock_create_user_exception):
     response = client.post("/users/user/create", json={"username": "testuser4", "password": "testpassword", "email": "testemail"})
     response_data = json.loads(response.text)
     assert response.status_code == 500
@@ -0,0 +1,60 @@
+import json
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from database_service import app
+from fastapi.testclient import TestClient
+import os
+
+os.environ["DEBUG"] = "True"
+client = TestClient(app)
+
+PLAYLIST_ROWS = [("pl_1", "Morning", "testuser"), ("pl_2", "Evening", "testuser")]
+SONG_ROWS = [("sg_2", "B Song", "artist", "md5_2", "testuser"),
+             ("sg_1", "A Song", "artist", "md5_1", "testuser")]
+
+
+@pytest.fixture
+def mock_get_playlists():
+    with patch("database_service.get_playlists", new_callable=AsyncMock) as mock_get_playlists:
+        mock_get_playlists.return_value = PLAYLIST_ROWS
+        yield mock_get_playlists
+
+
+def test_database_service_get_playlists(mock_get_playlists):
+    response = client.get("/playlists", params={"username": "testuser"})
+    assert response.status_code == 200
+    assert response.json() == [{"playlist_id": "pl_1", "playlist_name": "Morning", "username": "testuser"},
+                               {"playlist_id": "pl_2", "playlist_name": "Evening", "username": "testuser"}]
+    mock_get_playlists.assert_awaited_with("testuser", None)
+
+
+def test_database_service_get_playlists_not_found():
+    with patch("database_service.get_playlists", new_callable=AsyncMock, return_value=[]):
+        response = client.get("/playlists", params={"username": "testuser"})
+    assert response.status_code == 404
+
+
+def test_database_service_get_playlists_stream():
+    with patch("database_service.stream_playlists", return_value=iter([PLAYLIST_ROWS])) as mock_stream:
+        response = client.get("/playlists", params={"username": "testuser"},
+                              headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert [json.loads(line)["playlist_id"] for line in response.text.splitlines()] == ["pl_1", "pl_2"]
+    mock_stream.assert_called_once_with("testuser", None)
+
+
+def test_database_service_get_playlist_songs():
+    with patch("database_service.get_songs_by_playlist", new_callable=AsyncMock, return_value=SONG_ROWS):
+        response = client.get("/playlists/playlist/songs", params={"playlist_id": "pl_1"})
+    assert response.status_code == 200
+    assert [song["song_id"] for song in response.json()] == ["sg_2", "sg_1"]
+
+
+def test_database_service_get_playlist_songs_stream():
+    with patch("database_service.stream_songs_by_playlist", return_value=iter([SONG_ROWS])) as mock_stream:
+        response = client.get("/playlists/playlist/songs", params={"playlist_id": "pl_1", "stream": "true"})
+    assert response.status_code == 200
+    assert [json.loads(line)["song_id"] for line in response.text.splitlines()] == ["sg_2", "sg_1"]
+    mock_stream.assert_called_once_with("pl_1")
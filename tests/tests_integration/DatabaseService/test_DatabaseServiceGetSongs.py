@@ -0,0 +1,103 @@
+import json
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from database_service import app
+from fastapi.testclient import TestClient
+import os
+
+from utils.DatabaseAsyncQuery import decode_songs_cursor, encode_songs_cursor
+
+os.environ["DEBUG"] = "True"
+client = TestClient(app)
+
+SONG_ROWS = [("sg_1", "A Song", "artist", "md5_1", "testuser"),
+             ("sg_2", "B Song", "artist", "md5_2", "testuser")]
+
+
+@pytest.fixture
+def mock_get_songs():
+    with patch("database_service.get_songs", new_callable=AsyncMock) as mock_get_songs:
+        mock_get_songs.return_value = SONG_ROWS
+        yield mock_get_songs
+
+
+@pytest.fixture
+def mock_get_songs_empty():
+    with patch("database_service.get_songs", new_callable=AsyncMock) as mock_get_songs:
+        mock_get_songs.return_value = []
+        yield mock_get_songs
+
+
+def test_database_service_get_songs_full_page(mock_get_songs):
+    response = client.get("/songs", params={"limit": 2})
+    assert response.status_code == 200
+    assert [song["song_id"] for song in response.json()["songs"]] == ["sg_1", "sg_2"]
+    assert decode_songs_cursor(response.json()["next_cursor"]) == ("B Song", "sg_2")
+    mock_get_songs.assert_awaited_with(None, None, None, 2, None)
+
+
+def test_database_service_get_songs_last_page(mock_get_songs):
+    cursor = encode_songs_cursor("0 Song", "sg_0")
+    response = client.get("/songs", params={"limit": 5, "cursor": cursor})
+    assert response.status_code == 200
+    assert response.json()["next_cursor"] is None
+    mock_get_songs.assert_awaited_with(None, None, None, 5, cursor)
+
+
+def test_database_service_get_songs_empty_page_after_cursor(mock_get_songs_empty):
+    response = client.get("/songs", params={"cursor": encode_songs_cursor("B Song", "sg_2")})
+    assert response.status_code == 200
+    assert response.json() == {"songs": [], "next_cursor": None}
+
+
+def test_database_service_get_songs_not_found(mock_get_songs_empty):
+    response = client.get("/songs")
+    assert response.status_code == 404
+
+
+def test_database_service_get_songs_invalid_limit(mock_get_songs):
+    response = client.get("/songs", params={"limit": 0})
+    assert response.status_code == 422
+
+
+def test_database_service_get_songs_invalid_cursor():
+    response = client.get("/songs", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+def test_database_service_get_songs_stream_query_parameter():
+    with patch("database_service.stream_songs", return_value=iter([SONG_ROWS[:1], SONG_ROWS[1:]])) as mock_stream:
+        response = client.get("/songs", params={"username": "testuser", "stream": "true"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    assert [json.loads(line)["song_id"] for line in lines] == ["sg_1", "sg_2"]
+    mock_stream.assert_called_once_with(None, None, "testuser", None)
+
+
+def test_database_service_get_songs_stream_accept_header():
+    with patch("database_service.stream_songs", return_value=iter([])):
+        response = client.get("/songs", headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.text == ""
+
+
+def test_database_service_get_songs_stream_invalid_cursor():
+    response = client.get("/songs", params={"cursor": "not-a-cursor", "stream": "true"})
+    assert response.status_code == 400
+
+
+def test_database_service_get_song_md5s():
+    with patch("database_service.get_song_md5s", new_callable=AsyncMock,
+               return_value=[("sg_1", "md5_1")]) as mock_get_song_md5s:
+        response = client.post("/songs/md5", json={"song_ids": ["sg_1", "sg_missing"]})
+    assert response.status_code == 200
+    assert response.json() == {"songs": {"sg_1": "md5_1"}}
+    mock_get_song_md5s.assert_awaited_once_with(["sg_1", "sg_missing"])
+
+
+def test_database_service_get_song_md5s_too_many():
+    response = client.post("/songs/md5", json={"song_ids": [f"sg_{i}" for i in range(1001)]})
+    assert response.status_code == 400
@@ -5,32 +5,12 @@ import pytest
 from database_service import app
 from fastapi.testclient import TestClient
 import os
+import sqlite3
 
 os.environ["DEBUG"] = "True"
 client = TestClient(app)
 
 
-@pytest.fixture
-def mock_get_song():
-    with patch("database_service.get_songs", new_callable=AsyncMock) as mock_get_song:
-        mock_get_song.return_value = "Song found"
-        yield
-
-
-@pytest.fixture
-def mock_get_song_failure():
-    with patch("database_service.get_songs", new_callable=AsyncMock) as mock_get_song:
-        mock_get_song.return_value = None
-        yield
-
-
-@pytest.fixture
-def mock_get_song_exception():
-    with patch("database_service.get_songs", new_callable=AsyncMock) as mock_get_song:
-        mock_get_song.side_effect = Exception("Internal Server Error")
-        yield
-
-
 @pytest.fixture
 def mock_create_song():
     with patch("database_service.create_song", new_callable=AsyncMock) as mock_create_song:
@@ -45,6 +25,13 @@ def mock_create_song_failure():
         yield
 
 
+@pytest.fixture
+def mock_create_song_integrity_error():
+    with patch("database_service.create_song", new_callable=AsyncMock) as mock_create_song:
+        mock_create_song.side_effect = sqlite3.IntegrityError("NOT NULL constraint failed: songs.md5")
+        yield
+
+
 @pytest.fixture
 def mock_create_song_exception():
     with patch("database_service.create_song", new_callable=AsyncMock) as mock_create_song:
@@ -52,26 +39,31 @@ def mock_create_song_exception():
         yield
 
 
-def test_database_service_create_song_success(mock_create_song, mock_get_song_failure):
+def test_database_service_create_song_success(mock_create_song):
     response = client.post("/songs/song/create", json={"song_id": "song_id", "song_name": "testtitle",
                                                        "artist": "testartist", "usernames": ["testuser"]})
     assert response.status_code == 200
     assert response.json() == {"detail": "Song created successfully", "song_id": "song id"}
 
 
-def test_database_service_create_song_already_exists(mock_create_song, mock_get_song):
+def test_database_service_create_song_already_exists(mock_create_song_failure):
     response = client.post("/songs/song/create", json={"song_id": "song_id", "song_name": "testtitle",
                                                        "artist": "testartist", "usernames": ["testuser"]})
     assert response.status_code == 409
     assert response.json() == {"detail": "Song already exists"}
 
 
-def test_database_service_create_song_failure(mock_create_song_failure, mock_get_song_failure):
+def test_database_service_create_song_failure(mock_create_song_integrity_error):
     response = client.post("/songs/song/create", json={})
     assert response.status_code == 422
 
+    response = client.post("/songs/song/create", json={"song_id": "song_id", "song_name": "testtitle",
+                                                       "artist": "testartist"})
+    assert response.status_code == 422
+    assert response.json() == {"detail": "Could not create song"}
+
 
-def test_database_service_create_song_exception(mock_create_song_exception, mock_get_song_failure):
+def test_database_service_create_song_exception(mock_create_song_exception):
     response = client.post("/songs/song/create", json={"song_id": "song_id", "song_name": "testtitle",
                                                        "artist": "testartist", "usernames": ["testuser"]})
     assert response.status_code == 500
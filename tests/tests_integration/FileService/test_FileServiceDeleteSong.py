@@ -2,6 +2,7 @@ from tempfile import TemporaryDirectory
 
 import pytest
 
+from classes.SongMetadataIndex import SongMetadataIndex
 from file_service import app, service
 from fastapi.testclient import TestClient
 import os
@@ -14,11 +15,15 @@ def setup_test_directories():
     with TemporaryDirectory() as tmp_music, TemporaryDirectory() as tmp_image:
         original_music_dir = service.music_dir
         original_image_dir = service.image_dir
+        original_song_index = service.song_index
         service.music_dir = tmp_music
         service.image_dir = tmp_image
+        service.song_index = SongMetadataIndex(os.path.join(tmp_music, ".song_index.sqlite3"))
         yield
+        service.song_index.close()
         service.music_dir = original_music_dir
         service.image_dir = original_image_dir
+        service.song_index = original_song_index
 
 
 def create_test_files(song_id: str):
@@ -40,6 +45,16 @@ def test_delete_existing_song_files(setup_test_directories):
     assert not os.path.exists(os.path.join(service.music_dir, f"{song_id}.mp3"))
     assert not os.path.exists(os.path.join(service.image_dir, f"{song_id}.jpg"))
 
+def test_delete_song_drops_cached_image(setup_test_directories):
+    song_id = "cached_song"
+    create_test_files(song_id)
+    for _ in range(service.IMAGE_CACHE_ADMIT_AFTER):
+        client.get(f"/download/image?id={song_id}")
+    assert service.image_cache.get((song_id, None)) is not None
+
+    assert client.delete(f"/delete/song?song_id={song_id}").status_code == 200
+    assert client.get(f"/download/image?id={song_id}").status_code == 404
+
 def test_delete_nonexistent_song_files(setup_test_directories):
     song_id = "nonexistent_song"
     response = client.delete(f"/delete/song?song_id={song_id}")
@@ -0,0 +1,85 @@
+import hashlib
+import io
+import os
+import tarfile
+import zipfile
+from tempfile import TemporaryDirectory
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from classes.SongMetadataIndex import SongMetadataIndex
+from file_service import app, service
+
+os.environ["DEBUG"] = "True"
+client = TestClient(app)
+
+SONGS = {"sg_1": b"First fake MP3 data", "sg_2": b"Second fake MP3 data"}
+
+
+@pytest.fixture
+def setup_test_directories():
+    with TemporaryDirectory() as tmp_dir:
+        original_music_dir = service.music_dir
+        original_song_index = service.song_index
+        service.music_dir = os.path.join(tmp_dir, "music")
+        service.song_index = SongMetadataIndex(os.path.join(tmp_dir, ".song_index.sqlite3"))
+        os.makedirs(service.music_dir)
+        for song_id, content in SONGS.items():
+            with open(os.path.join(service.music_dir, f"{song_id}.mp3"), "wb") as f:
+                f.write(content)
+            service.song_index.put(song_id, hashlib.md5(content).hexdigest(), len(content))
+        yield
+        service.song_index.close()
+        service.music_dir = original_music_dir
+        service.song_index = original_song_index
+
+
+def test_download_bundle_zip(setup_test_directories):
+    response = client.get("/download/bundle", params={"ids": "sg_2,sg_1"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.namelist() == ["sg_2.mp3", "sg_1.mp3"]
+        assert archive.read("sg_1.mp3") == SONGS["sg_1"]
+
+
+def test_download_bundle_tar(setup_test_directories):
+    response = client.get("/download/bundle", params=[("ids", "sg_1"), ("ids", "sg_2"), ("format", "tar")])
+
+    assert response.status_code == 200
+    assert response.headers["content-length"] == str(len(response.content))
+    with tarfile.open(fileobj=io.BytesIO(response.content)) as archive:
+        assert archive.extractfile("sg_2.mp3").read() == SONGS["sg_2"]
+
+
+def test_download_bundle_missing_song(setup_test_directories):
+    response = client.get("/download/bundle", params={"ids": "sg_1,sg_missing"})
+    assert response.status_code == 404
+    assert "sg_missing" in response.json()["detail"]
+
+
+def test_download_bundle_invalid_format(setup_test_directories):
+    assert client.get("/download/bundle", params={"ids": "sg_1", "format": "rar"}).status_code == 400
+
+
+def test_download_bundle_aborts_on_corruption(setup_test_directories):
+    service.song_index.put("sg_1", hashlib.md5(b"other data").hexdigest(), len(SONGS["sg_1"]))
+
+    with pytest.raises(RuntimeError):
+        client.get("/download/bundle", params={"ids": "sg_1"})
+
+
+def test_download_playlist(setup_test_directories):
+    songs = [{"song_id": song_id, "song_name": f"Song/{song_id}", "artist": "artist",
+              "md5": hashlib.md5(content).hexdigest()} for song_id, content in SONGS.items()]
+    with patch.object(service, "get_service_url", new_callable=AsyncMock, return_value="db.com"), \
+            patch.object(service, "service_exception_handling", new_callable=AsyncMock, return_value=(songs, 200)):
+        response = client.get("/download/playlist", params={"playlist_id": "pl_1"})
+
+    assert response.status_code == 200
+    assert response.headers["content-disposition"] == "attachment; filename=pl_1.zip"
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.namelist() == ["01 - artist - Song_sg_1.mp3", "02 - artist - Song_sg_2.mp3"]
@@ -1,6 +1,10 @@
+import hashlib
+import io
 import os
 from tempfile import TemporaryDirectory
 
+from unittest.mock import patch
+
 import pytest
 from fastapi.testclient import TestClient
 
@@ -10,11 +14,16 @@ client = TestClient(app)
 
 @pytest.fixture(scope="module")
 def setup_test_directories():
-    with TemporaryDirectory() as tmp_image:
+    with TemporaryDirectory() as tmp_image, TemporaryDirectory() as tmp_thumbnails:
         original_image_dir = service.image_dir
+        original_thumbnail_dir = service.thumbnail_dir
         service.image_dir = tmp_image
+        service.thumbnail_dir = tmp_thumbnails
+        service.image_cache.clear()
         yield
         service.image_dir = original_image_dir
+        service.thumbnail_dir = original_thumbnail_dir
+        service.image_cache.clear()
 
 def create_test_image_file(image_id: str):
     image_file_path = os.path.join(service.image_dir, f"{image_id}.jpg")
@@ -31,6 +40,97 @@ def test_download_image_success(setup_test_directories):
     assert response.headers["content-type"] == "image/jpeg"
     # Additional checks can be added here to validate the response content
 
+def test_download_image_is_cacheable(setup_test_directories):
+    create_test_image_file("cached_image")
+    response = client.get("/download/image?id=cached_image")
+    assert response.headers["etag"] == f'"{hashlib.md5(b"Fake image data").hexdigest()}"'
+    assert response.headers["cache-control"] == service.CACHE_CONTROL
+
+    response = client.get("/download/image?id=cached_image", headers={"If-None-Match": response.headers["etag"]})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = client.get("/download/image?id=cached_image",
+                          headers={"If-Modified-Since": response.headers["last-modified"]})
+    assert response.status_code == 304
+
+    response = client.get("/download/image?id=cached_image", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+    assert response.content == b"Fake image data"
+
+def test_download_image_is_served_from_memory(setup_test_directories):
+    image_file_path = create_test_image_file("hot_image")
+    for _ in range(service.IMAGE_CACHE_ADMIT_AFTER):
+        client.get("/download/image?id=hot_image")
+    hits = service.image_cache.hits
+    os.remove(image_file_path)
+
+    response = client.get("/download/image?id=hot_image")
+    assert response.status_code == 200
+    assert response.content == b"Fake image data"
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["etag"] == f'"{hashlib.md5(b"Fake image data").hexdigest()}"'
+    assert service.image_cache.hits == hits + 1
+
+    response = client.get("/download/image?id=hot_image", headers={"If-None-Match": response.headers["etag"]})
+    assert response.status_code == 304
+
+def test_download_image_cache_is_invalidated(setup_test_directories):
+    create_test_image_file("replaced_image")
+    for _ in range(service.IMAGE_CACHE_ADMIT_AFTER):
+        client.get("/download/image?id=replaced_image")
+
+    service.image_cache.invalidate(("replaced_image", None))
+    with open(os.path.join(service.image_dir, "replaced_image.jpg"), "wb") as f:
+        f.write(b"New image data")
+
+    assert client.get("/download/image?id=replaced_image").content == b"New image data"
+
+def fake_make_thumbnails(source_path, targets, image_format, quality):
+    for size, path in targets:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(f"Thumbnail {size}".encode())
+
+def test_download_thumbnail_is_backfilled(setup_test_directories):
+    create_test_image_file("old_image")
+    with patch.dict(service.thumbnail_stats, supported=True), \
+            patch("classes.services.FileService.make_thumbnails", side_effect=fake_make_thumbnails) as make:
+        response = client.get("/download/image?id=old_image&size=64")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/webp"
+        assert response.content == b"Thumbnail 64"
+
+        # the other sizes were generated at the same time
+        assert client.get("/download/image?id=old_image&size=256").content == b"Thumbnail 256"
+        assert make.call_count == 1
+
+def test_download_thumbnail_falls_back_to_image(setup_test_directories):
+    create_test_image_file("plain_image")
+    with patch.dict(service.thumbnail_stats, supported=False):
+        response = client.get("/download/image?id=plain_image&size=256")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.content == b"Fake image data"
+    assert response.headers["etag"] == f'"{hashlib.md5(b"Fake image data").hexdigest()}-256"'
+    assert response.headers["cache-control"] == service.FALLBACK_CACHE_CONTROL
+
+def test_download_thumbnail_is_generated(setup_test_directories):
+    from PIL import Image
+
+    Image.new("RGB", (600, 300), "blue").save(os.path.join(service.image_dir, "real_image.png"))
+    response = client.get("/download/image?id=real_image&size=64")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert response.headers["cache-control"] == service.CACHE_CONTROL
+    with Image.open(io.BytesIO(response.content)) as thumbnail:
+        assert thumbnail.size == (64, 32)
+
+def test_download_thumbnail_invalid_size(setup_test_directories):
+    create_test_image_file("sized_image")
+    assert client.get("/download/image?id=sized_image&size=100").status_code == 400
+
 def test_download_image_not_found(setup_test_directories):
     image_id = "nonexistent_image"
     response = client.get(f"/download/image?id={image_id}")
@@ -1,9 +1,12 @@
+import hashlib
 import os
 from tempfile import TemporaryDirectory
+from unittest.mock import AsyncMock, patch
 
 import pytest
 from fastapi.testclient import TestClient
 
+from classes.SongMetadataIndex import SongMetadataIndex
 from file_service import app, service
 
 os.environ["DEBUG"] = "True"
@@ -16,11 +19,15 @@ def setup_test_directories():
     with TemporaryDirectory() as tmp_music, TemporaryDirectory() as tmp_image:
         original_music_dir = service.music_dir
         original_image_dir = service.image_dir
+        original_song_index = service.song_index
         service.music_dir = tmp_music
         service.image_dir = tmp_image
+        service.song_index = SongMetadataIndex(os.path.join(tmp_music, ".song_index.sqlite3"))
         yield
+        service.song_index.close()
         service.music_dir = original_music_dir
         service.image_dir = original_image_dir
+        service.song_index = original_song_index
 
 
 def create_test_files(song_id: str):
@@ -52,4 +59,119 @@ def test_delete_nonexistent_song_files(setup_test_directories):
 def test_delete_song_invalid_id(setup_test_directories):
     response = client.delete("/delete/song?song_id=")
     assert response.status_code == 400
-    assert "Invalid Request" in response.json()["detail"]
\ No newline at end of file
+    assert "Invalid Request" in response.json()["detail"]
+
+@pytest.fixture
+def mock_verify_song_md5():
+    with patch("file_service.verify_song_md5", new_callable=AsyncMock) as mock_verify:
+        yield mock_verify
+
+
+def test_download_song_whole_file(setup_test_directories, mock_verify_song_md5):
+    create_test_files("range_song")
+    response = client.get("/download/song?song_id=range_song")
+    assert response.status_code == 200
+    assert response.content == b"Fake MP3 data"
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-length"] == str(len(b"Fake MP3 data"))
+    mock_verify_song_md5.assert_awaited_once()
+
+
+def test_download_song_range(setup_test_directories, mock_verify_song_md5):
+    create_test_files("range_song")
+    response = client.get("/download/song?song_id=range_song", headers={"Range": "bytes=5-7"})
+    assert response.status_code == 206
+    assert response.content == b"MP3"
+    assert response.headers["content-range"] == f"bytes 5-7/{len(b'Fake MP3 data')}"
+    assert response.headers["content-length"] == "3"
+    mock_verify_song_md5.assert_not_awaited()
+
+    response = client.get("/download/song?song_id=range_song", headers={"Range": "bytes=-4"})
+    assert response.status_code == 206
+    assert response.content == b"data"
+
+
+def test_download_song_if_range_mismatch_sends_whole_file(setup_test_directories, mock_verify_song_md5):
+    create_test_files("range_song")
+    response = client.get("/download/song?song_id=range_song",
+                          headers={"Range": "bytes=5-7", "If-Range": "Thu, 01 Jan 1970 00:00:00 GMT"})
+    assert response.status_code == 200
+    assert response.content == b"Fake MP3 data"
+
+    last_modified = response.headers["last-modified"]
+    response = client.get("/download/song?song_id=range_song",
+                          headers={"Range": "bytes=5-7", "If-Range": last_modified})
+    assert response.status_code == 206
+
+
+def test_download_song_unsatisfiable_ranges(setup_test_directories, mock_verify_song_md5):
+    create_test_files("range_song")
+    response = client.get("/download/song?song_id=range_song", headers={"Range": "bytes=100-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(b'Fake MP3 data')}"
+
+    response = client.get("/download/song?song_id=range_song", headers={"Range": "bytes=0-1,4-5"})
+    assert response.status_code == 416
+
+
+def test_download_song_conditional_requests(setup_test_directories, mock_verify_song_md5):
+    create_test_files("range_song")
+    response = client.get("/download/song?song_id=range_song")
+    etag = response.headers["etag"]
+    assert etag == f'"{hashlib.md5(b"Fake MP3 data").hexdigest()}"'
+    assert "immutable" in response.headers["cache-control"]
+
+    response = client.get("/download/song?song_id=range_song", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert mock_verify_song_md5.await_count == 1
+
+    response = client.get("/download/song?song_id=range_song",
+                          headers={"Range": "bytes=5-7", "If-Range": etag})
+    assert response.status_code == 206
+
+
+def test_download_song_not_indexed_asks_the_database_once(setup_test_directories):
+    create_test_files("legacy_song")
+    md5 = hashlib.md5(b"Fake MP3 data").hexdigest()
+    with patch.object(service, "get_service_url", new_callable=AsyncMock, return_value="db.com"), \
+            patch.object(service, "service_exception_handling", new_callable=AsyncMock,
+                         return_value=({"song_id": "legacy_song", "md5": md5}, 200)) as mock_request:
+        first = client.get("/download/song?song_id=legacy_song")
+        second = client.get("/download/song?song_id=legacy_song")
+
+    assert first.status_code == second.status_code == 200
+    mock_request.assert_awaited_once()
+
+
+def test_download_song_range_does_not_hash(setup_test_directories):
+    create_test_files("seek_song")
+    create_test_files("unindexed_song")
+    md5 = hashlib.md5(b"Fake MP3 data").hexdigest()
+    service.song_index.put("seek_song", md5, len(b"Fake MP3 data"))
+    with patch.object(service.md5_cache, "get_md5", new_callable=AsyncMock) as mock_get_md5:
+        response = client.get("/download/song?song_id=seek_song", headers={"Range": "bytes=5-7"})
+        assert response.status_code == 206
+        assert response.headers["etag"] == f'"{md5}"'
+
+        response = client.get("/download/song?song_id=seek_song", headers={"If-None-Match": f'"{md5}"'})
+        assert response.status_code == 304
+
+        # without a recorded hash the ETag is left out rather than read from the file
+        response = client.get("/download/song?song_id=unindexed_song", headers={"Range": "bytes=5-7"})
+        assert response.status_code == 206
+        assert "etag" not in response.headers
+
+    mock_get_md5.assert_not_awaited()
+
+
+def test_download_song_unverified_does_not_hash(setup_test_directories):
+    create_test_files("unverified_song")
+    with patch.object(service, "verify_downloads", False), \
+            patch.object(service.md5_cache, "get_md5", new_callable=AsyncMock) as mock_get_md5:
+        response = client.get("/download/song?song_id=unverified_song")
+
+    assert response.status_code == 200
+    assert response.content == b"Fake MP3 data"
+    assert "etag" not in response.headers
+    mock_get_md5.assert_not_awaited()
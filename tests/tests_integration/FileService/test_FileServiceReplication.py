@@ -0,0 +1,105 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from classes.HashRing import HashRing
+from file_service import app, service
+
+os.environ["DEBUG"] = "True"
+client = TestClient(app)
+
+
+@pytest.fixture
+def setup_test_directories():
+    with TemporaryDirectory() as tmp_music, TemporaryDirectory() as tmp_image:
+        original_music_dir = service.music_dir
+        original_image_dir = service.image_dir
+        service.music_dir = tmp_music
+        service.image_dir = tmp_image
+        yield
+        service.music_dir = original_music_dir
+        service.image_dir = original_image_dir
+
+
+def create_test_files(song_id: str):
+    with open(os.path.join(service.music_dir, f"{song_id}.mp3"), 'wb') as f:
+        f.write(b"Fake MP3 data")
+    with open(os.path.join(service.image_dir, f"{song_id}.jpg"), 'wb') as f:
+        f.write(b"Fake image data")
+
+
+def test_missing_replicas(setup_test_directories):
+    create_test_files("stored_song")
+    response = client.post("/replication/missing", json={"song_ids": ["stored_song", "other_song"]})
+    assert response.status_code == 200
+    assert response.json() == {"missing": ["other_song"]}
+
+
+@pytest.mark.asyncio
+async def test_repair_copies_songs_to_replicas_missing_them(setup_test_directories):
+    create_test_files("song_1")
+    create_test_files("song_2")
+    sessions = []
+    completed = []
+
+    async def mock_service_exception_handling(service_url, endpoint, method, params=None, data=None, files=None,
+                                              content=None):
+        if endpoint == "replication/missing":
+            return {"missing": [song_id for song_id in data["song_ids"] if song_id == "song_1"]}, 200
+        if endpoint.startswith("blobs/"):
+            raise HTTPException(status_code=404, detail="Blob not found")
+        if endpoint == "uploads":
+            sessions.append(b"")
+            return {"upload_id": f"up_{len(sessions) - 1}", "offset": 0, "length": params["length"]}, 201
+        if endpoint.startswith("uploads/") and method == "PATCH":
+            index = int(endpoint.rsplit("_", 1)[1])
+            assert params["offset"] == len(sessions[index])
+            sessions[index] += content
+            return {"offset": len(sessions[index])}, 200
+        if endpoint == "upload/song/complete":
+            completed.append((service_url, params))
+            return {"detail": "Files uploaded successfully"}, 200
+
+    ring = HashRing([service.service_url, "replica:9000"])
+    with patch.object(service, "REPLICA_UPLOAD_CHUNK_SIZE", 4), \
+            patch.object(service, "fetch_file_ring", new_callable=AsyncMock, return_value=(ring, 2)), \
+            patch.object(service, "service_exception_handling", side_effect=mock_service_exception_handling):
+        assert await service.repair_replicas() == 1
+
+    assert sessions == [b"Fake image data", b"Fake MP3 data"]
+    assert completed == [("replica:9000", {"song_id": "song_1", "mp3_extension": "mp3", "image_extension": "jpg",
+                                           "image_upload_id": "up_0", "mp3_upload_id": "up_1"})]
+
+
+@pytest.mark.asyncio
+async def test_copy_resumes_a_failed_chunk(setup_test_directories):
+    create_test_files("song_1")
+    received = bytearray()
+    failed = []
+
+    async def mock_service_exception_handling(service_url, endpoint, method, params=None, data=None, files=None,
+                                              content=None):
+        if endpoint == "uploads":
+            return {"upload_id": "up", "offset": 0, "length": params["length"]}, 201
+        if method == "PATCH":
+            if params["offset"] == 4 and not failed:
+                # the first half of the chunk arrived before the connection dropped
+                received.extend(content[:2])
+                failed.append(True)
+                raise HTTPException(status_code=500, detail="Connection reset")
+            assert params["offset"] == len(received)
+            received.extend(content)
+            return {"offset": len(received)}, 200
+        if method == "GET":
+            return {"upload_id": "up", "offset": len(received)}, 200
+
+    path = os.path.join(service.music_dir, "song_1.mp3")
+    with patch.object(service, "REPLICA_UPLOAD_CHUNK_SIZE", 4), \
+            patch.object(service, "service_exception_handling", side_effect=mock_service_exception_handling):
+        assert await service.upload_file("replica:9000", path, 13, "md5") == "up"
+
+    assert bytes(received) == b"Fake MP3 data"
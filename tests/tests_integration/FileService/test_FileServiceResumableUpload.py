@@ -0,0 +1,116 @@
+import hashlib
+import os
+from tempfile import TemporaryDirectory
+
+import pytest
+from fastapi.testclient import TestClient
+
+from classes.SongMetadataIndex import SongMetadataIndex
+from classes.UploadSessionStore import UploadSessionStore
+from file_service import app, service
+
+os.environ["DEBUG"] = "True"
+client = TestClient(app)
+
+MP3_CONTENT = b"Fake MP3 data for a resumable upload"
+IMAGE_CONTENT = b"Fake image data"
+
+
+@pytest.fixture
+def mock_file_storage_operations():
+    with TemporaryDirectory() as tmp_dir:
+        original_music_dir = service.music_dir
+        original_image_dir = service.image_dir
+        original_blob_dir = service.blob_dir
+        original_song_index = service.song_index
+        original_upload_sessions = service.upload_sessions
+        service.music_dir = os.path.join(tmp_dir, "music")
+        service.image_dir = os.path.join(tmp_dir, "images")
+        service.blob_dir = os.path.join(tmp_dir, "blobs")
+        service.song_index = SongMetadataIndex(os.path.join(tmp_dir, ".song_index.sqlite3"))
+        service.upload_sessions = UploadSessionStore(os.path.join(tmp_dir, ".uploads"), service.UPLOAD_SESSION_TTL)
+        yield
+        service.music_dir = original_music_dir
+        service.image_dir = original_image_dir
+        service.song_index.close()
+        service.blob_dir = original_blob_dir
+        service.song_index = original_song_index
+        service.upload_sessions = original_upload_sessions
+
+
+def create_upload(content, md5=None):
+    params = {"length": len(content)}
+    if md5 is not None:
+        params["md5"] = md5
+    response = client.post("/uploads", params=params)
+    assert response.status_code == 201
+    return response.json()["upload_id"]
+
+
+def test_upload_resumes_from_the_stored_offset(mock_file_storage_operations):
+    mp3_upload_id = create_upload(MP3_CONTENT, hashlib.md5(MP3_CONTENT).hexdigest())
+    image_upload_id = create_upload(IMAGE_CONTENT)
+
+    response = client.patch(f"/uploads/{mp3_upload_id}", params={"offset": 0}, content=MP3_CONTENT[:10])
+    assert response.json()["offset"] == 10
+
+    # a retry of the first chunk is refused with the offset to resume from
+    response = client.patch(f"/uploads/{mp3_upload_id}", params={"offset": 0}, content=MP3_CONTENT[:10])
+    assert response.status_code == 409
+    assert response.headers["upload-offset"] == "10"
+
+    response = client.get(f"/uploads/{mp3_upload_id}")
+    assert response.json()["offset"] == 10
+
+    # completing before every byte arrived is refused
+    response = client.post("/upload/song/complete", params={
+        "song_id": "test_song", "mp3_upload_id": mp3_upload_id, "image_upload_id": image_upload_id,
+        "image_extension": "jpg"})
+    assert response.status_code == 409
+
+    client.patch(f"/uploads/{mp3_upload_id}", params={"offset": 10}, content=MP3_CONTENT[10:])
+    client.patch(f"/uploads/{image_upload_id}", params={"offset": 0}, content=IMAGE_CONTENT)
+    response = client.post("/upload/song/complete", params={
+        "song_id": "test_song", "mp3_upload_id": mp3_upload_id, "image_upload_id": image_upload_id,
+        "image_extension": "jpg"})
+
+    assert response.status_code == 200
+    assert response.json()["md5"] == hashlib.md5(MP3_CONTENT).hexdigest()
+    with open(os.path.join(service.shard_dir(service.music_dir, "test_song"), "test_song.mp3"), "rb") as stored:
+        assert stored.read() == MP3_CONTENT
+    assert client.get(f"/uploads/{mp3_upload_id}").status_code == 404
+
+
+def test_complete_rejects_mismatched_md5(mock_file_storage_operations):
+    mp3_upload_id = create_upload(MP3_CONTENT, hashlib.md5(b"other content").hexdigest())
+    image_upload_id = create_upload(IMAGE_CONTENT)
+    client.patch(f"/uploads/{mp3_upload_id}", params={"offset": 0}, content=MP3_CONTENT)
+    client.patch(f"/uploads/{image_upload_id}", params={"offset": 0}, content=IMAGE_CONTENT)
+
+    response = client.post("/upload/song/complete", params={
+        "song_id": "test_song", "mp3_upload_id": mp3_upload_id, "image_upload_id": image_upload_id,
+        "image_extension": "jpg"})
+
+    assert response.status_code == 422
+    assert not os.path.exists(service.music_dir)
+    assert client.get(f"/uploads/{mp3_upload_id}").status_code == 404
+    assert client.get(f"/uploads/{image_upload_id}").status_code == 200
+
+
+def test_chunk_past_the_length_is_rejected(mock_file_storage_operations):
+    upload_id = create_upload(IMAGE_CONTENT)
+
+    response = client.patch(f"/uploads/{upload_id}", params={"offset": 0}, content=IMAGE_CONTENT + b"extra")
+
+    assert response.status_code == 400
+    assert client.get(f"/uploads/{upload_id}").json()["offset"] == 0
+
+
+def test_create_upload_too_large(mock_file_storage_operations):
+    response = client.post("/uploads", params={"length": service.max_upload_size + 1})
+    assert response.status_code == 413
+
+
+def test_unknown_upload(mock_file_storage_operations):
+    assert client.get("/uploads/not-an-upload").status_code == 400
+    assert client.get(f"/uploads/{'0' * 32}").status_code == 404
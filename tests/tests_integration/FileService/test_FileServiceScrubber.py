@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+import os
+from tempfile import TemporaryDirectory
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from classes.SongMetadataIndex import SongMetadataIndex
+from file_service import service
+
+os.environ["DEBUG"] = "True"
+
+
+@pytest.fixture
+def setup_test_directories():
+    with TemporaryDirectory() as tmp_dir:
+        original_music_dir = service.music_dir
+        original_blob_dir = service.blob_dir
+        original_quarantine_dir = service.quarantine_dir
+        original_song_index = service.song_index
+        original_scrub_stats = service.scrub_stats
+        service.music_dir = os.path.join(tmp_dir, "music")
+        service.blob_dir = os.path.join(tmp_dir, "blobs")
+        service.quarantine_dir = os.path.join(tmp_dir, ".quarantine")
+        service.song_index = SongMetadataIndex(os.path.join(tmp_dir, ".song_index.sqlite3"))
+        service.scrub_stats = {"passes": 0, "position": None, "files_checked": 0, "bytes_checked": 0,
+                               "unverified": 0, "errors": 0, "mismatches": 0, "findings": [], "failures": []}
+        os.makedirs(service.music_dir)
+        yield
+        service.song_index.close()
+        service.music_dir = original_music_dir
+        service.blob_dir = original_blob_dir
+        service.quarantine_dir = original_quarantine_dir
+        service.song_index = original_song_index
+        service.scrub_stats = original_scrub_stats
+
+
+def create_song(song_id: str, content: bytes):
+    with open(os.path.join(service.music_dir, f"{song_id}.mp3"), "wb") as f:
+        f.write(content)
+
+
+@pytest.mark.asyncio
+async def test_scrub_quarantines_corrupted_songs(setup_test_directories):
+    create_song("good_song", b"Fake MP3 data")
+    create_song("bad_song", b"Fake MP3 dat4")
+    create_song("unknown_song", b"Other data")
+    service.song_index.put("good_song", hashlib.md5(b"Fake MP3 data").hexdigest(), 13)
+    service.song_index.put("bad_song", hashlib.md5(b"Fake MP3 data").hexdigest(), 13)
+
+    with patch.object(service, "get_service_url", new_callable=AsyncMock, return_value="db.com"), \
+            patch.object(service, "service_exception_handling", new_callable=AsyncMock,
+                         return_value=({"songs": {}}, 200)) as mock_request:
+        assert await service.scrub() == 1
+
+    mock_request.assert_awaited_once_with("db.com", "songs/md5", "POST", data={"song_ids": ["unknown_song"]})
+    assert sorted(os.listdir(service.music_dir)) == ["good_song.mp3", "unknown_song.mp3"]
+    assert await service.find_file(service.music_dir, "bad_song") is None
+    assert [name.split("-", 1)[1] for name in os.listdir(service.quarantine_dir)] == ["bad_song.mp3"]
+    assert service.scrub_stats["files_checked"] == 3
+    assert service.scrub_stats["unverified"] == 1
+    assert service.scrub_stats["mismatches"] == 1
+    assert service.scrub_stats["findings"][0]["song_id"] == "bad_song"
+    assert service.scrub_stats["passes"] == 1
+    assert service.scrub_stats["position"] is None
+
+
+@pytest.mark.asyncio
+async def test_scrub_reports_read_failures(setup_test_directories):
+    create_song("unreadable_song", b"Fake MP3 data")
+    service.song_index.put("unreadable_song", hashlib.md5(b"Fake MP3 data").hexdigest(), 13)
+
+    with patch.object(service, "scrub_md5", new_callable=AsyncMock, side_effect=OSError(5, "Input/output error")), \
+            patch("classes.services.FileService.logger.error") as mock_log:
+        assert await service.scrub() == 0
+
+    assert "unreadable_song" in mock_log.call_args.args[0]
+    assert service.scrub_stats["errors"] == 1
+    assert service.scrub_stats["files_checked"] == 0
+    assert service.scrub_stats["failures"][0]["song_id"] == "unreadable_song"
+    assert "Input/output error" in service.scrub_stats["failures"][0]["error"]
+    assert os.path.exists(os.path.join(service.music_dir, "unreadable_song.mp3"))
+
+
+@pytest.mark.asyncio
+async def test_scrub_resumes_from_its_position(setup_test_directories):
+    create_song("song_a", b"a")
+    create_song("song_b", b"b")
+    service.song_index.put("song_a", hashlib.md5(b"a").hexdigest(), 1)
+    service.song_index.put("song_b", hashlib.md5(b"b").hexdigest(), 1)
+    service.scrub_stats["position"] = "song_a"
+
+    assert await service.scrub() == 0
+
+    assert service.scrub_stats["files_checked"] == 1
+
+
+@pytest.mark.asyncio
+async def test_pace_scrub_limits_the_read_rate(setup_test_directories):
+    with patch.object(service, "scrub_rate", 100), patch.object(service, "_scrub_next_read", 0.0), \
+            patch("classes.services.FileService.asyncio.sleep", new_callable=AsyncMock) as mock_sleep:
+        await service.pace_scrub(50)
+        await service.pace_scrub(50)
+
+    waited = mock_sleep.await_args.args[0]
+    assert 0.4 < waited <= 0.5
+
+
+@pytest.mark.asyncio
+async def test_scrub_md5_paces_every_chunk(setup_test_directories):
+    create_song("large_song", b"0123456789")
+    with patch.object(service, "SCRUB_READ_SIZE", 4), \
+            patch.object(service, "pace_scrub", new_callable=AsyncMock) as mock_pace:
+        md5 = await service.scrub_md5(os.path.join(service.music_dir, "large_song.mp3"), 10)
+
+    assert md5 == hashlib.md5(b"0123456789").hexdigest()
+    assert [call.args[0] for call in mock_pace.await_args_list] == [4, 4, 2, 0]
+
+
+@pytest.mark.asyncio
+async def test_scrub_position_survives_a_restart(setup_test_directories):
+    create_song("song_a", b"a")
+    service.song_index.put("song_a", hashlib.md5(b"a").hexdigest(), 1)
+    service.song_index.set_state(service.SCRUB_POSITION_KEY, "song_0")
+
+    # the first pass waits one interval, and resumes from the saved position
+    with patch("classes.services.FileService.asyncio.sleep", new_callable=AsyncMock,
+               side_effect=asyncio.CancelledError) as mock_sleep, \
+            patch.object(service, "scrub", new_callable=AsyncMock) as mock_scrub:
+        with pytest.raises(asyncio.CancelledError):
+            await service.scrub_periodically()
+
+    mock_sleep.assert_awaited_once_with(service.SCRUB_INTERVAL)
+    mock_scrub.assert_not_awaited()
+    assert service.scrub_stats["position"] == "song_0"
+
+    await service.scrub()
+    assert service.song_index.get_state(service.SCRUB_POSITION_KEY) is None
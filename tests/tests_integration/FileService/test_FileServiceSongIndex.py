@@ -0,0 +1,88 @@
+import hashlib
+import os
+from tempfile import TemporaryDirectory
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from classes.SongMetadataIndex import SongMetadataIndex
+from file_service import app, service
+
+os.environ["DEBUG"] = "True"
+client = TestClient(app)
+
+MP3_CONTENT = b"Fake MP3 data"
+
+
+@pytest.fixture
+def mock_file_storage_operations():
+    with TemporaryDirectory() as tmp_dir:
+        original_music_dir = service.music_dir
+        original_image_dir = service.image_dir
+        original_blob_dir = service.blob_dir
+        original_song_index = service.song_index
+        service.music_dir = os.path.join(tmp_dir, "music")
+        service.image_dir = os.path.join(tmp_dir, "images")
+        service.blob_dir = os.path.join(tmp_dir, "blobs")
+        service.song_index = SongMetadataIndex(os.path.join(tmp_dir, ".song_index.sqlite3"))
+        yield
+        service.song_index.close()
+        service.music_dir = original_music_dir
+        service.image_dir = original_image_dir
+        service.blob_dir = original_blob_dir
+        service.song_index = original_song_index
+
+
+def upload(song_id):
+    return client.put(
+        f"/upload/song?song_id={song_id}",
+        files={
+            "mp3_file": ("test_song.mp3", MP3_CONTENT, "audio/mpeg"),
+            "image_file": ("test_image.jpg", b"Fake image data", "image/jpeg")
+        }
+    )
+
+
+def test_uploaded_song_downloads_without_the_database(mock_file_storage_operations):
+    assert upload("song_1").status_code == 200
+    assert service.song_index.get("song_1") == (hashlib.md5(MP3_CONTENT).hexdigest(), len(MP3_CONTENT))
+
+    with patch.object(service, "get_service_url", new_callable=AsyncMock) as mock_get_service_url:
+        response = client.get("/download/song?song_id=song_1")
+
+    assert response.status_code == 200
+    assert response.content == MP3_CONTENT
+    mock_get_service_url.assert_not_awaited()
+
+
+def test_download_rejects_a_file_of_the_wrong_size(mock_file_storage_operations):
+    upload("song_1")
+    with open(os.path.join(service.shard_dir(service.music_dir, "song_1"), "song_1.mp3"), "ab") as stored:
+        stored.write(b"corruption")
+
+    response = client.get("/download/song?song_id=song_1")
+
+    assert response.status_code == 422
+
+
+def test_deleted_song_leaves_the_index(mock_file_storage_operations):
+    upload("song_1")
+    assert client.delete("/delete/song?song_id=song_1").status_code == 200
+    assert service.song_index.get("song_1") is None
+
+
+@pytest.mark.asyncio
+async def test_reconcile_song_index(mock_file_storage_operations):
+    service.song_index.put("song_1", "uploaded_md5", 1)
+    service.song_index.put("song_2", "md5_2", 1)
+
+    with patch.object(service, "get_service_url", new_callable=AsyncMock, return_value="db.com"), \
+            patch.object(service, "service_exception_handling", new_callable=AsyncMock,
+                         return_value=({"songs": {"song_1": "database_md5"}}, 200)) as mock_request:
+        assert await service.reconcile_song_index() == 2
+        assert await service.reconcile_song_index() == 0
+
+    mock_request.assert_awaited_once_with("db.com", "songs/md5", "POST", data={"song_ids": ["song_1", "song_2"]})
+    assert service.song_index.get("song_1") == ("database_md5", 1)
+    assert service.song_index.get("song_2") is None
@@ -1,25 +1,40 @@
+import hashlib
 import os
-from contextlib import asynccontextmanager
-from tempfile import NamedTemporaryFile
-from unittest.mock import patch, AsyncMock
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from unittest.mock import patch
 
 import pytest
 from fastapi.testclient import TestClient
 
-from file_service import app
+from classes.SongMetadataIndex import SongMetadataIndex
+from file_service import app, service
 
 os.environ["DEBUG"] = "True"
 client = TestClient(app)
 
-@asynccontextmanager
-async def async_mock_open(*args, **kwargs):
-    mock_file = AsyncMock()
-    yield mock_file
-
 @pytest.fixture
 def mock_file_storage_operations():
-    with patch('aiofiles.open', new_callable=lambda: async_mock_open) as mock_file:
-        yield mock_file
+    with TemporaryDirectory() as tmp_dir:
+        original_music_dir = service.music_dir
+        original_image_dir = service.image_dir
+        original_blob_dir = service.blob_dir
+        original_song_index = service.song_index
+        service.music_dir = os.path.join(tmp_dir, "music")
+        service.image_dir = os.path.join(tmp_dir, "images")
+        service.blob_dir = os.path.join(tmp_dir, "blobs")
+        service.song_index = SongMetadataIndex(os.path.join(tmp_dir, ".song_index.sqlite3"))
+        os.makedirs(service.music_dir)
+        os.makedirs(service.image_dir)
+        yield
+        service.music_dir = original_music_dir
+        service.image_dir = original_image_dir
+        service.song_index.close()
+        service.blob_dir = original_blob_dir
+        service.song_index = original_song_index
+
+def stored_files(directory):
+    return [os.path.join(root, name) for root, _, names in os.walk(directory) for name in names]
 
 @pytest.fixture
 def temp_mp3_file():
@@ -49,6 +64,38 @@ def test_upload_file_success(temp_mp3_file, temp_image_file, mock_file_storage_o
             }
         )
     assert response.status_code == 200
+    assert response.json()["md5"] == hashlib.md5(b"Fake MP3 data").hexdigest()
+    assert response.json()["size"] == len(b"Fake MP3 data")
+    with open(os.path.join(service.shard_dir(service.music_dir, "test_song"), "test_song.mp3"), "rb") as stored:
+        assert stored.read() == b"Fake MP3 data"
+    assert stored_files(service.image_dir) == [os.path.join(service.shard_dir(service.image_dir, "test_song"),
+                                                            "test_song.jpg")]
+
+def test_upload_file_queues_thumbnails(temp_mp3_file, temp_image_file, mock_file_storage_operations):
+    with patch.dict(service.thumbnail_stats, supported=True), patch.object(service, "queue_thumbnails") as queue, \
+            open(temp_mp3_file, "rb") as mp3_file, open(temp_image_file, "rb") as image_file:
+        response = client.put(
+            "/upload/song?song_id=test_song",
+            files={
+                "mp3_file": ("test_song.mp3", mp3_file, "audio/mpeg"),
+                "image_file": ("test_image.jpg", image_file, "image/jpeg")
+            }
+        )
+    assert response.status_code == 200
+    queue.assert_called_once_with("test_song")
+
+def test_upload_file_too_large(temp_mp3_file, temp_image_file, mock_file_storage_operations):
+    with patch.object(service, "max_upload_size", 4), \
+            open(temp_mp3_file, "rb") as mp3_file, open(temp_image_file, "rb") as image_file:
+        response = client.put(
+            "/upload/song?song_id=test_song",
+            files={
+                "mp3_file": ("test_song.mp3", mp3_file, "audio/mpeg"),
+                "image_file": ("test_image.jpg", image_file, "image/jpeg")
+            }
+        )
+    assert response.status_code == 413
+    assert stored_files(service.music_dir) == []
 
 def test_upload_file_failure(temp_mp3_file, temp_image_file, mock_file_storage_operations):
     response = client.put(
@@ -57,4 +104,77 @@ def test_upload_file_failure(temp_mp3_file, temp_image_file, mock_file_storage_o
             "mp3_file": ("test_song.mp3", "mp3_file", "audio/mpeg"),
         }
     )
-    assert response.status_code == 422
\ No newline at end of file
+    assert response.status_code == 422
+
+def upload(song_id, mp3_data=b"Fake MP3 data"):
+    return client.put(
+        f"/upload/song?song_id={song_id}",
+        files={
+            "mp3_file": ("test_song.mp3", mp3_data, "audio/mpeg"),
+            "image_file": ("test_image.jpg", b"Fake image data", "image/jpeg")
+        }
+    )
+
+def test_duplicate_upload_is_stored_once(mock_file_storage_operations):
+    md5 = hashlib.md5(b"Fake MP3 data").hexdigest()
+    assert client.head(f"/blobs/{md5}").status_code == 404
+
+    assert upload("song_1").status_code == 200
+    assert upload("song_2").status_code == 200
+
+    first = os.stat(os.path.join(service.shard_dir(service.music_dir, "song_1"), "song_1.mp3"))
+    second = os.stat(os.path.join(service.shard_dir(service.music_dir, "song_2"), "song_2.mp3"))
+    assert first.st_ino == second.st_ino
+    assert client.head(f"/blobs/{md5}").status_code == 200
+    assert client.get(f"/blobs/{md5}").json() == {"md5": md5, "size": len(b"Fake MP3 data"), "references": 2}
+
+def test_upload_links_stored_content(mock_file_storage_operations):
+    md5 = hashlib.md5(b"Fake MP3 data").hexdigest()
+    assert upload("song_1").status_code == 200
+
+    response = client.put(
+        f"/upload/song?song_id=song_2&mp3_md5={md5}&mp3_extension=mp3",
+        files={"image_file": ("test_image.jpg", b"Fake image data", "image/jpeg")}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["md5"] == md5
+    with open(os.path.join(service.shard_dir(service.music_dir, "song_2"), "song_2.mp3"), "rb") as stored:
+        assert stored.read() == b"Fake MP3 data"
+
+def test_upload_link_to_missing_content(mock_file_storage_operations):
+    response = client.put(
+        f"/upload/song?song_id=song_1&mp3_md5={'0' * 32}",
+        files={"image_file": ("test_image.jpg", b"Fake image data", "image/jpeg")}
+    )
+
+    assert response.status_code == 404
+    assert stored_files(service.music_dir) == []
+
+def test_blob_is_removed_with_its_last_song(mock_file_storage_operations):
+    md5 = hashlib.md5(b"Fake MP3 data").hexdigest()
+    upload("song_1")
+    upload("song_2")
+
+    assert client.delete("/delete/song?song_id=song_1").status_code == 200
+    assert client.get(f"/blobs/{md5}").json()["references"] == 1
+
+    assert client.delete("/delete/song?song_id=song_2").status_code == 200
+    assert client.head(f"/blobs/{md5}").status_code == 404
+    assert stored_files(service.blob_dir) == []
+
+def test_blob_is_not_released_while_a_file_is_linked(mock_file_storage_operations):
+    md5 = hashlib.md5(b"Fake MP3 data").hexdigest()
+    upload("song_1")
+    song_path = os.path.join(service.shard_dir(service.music_dir, "song_1"), "song_1.mp3")
+    os.remove(song_path)
+
+    # the release checks the blob's links only once the link in progress holding the lock is done
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with service._blob_lock:
+            release = executor.submit(service.release_blob_sync, md5)
+            assert not release.done()
+            service.replace_with_link_sync(service.find_blob_sync(md5), song_path)
+        assert release.result(timeout=5) is False
+
+    assert client.get(f"/blobs/{md5}").json()["references"] == 1
@@ -1,5 +1,121 @@
 import asyncio
+import base64
+import json
 import sqlite3
+from contextlib import contextmanager
+
+DATABASE_FILE = "media_db.db"
+STREAM_BATCH_SIZE = 500
+
+_connection_pool = None
+_write_queue = None
+_query_cache = None
+_executor = None
+
+
+def set_connection_pool(pool):
+    """
+    Route every query in this module through the given connection pool.
+
+    :param pool: The DatabaseConnectionPool to use, or None to fall back to a new connection per query.
+    :return: None
+    """
+    global _connection_pool
+    _connection_pool = pool
+
+
+@contextmanager
+def read_connection():
+    """
+    Yield a connection suitable for reads.
+
+    When a connection pool is configured the calling thread's long-lived read connection is used, otherwise a
+    short-lived connection is opened and closed around the query.
+
+    :return: A context manager yielding a sqlite3 connection.
+    """
+    if _connection_pool is not None and _connection_pool.is_open:
+        yield _connection_pool.reader()
+        return
+
+    conn = sqlite3.connect(DATABASE_FILE)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def write_connection():
+    """
+    Yield a connection suitable for writes.
+
+    When a connection pool is configured the shared writer connection is used while holding its lock, otherwise
+    a short-lived connection is opened and closed around the statement.
+
+    :return: A context manager yielding a sqlite3 connection.
+    """
+    if _connection_pool is not None and _connection_pool.is_open:
+        with _connection_pool.writer() as conn:
+            yield conn
+        return
+
+    conn = sqlite3.connect(DATABASE_FILE)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def stream_connection():
+    """
+    Yield a read connection dedicated to a single streamed result set.
+
+    A streamed result is read over many calls that may each run on a different worker thread, so it cannot borrow
+    a thread's pooled read connection. The connection is closed once the stream is exhausted or discarded.
+
+    :return: A context manager yielding a sqlite3 connection.
+    """
+    if _connection_pool is not None and _connection_pool.is_open:
+        conn = _connection_pool.open_reader()
+    else:
+        conn = sqlite3.connect(DATABASE_FILE, check_same_thread=False)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def iterate_query(query, params, batch_size=STREAM_BATCH_SIZE):
+    """
+    Run a query on a dedicated connection and yield its rows in batches with fetchmany, so only one batch is held
+    in memory at a time.
+
+    :param query: The SQL query to run.
+    :param params: The parameters of the query.
+    :param batch_size: The maximum number of rows per batch.
+    :return: A generator of lists of rows.
+    """
+    with stream_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+
+
+def set_executor(executor):
+    """
+    Run every query in this module on the given executor.
+
+    :param executor: The executor to use, or None for the event loop's default executor.
+    :return: None
+    """
+    global _executor
+    _executor = executor
 
 
 async def run_in_executor(func, *args):
@@ -11,7 +127,90 @@ async def run_in_executor(func, *args):
     :return: A coroutine that will resolve with the result of the function execution.
     """
     loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(None, func, *args)
+    return await loop.run_in_executor(_executor, func, *args)
+
+
+def set_write_queue(write_queue):
+    """
+    Route every write in this module through the given write queue.
+
+    :param write_queue: The DatabaseWriteQueue to use, or None to commit each write on its own.
+    :return: None
+    """
+    global _write_queue
+    _write_queue = write_queue
+
+
+def commit_write(operation, *args):
+    """
+    Run a single write operation on a write connection and commit it.
+
+    :param operation: A function taking a connection followed by `args`.
+    :param args: The arguments to pass to the operation.
+    :return: The value returned by the operation.
+    """
+    with write_connection() as conn:
+        result = operation(conn, *args)
+        conn.commit()
+        return result
+
+
+async def run_write(operation, *args):
+    """
+    Execute a write operation, batching it through the write queue when one is running.
+
+    :param operation: A function taking a connection followed by `args`.
+    :param args: The arguments to pass to the operation.
+    :return: The value returned by the operation.
+    """
+    if _write_queue is not None and _write_queue.is_running:
+        return await _write_queue.submit(operation, *args)
+    return await run_in_executor(commit_write, operation, *args)
+
+
+def set_query_cache(cache):
+    """
+    Answer repeated reads in this module from the given query cache, and invalidate it on writes.
+
+    :param cache: The QueryCache to use, or None to always query the database.
+    :return: None
+    """
+    global _query_cache
+    _query_cache = cache
+
+
+async def run_cached_read(key, tags, func, *args):
+    """
+    Execute a read, answering it from the query cache when a result for the same key is cached.
+
+    :param key: The key identifying the query and its parameters.
+    :param tags: The tags of the rows the result is read from, invalidated by writes to those rows.
+    :param func: The function performing the read.
+    :param args: The arguments to pass to the function.
+    :return: The result of the read.
+    """
+    cache = _query_cache
+    if cache is None:
+        return await run_in_executor(func, *args)
+
+    found, value = cache.get(key)
+    if found:
+        return value
+    version = cache.version
+    value = await run_in_executor(func, *args)
+    cache.put(key, value, tags, version)
+    return value
+
+
+def invalidate_cache(*tags):
+    """
+    Drop every cached result read from the rows named by the given tags.
+
+    :param tags: The tags of the rows that were written.
+    :return: None
+    """
+    if _query_cache is not None:
+        _query_cache.invalidate(*tags)
 
 
 def create_tables_sync():
@@ -20,8 +219,7 @@ def create_tables_sync():
 
     :return: None
     """
-    conn = sqlite3.connect("media_db.db")
-    try:
+    with write_connection() as conn:
         cursor = conn.cursor()
         tables_sql = {
             'users': '''
@@ -63,8 +261,6 @@ def create_tables_sync():
         for create_sql in tables_sql.values():
             cursor.execute(create_sql)
         conn.commit()
-    finally:
-        conn.close()
 
 
 async def create_tables():
@@ -76,6 +272,28 @@ async def create_tables():
     await run_in_executor(create_tables_sync)
 
 
+def insert_user(conn, username, password, salt, email):
+    """
+    Insert a user using the given connection without committing, unless the username is already taken.
+
+    The existence check and the insert are a single statement, so concurrent requests for the same username cannot
+    both succeed.
+
+    :param conn: The connection to execute the statement on.
+    :param username: The username of the user.
+    :param password: The password of the user.
+    :param salt: The salt for the password.
+    :param email: The email address of the user.
+    :return: The username of the inserted user, or None if a user with that username already exists.
+    """
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO users (username, password, salt, email) VALUES (?, ?, ?, ?) "
+                   "ON CONFLICT DO NOTHING RETURNING username",
+                   (username, password, salt, email))
+    rows = cursor.fetchall()
+    return rows[0][0] if rows else None
+
+
 def create_user_sync(username, password, salt, email):
     """
     Create a user synchronously.
@@ -84,17 +302,9 @@ def create_user_sync(username, password, salt, email):
     :param password: The password of the user.
     :param salt: The salt for the password.
     :param email: The email address of the user.
-    :return: True if the user was successfully created, False otherwise.
+    :return: The username of the created user, or None if a user with that username already exists.
     """
-    conn = sqlite3.connect("media_db.db")
-    try:
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO users (username, password, salt, email) VALUES (?, ?, ?, ?)",
-                       (username, password, salt, email))
-        conn.commit()
-        return cursor.lastrowid is not None
-    finally:
-        conn.close()
+    return commit_write(insert_user, username, password, salt, email)
 
 
 async def create_user(username, password, salt, email):
@@ -111,11 +321,14 @@ async def create_user(username, password, salt, email):
        :type salt: str
        :param email: The email address of the user.
        :type email: str
-       :return: Returns a coroutine object that creates a user.
-       :rtype: Coroutine[None, None, None]
+       :return: The username of the created user, or None if a user with that username already exists.
+       :rtype: Optional[str]
 
     """
-    return await run_in_executor(create_user_sync, username, password, salt, email)
+    result = await run_write(insert_user, username, password, salt, email)
+    if result is not None:
+        invalidate_cache(("user", username))
+    return result
 
 
 def get_user_salt_sync(username):
@@ -124,13 +337,10 @@ def get_user_salt_sync(username):
     :return: The salt associated with the given username, or None if the user does not exist.
 
     """
-    conn = sqlite3.connect("media_db.db")
-    try:
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT salt FROM users WHERE username = ?", (username,))
         return cursor.fetchone()
-    finally:
-        conn.close()
 
 
 async def get_user_salt(username):
@@ -138,7 +348,7 @@ async def get_user_salt(username):
     :param username: The username of the user for which to retrieve the salt.
     :return: The salt associated with the specified user.
     """
-    return await run_in_executor(get_user_salt_sync, username)
+    return await run_cached_read(("user_salt", username), [("user", username)], get_user_salt_sync, username)
 
 
 def get_user_sync(username):
@@ -146,13 +356,10 @@ def get_user_sync(username):
     :param username: The username of the user to retrieve from the database.
     :return: A tuple containing the username, email, and salt of the user with the specified username.
     """
-    conn = sqlite3.connect("media_db.db")
-    try:
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT username, email, salt FROM users WHERE username = ?", (username,))
         return cursor.fetchone()
-    finally:
-        conn.close()
 
 
 async def get_user(username):
@@ -160,7 +367,7 @@ async def get_user(username):
     :param username: The username of the user to retrieve
     :return: The user object with the specified username
     """
-    return await run_in_executor(get_user_sync, username)
+    return await run_cached_read(("user", username), [("user", username)], get_user_sync, username)
 
 
 def get_user_email_sync(email):
@@ -169,13 +376,10 @@ def get_user_email_sync(email):
     :return: The email of the user as a string, or None if the email does not exist in the database.
 
     """
-    conn = sqlite3.connect("media_db.db")
-    try:
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT username FROM users WHERE email = ?", (email,))
         return cursor.fetchone()
-    finally:
-        conn.close()
 
 
 async def get_user_email(email):
@@ -196,13 +400,10 @@ def get_user_by_password_sync(username, password):
     :param password: The password of the user.
     :return: A tuple containing the username of the user if found, or None if not found.
     """
-    conn = sqlite3.connect("media_db.db")
-    try:
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT username FROM users WHERE username = ? AND password = ?", (username, password))
         return cursor.fetchone()
-    finally:
-        conn.close()
 
 
 async def get_user_by_password(username, password):
@@ -216,6 +417,30 @@ async def get_user_by_password(username, password):
     return await run_in_executor(get_user_by_password_sync, username, password)
 
 
+def insert_song(conn, song_id, song_name, artist, md5, username):
+    """
+    Insert a song using the given connection without committing, unless a song with the same ID or the same name
+    and artist already exists.
+
+    The existence check and the insert are a single statement, so concurrent uploads of the same song cannot both
+    succeed.
+
+    :param conn: The connection to execute the statement on.
+    :param song_id: The ID of the song.
+    :param song_name: The name of the song.
+    :param artist: The name of the artist.
+    :param md5: The MD5 hash of the song.
+    :param username: The username of the user who created the song.
+    :return: The ID of the inserted song, or None if the song already exists.
+    """
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO songs (song_id, song_name, artist, md5, username) VALUES (?, ?, ?, ?, ?) "
+                   "ON CONFLICT DO NOTHING RETURNING song_id",
+                   (song_id, song_name, artist, md5, username))
+    rows = cursor.fetchall()
+    return rows[0][0] if rows else None
+
+
 def create_song_sync(song_id, song_name, artist, md5, username):
     """
     :param song_id: The ID of the song.
@@ -223,18 +448,10 @@ def create_song_sync(song_id, song_name, artist, md5, username):
     :param artist: The name of the artist.
     :param md5: The MD5 hash of the song.
     :param username: The username of the user who created the song.
-    :return: A boolean value indicating whether the song was successfully created.
+    :return: The ID of the created song, or None if the song already exists.
 
     """
-    conn = sqlite3.connect("media_db.db")
-    try:
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO songs (song_id, song_name, artist, md5, username) VALUES (?, ?, ?, ?, ?)",
-                       (song_id, song_name, artist, md5, username))
-        conn.commit()
-        return cursor.lastrowid is not None
-    finally:
-        conn.close()
+    return commit_write(insert_song, song_id, song_name, artist, md5, username)
 
 
 async def create_song(song_id, song_name, artist, md5, username):
@@ -246,9 +463,71 @@ async def create_song(song_id, song_name, artist, md5, username):
     :param artist: The artist of the song.
     :param md5: The MD5 hash of the song.
     :param username: The username of the user creating the song.
-    :return: None
-    """
-    return await run_in_executor(create_song_sync, song_id, song_name, artist, md5, username)
+    :return: The ID of the created song, or None if the song already exists.
+    """
+    result = await run_write(insert_song, song_id, song_name, artist, md5, username)
+    if result is not None:
+        invalidate_cache(("song", song_id), ("songs", username), ("songs", None))
+    return result
+
+
+def insert_songs(conn, songs):
+    """
+    Insert many songs using the given connection without committing, skipping any that already exist.
+
+    The songs are loaded into a temporary table with executemany and copied into the songs table with a single
+    INSERT ... ON CONFLICT DO NOTHING, so the whole batch costs one statement regardless of its size.
+
+    :param conn: The connection to execute the statements on.
+    :param songs: A list of (song_id, song_name, artist, md5, username) tuples.
+    :return: A list of booleans in the same order as `songs`, True where the song was inserted and False where it
+             conflicted with an existing song or an earlier song in the batch.
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+                    CREATE TEMP TABLE IF NOT EXISTS bulk_songs (
+                        position INTEGER PRIMARY KEY,
+                        song_id TEXT,
+                        song_name TEXT,
+                        artist TEXT,
+                        md5 TEXT,
+                        username TEXT
+                    )
+                ''')
+    cursor.execute("DELETE FROM temp.bulk_songs")
+    cursor.executemany("INSERT INTO temp.bulk_songs (position, song_id, song_name, artist, md5, username) "
+                       "VALUES (?, ?, ?, ?, ?, ?)", [(position, *song) for position, song in enumerate(songs)])
+    # WHERE true is required by SQLite to tell the ON CONFLICT clause apart from a join constraint
+    cursor.execute("INSERT INTO songs (song_id, song_name, artist, md5, username) "
+                   "SELECT song_id, song_name, artist, md5, username FROM temp.bulk_songs WHERE true "
+                   "ORDER BY position ON CONFLICT DO NOTHING RETURNING song_id, song_name, artist")
+    inserted = set(cursor.fetchall())
+    cursor.execute("DELETE FROM temp.bulk_songs")
+
+    results = []
+    for song_id, song_name, artist, _, _ in songs:
+        key = (song_id, song_name, artist)
+        results.append(key in inserted)
+        inserted.discard(key)
+    return results
+
+
+async def create_songs(songs):
+    """
+    Create many songs in a single transaction.
+
+    :param songs: A list of (song_id, song_name, artist, md5, username) tuples.
+    :return: A list of booleans in the same order as `songs`, True where the song was created and False where it
+             already existed.
+    """
+    created = await run_write(insert_songs, songs)
+    tags = {("songs", None)}
+    for (song_id, _, _, _, username), was_created in zip(songs, created):
+        if was_created:
+            tags.update((("song", song_id), ("songs", username)))
+    if any(created):
+        invalidate_cache(*tags)
+    return created
 
 
 def get_song_sync(song_id):
@@ -259,13 +538,10 @@ def get_song_sync(song_id):
     This method connects to the media database, retrieves the song with the given song_id,
     and returns it as a result. If no song is found with the given ID, None is returned.
     """
-    conn = sqlite3.connect("media_db.db")
-    try:
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM songs WHERE song_id = ?", (song_id,))
         return cursor.fetchone()
-    finally:
-        conn.close()
 
 
 async def get_song(song_id):
@@ -275,61 +551,216 @@ async def get_song(song_id):
     :return: The requested song.
 
     """
-    return await run_in_executor(get_song_sync, song_id)
+    return await run_cached_read(("song", song_id), [("song", song_id)], get_song_sync, song_id)
 
 
-def get_songs_sync(song_name, artist, username=None):
+def get_song_md5s_sync(song_ids):
+    """
+    :param song_ids: The IDs of the songs to look up.
+    :return: A list of (song_id, md5) tuples for the songs that exist, looked up in batches of at most 500 IDs to
+             stay under SQLite's limit on query parameters.
+    """
+    rows = []
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        for start in range(0, len(song_ids), 500):
+            batch = song_ids[start:start + 500]
+            placeholders = ", ".join("?" for _ in batch)
+            cursor.execute(f"SELECT song_id, md5 FROM songs WHERE song_id IN ({placeholders})", batch)
+            rows.extend(cursor.fetchall())
+    return rows
+
+
+async def get_song_md5s(song_ids):
+    """
+    Look up the MD5 hashes of several songs at once.
+
+    :param song_ids: The IDs of the songs to look up.
+    :return: A list of (song_id, md5) tuples for the songs that exist.
+    """
+    return await run_in_executor(get_song_md5s_sync, song_ids)
+
+
+def encode_songs_cursor(song_name, song_id):
+    """
+    Encode the position of a song in the (song_name, song_id) ordering as an opaque pagination cursor.
+
+    :param song_name: The name of the last song returned.
+    :param song_id: The ID of the last song returned.
+    :return: A URL-safe cursor string.
+    """
+    raw = json.dumps([song_name, song_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_songs_cursor(cursor):
+    """
+    Decode a pagination cursor created by `encode_songs_cursor`.
+
+    :param cursor: The cursor string.
+    :return: A tuple of the song name and song ID the cursor points after.
+    :raises ValueError: If the cursor is malformed.
+    """
+    try:
+        song_name, song_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    return song_name, song_id
+
+
+def build_songs_query(song_name, artist, username=None, limit=None, cursor=None):
+    """
+    Build the query listing songs matching every provided filter in (song_name, song_id) order.
+
+    :param song_name: The name of the song to search for (optional)
+    :param artist: The artist of the song to search for (optional)
+    :param username: The username of the user who uploaded the song (optional)
+    :param limit: The maximum number of songs to return (optional)
+    :param cursor: A cursor from `encode_songs_cursor`; only songs after it are returned (optional)
+    :return: A tuple of the SQL query and its parameters.
+    :raises ValueError: If the cursor is malformed.
+    """
+    conditions = []
+    params = []
+    for column, value in (("song_name", song_name), ("artist", artist), ("username", username)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+
+    if cursor is not None:
+        conditions.append("(song_name, song_id) > (?, ?)")
+        params.extend(decode_songs_cursor(cursor))
+
+    query = "SELECT * FROM songs"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY song_name, song_id"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    return query, params
+
+
+def get_songs_sync(song_name, artist, username=None, limit=None, cursor=None):
     """
     :param song_name: The name of the song to search for (optional)
     :param artist: The artist of the song to search for (optional)
-    :return: A list of songs matching the given criteria
+    :param username: The username of the user who uploaded the song (optional)
+    :param limit: The maximum number of songs to return (optional)
+    :param cursor: A cursor from `encode_songs_cursor`; only songs after it are returned (optional)
+    :return: A list of songs matching the given criteria, ordered by song name and song ID
+    :raises ValueError: If the cursor is malformed.
 
     This method queries the "songs" table in the "media_db.db" SQLite database and returns a list of songs
-    matching the provided song name and artist. If both parameters are None, it returns all songs in the table.
+    matching every provided filter. If all filters are None, it returns all songs in the table.
 
-    If only the song_name parameter is provided, it searches for songs with that specific name.
-    If only the artist parameter is provided, it searches for songs by that specific artist.
-    If both song_name and artist parameters are provided, it searches for songs matching both criteria.
+    Results are paged with a keyset on (song_name, song_id): pass the cursor encoded from the last row of a page
+    to fetch the next one, so each page is an index range scan regardless of how deep it is.
 
     Example usage:
     songs = get_songs_sync("Song Name", "Artist")
     print(songs)
     """
-    conn = sqlite3.connect("media_db.db")
-    try:
-        cursor = conn.cursor()
+    query, params = build_songs_query(song_name, artist, username, limit, cursor)
+    with read_connection() as conn:
+        db_cursor = conn.cursor()
+        db_cursor.execute(query, params)
+        return db_cursor.fetchall()
 
-        query = "SELECT * FROM songs"
-        if song_name is not None and artist is not None and username is not None:
-            query += " WHERE song_name = ? AND artist = ? AND username = ?"
-            cursor.execute(query, (song_name, artist, username))
-        elif song_name is not None and artist is not None:
-            query += " WHERE song_name = ? AND artist = ?"
-            cursor.execute(query, (song_name, artist))
-        elif song_name is not None:
-            query += " WHERE song_name = ?"
-            cursor.execute(query, (song_name,))
-        elif artist is not None:
-            query += " WHERE artist = ?"
-            cursor.execute(query, (artist,))
-        elif username is not None:
-            query += " WHERE username = ?"
-            cursor.execute(query, (username,))
-        else:
-            cursor.execute(query)
 
-        return cursor.fetchall()
-    finally:
-        conn.close()
-
-
-async def get_songs(song_name, artist, username=None):
+async def get_songs(song_name, artist, username=None, limit=None, cursor=None):
     """
     :param song_name: The name of the song.
     :param artist: The name of the artist.
+    :param username: The username of the user who uploaded the song.
+    :param limit: The maximum number of songs to return.
+    :param cursor: A pagination cursor from a previous page.
     :return: A list of songs matching the given song_name and artist.
     """
-    return await run_in_executor(get_songs_sync, song_name, artist, username)
+    # listings are tagged by uploader, with unfiltered and name or artist only listings under None
+    return await run_cached_read(("songs", song_name, artist, username, limit, cursor), [("songs", username)],
+                                 get_songs_sync, song_name, artist, username, limit, cursor)
+
+
+def stream_songs(song_name, artist, username=None, cursor=None, batch_size=STREAM_BATCH_SIZE):
+    """
+    Stream every song matching the given filters in (song_name, song_id) order.
+
+    The query is built straight away so a malformed cursor is reported before any row is read.
+
+    :param song_name: The name of the song to search for (optional)
+    :param artist: The artist of the song to search for (optional)
+    :param username: The username of the user who uploaded the song (optional)
+    :param cursor: A cursor from `encode_songs_cursor`; only songs after it are returned (optional)
+    :param batch_size: The maximum number of rows per batch.
+    :return: A generator of lists of songs, to be consumed from a worker thread.
+    :raises ValueError: If the cursor is malformed.
+    """
+    query, params = build_songs_query(song_name, artist, username, cursor=cursor)
+    return iterate_query(query, params, batch_size)
+
+
+def build_search_query(text):
+    """
+    Convert free text into an FTS5 query matching every word as a token prefix.
+
+    Each word is quoted so FTS5 operators and punctuation in the search text are treated literally.
+
+    :param text: The text entered by the user.
+    :return: The FTS5 MATCH expression, or None if the text contains no words.
+    """
+    words = [word.replace('"', '""') for word in text.split()]
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search_songs_sync(text, limit):
+    """
+    Search songs by name and artist using the full-text index.
+
+    :param text: The text to search for. Every word must match the start of a token in the song name or artist.
+    :param limit: The maximum number of songs to return.
+    :return: A list of songs ordered from the best match to the worst.
+    """
+    match = build_search_query(text)
+    if match is None:
+        return []
+
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        # rank and limit inside the full-text index before joining so only the returned rows are looked up
+        cursor.execute("SELECT songs.* FROM (SELECT rowid, rank FROM songs_fts WHERE songs_fts MATCH ? "
+                       "ORDER BY rank LIMIT ?) AS matches JOIN songs ON songs.rowid = matches.rowid "
+                       "ORDER BY matches.rank", (match, limit))
+        return cursor.fetchall()
+
+
+async def search_songs(text, limit):
+    """
+    Search songs by name and artist.
+
+    :param text: The text to search for.
+    :param limit: The maximum number of songs to return.
+    :return: A list of songs ordered from the best match to the worst.
+    """
+    return await run_in_executor(search_songs_sync, text, limit)
+
+
+def insert_playlist(conn, playlist_id, playlist_name, username):
+    """
+    Insert a playlist using the given connection without committing.
+
+    :param conn: The connection to execute the statement on.
+    :param playlist_id: The ID of the playlist to be created.
+    :param playlist_name: The name of the playlist to be created.
+    :param username: The username of the user who is creating the playlist.
+    :return: True if the playlist was inserted successfully, False otherwise.
+    """
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO playlists (playlist_id, playlist_name, username) VALUES (?, ?, ?)",
+                   (playlist_id, playlist_name, username))
+    return cursor.lastrowid is not None
 
 
 def create_playlist_sync(playlist_id, playlist_name, username):
@@ -343,15 +774,7 @@ def create_playlist_sync(playlist_id, playlist_name, username):
     * changes. The method then returns True if the playlist was created successfully, or False otherwise.
 
     """
-    conn = sqlite3.connect("media_db.db")
-    try:
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO playlists (playlist_id, playlist_name, username) VALUES (?, ?, ?)",
-                       (playlist_id, playlist_name, username))
-        conn.commit()
-        return cursor.lastrowid is not None
-    finally:
-        conn.close()
+    return commit_write(insert_playlist, playlist_id, playlist_name, username)
 
 
 async def create_playlist(playlist_id, playlist_name, username):
@@ -367,7 +790,7 @@ async def create_playlist(playlist_id, playlist_name, username):
     :return: None
     :rtype: None
     """
-    return await run_in_executor(create_playlist_sync, playlist_id, playlist_name, username)
+    return await run_write(insert_playlist, playlist_id, playlist_name, username)
 
 
 def get_songs_by_playlist_sync(playlist_id):
@@ -386,15 +809,12 @@ def get_songs_by_playlist_sync(playlist_id):
     Please note that this method assumes the existence of a database named 'media_db.db' in the parent directory of the current script.
 
     """
-    conn = sqlite3.connect("media_db.db")
-    try:
+    with read_connection() as conn:
         cursor = conn.cursor()
-        # create a link between the playlist and the songs for the song details
-        cursor.execute("SELECT * FROM songs WHERE song_id IN (SELECT song_id FROM playlist_songs WHERE playlist_id = ?)"
-                       ,(playlist_id,))
+        # create a link between the playlist and the songs for the song details, in playlist order
+        cursor.execute("SELECT songs.* FROM playlist_songs JOIN songs ON songs.song_id = playlist_songs.song_id "
+                       "WHERE playlist_songs.playlist_id = ? ORDER BY playlist_songs.position", (playlist_id,))
         return cursor.fetchall()
-    finally:
-        conn.close()
 
 
 async def get_songs_by_playlist(playlist_id):
@@ -404,7 +824,29 @@ async def get_songs_by_playlist(playlist_id):
     :param playlist_id: The ID of the playlist to retrieve songs from.
     :return: The songs in the playlist.
     """
-    return await run_in_executor(get_songs_by_playlist_sync, playlist_id)
+    return await run_cached_read(("songs_by_playlist", playlist_id), [("playlist", playlist_id)],
+                                 get_songs_by_playlist_sync, playlist_id)
+
+
+def build_playlists_query(username, playlist_name):
+    """
+    Build the query listing playlists matching every provided filter.
+
+    :param username: The username associated with the playlists (optional)
+    :param playlist_name: The name of the playlists (optional)
+    :return: A tuple of the SQL query and its parameters.
+    """
+    conditions = []
+    params = []
+    for column, value in (("playlist_name", playlist_name), ("username", username)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+
+    query = "SELECT * FROM playlists"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return query, params
 
 
 def get_playlists_sync(username, playlist_name, playlist_id):
@@ -422,30 +864,14 @@ def get_playlists_sync(username, playlist_name, playlist_id):
         >>>     print(playlist)
         ('My Playlist', 'john_doe', 1, '2021-07-15 10:30:00')
     """
-    conn = sqlite3.connect("media_db.db")
-    try:
+    with read_connection() as conn:
         cursor = conn.cursor()
-        query = "SELECT * FROM playlists"
         if playlist_id is not None:
-            query += " WHERE playlist_id = ?"
-            cursor.execute(query, (playlist_id,))
+            cursor.execute("SELECT * FROM playlists WHERE playlist_id = ?", (playlist_id,))
             return cursor.fetchone()
 
-        if playlist_name is not None and username is not None:
-            query += " WHERE playlist_name = ? AND username = ?"
-            cursor.execute(query, (playlist_name, username))
-        elif username is not None:
-            query += " WHERE username = ?"
-            cursor.execute(query, (username,))
-        elif playlist_name is not None:
-            query += " WHERE playlist_name = ?"
-            cursor.execute(query, (playlist_name,))
-        else:
-            cursor.execute(query)
-
+        cursor.execute(*build_playlists_query(username, playlist_name))
         return cursor.fetchall()
-    finally:
-        conn.close()
 
 
 async def get_playlists(username=None, playlist_name=None, playlist_id=None):
@@ -460,6 +886,49 @@ async def get_playlists(username=None, playlist_name=None, playlist_id=None):
     return await run_in_executor(get_playlists_sync, username, playlist_name, playlist_id)
 
 
+def stream_playlists(username=None, playlist_name=None, batch_size=STREAM_BATCH_SIZE):
+    """
+    Stream every playlist matching the given filters.
+
+    :param username: The username associated with the playlists (optional)
+    :param playlist_name: The name of the playlists (optional)
+    :param batch_size: The maximum number of rows per batch.
+    :return: A generator of lists of playlists, to be consumed from a worker thread.
+    """
+    query, params = build_playlists_query(username, playlist_name)
+    return iterate_query(query, params, batch_size)
+
+
+def stream_songs_by_playlist(playlist_id, batch_size=STREAM_BATCH_SIZE):
+    """
+    Stream the songs of a playlist in playlist order.
+
+    :param playlist_id: The ID of the playlist.
+    :param batch_size: The maximum number of rows per batch.
+    :return: A generator of lists of songs, to be consumed from a worker thread.
+    """
+    return iterate_query("SELECT songs.* FROM playlist_songs JOIN songs ON songs.song_id = playlist_songs.song_id "
+                         "WHERE playlist_songs.playlist_id = ? ORDER BY playlist_songs.position", (playlist_id,),
+                         batch_size)
+
+
+def insert_playlist_song(conn, playlist_id, song_id):
+    """
+    Link a song to a playlist using the given connection without committing.
+
+    :param conn: The connection to execute the statement on.
+    :param playlist_id: The ID of the playlist to which the song will be added.
+    :param song_id: The ID of the song to be added to the playlist.
+    :return: True if the song was successfully linked to the playlist, False otherwise.
+    """
+    cursor = conn.cursor()
+    # append the song after the current last position of the playlist
+    cursor.execute("INSERT INTO playlist_songs (playlist_id, song_id, position) VALUES (?, ?, "
+                   "(SELECT COALESCE(MAX(position) + 1, 0) FROM playlist_songs WHERE playlist_id = ?))",
+                   (playlist_id, song_id, playlist_id))
+    return cursor.lastrowid is not None
+
+
 def add_song_to_playlist_sync(playlist_id, song_id):
     """
 
@@ -468,15 +937,7 @@ def add_song_to_playlist_sync(playlist_id, song_id):
     :return: True if the song was successfully added to the playlist, False otherwise.
 
     """
-    conn = sqlite3.connect("media_db.db")
-    try:
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO playlist_songs (playlist_id, song_id) VALUES (?, ?)",
-                       (playlist_id, song_id))
-        conn.commit()
-        return cursor.lastrowid is not None
-    finally:
-        conn.close()
+    return commit_write(insert_playlist_song, playlist_id, song_id)
 
 
 async def add_song_to_playlist(playlist_id, song_id):
@@ -487,7 +948,24 @@ async def add_song_to_playlist(playlist_id, song_id):
     :param song_id: The ID of the song to be added.
     :return: A coroutine that adds the song to the given playlist.
     """
-    return await run_in_executor(add_song_to_playlist_sync, playlist_id, song_id)
+    result = await run_write(insert_playlist_song, playlist_id, song_id)
+    invalidate_cache(("playlist", playlist_id))
+    return result
+
+
+def delete_playlist_song(conn, playlist_id, song_id):
+    """
+    Unlink a song from a playlist using the given connection without committing.
+
+    :param conn: The connection to execute the statement on.
+    :param playlist_id: The ID of the playlist from which to remove the song.
+    :param song_id: The ID of the song to be removed.
+    :return: True if the statement ran successfully, False otherwise.
+    """
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM playlist_songs WHERE playlist_id = ? AND song_id = ?",
+                   (playlist_id, song_id))
+    return cursor.lastrowid is not None
 
 
 def remove_song_from_playlist_sync(playlist_id, song_id):
@@ -498,15 +976,7 @@ def remove_song_from_playlist_sync(playlist_id, song_id):
     :param song_id: The ID of the song to be removed.
     :return: True if the song was successfully removed, False otherwise.
     """
-    conn = sqlite3.connect("media_db.db")
-    try:
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM playlist_songs WHERE playlist_id = ? AND song_id = ?",
-                       (playlist_id, song_id))
-        conn.commit()
-        return cursor.lastrowid is not None
-    finally:
-        conn.close()
+    return commit_write(delete_playlist_song, playlist_id, song_id)
 
 
 def get_playlist_songs_sync(playlist_id):
@@ -515,13 +985,10 @@ def get_playlist_songs_sync(playlist_id):
     :return: A list of tuples representing the songs in the playlist.
 
     """
-    conn = sqlite3.connect("media_db.db")
-    try:
+    with read_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM playlist_songs WHERE playlist_id = ?", (playlist_id,))
+        cursor.execute("SELECT * FROM playlist_songs WHERE playlist_id = ? ORDER BY position", (playlist_id,))
         return cursor.fetchall()
-    finally:
-        conn.close()
 
 
 async def get_playlist_songs(playlist_id):
@@ -531,7 +998,8 @@ async def get_playlist_songs(playlist_id):
     :param playlist_id: The ID of the playlist to retrieve songs from.
     :return: A list of songs in the playlist.
     """
-    return await run_in_executor(get_playlist_songs_sync, playlist_id)
+    return await run_cached_read(("playlist_songs", playlist_id), [("playlist", playlist_id)],
+                                 get_playlist_songs_sync, playlist_id)
 
 
 async def remove_song_from_playlist(playlist_id, song_id):
@@ -545,5 +1013,7 @@ async def remove_song_from_playlist(playlist_id, song_id):
     :return: A coroutine that will remove the song from the playlist.
     :rtype: Coroutine
     """
-    return await run_in_executor(remove_song_from_playlist_sync, playlist_id, song_id)
+    result = await run_write(delete_playlist_song, playlist_id, song_id)
+    invalidate_cache(("playlist", playlist_id))
+    return result
 
@@ -0,0 +1,164 @@
+from fastapi.logger import logger
+
+from utils.DatabaseAsyncQuery import run_in_executor, write_connection
+
+
+def add_lookup_indexes(conn):
+    """
+    Add secondary indexes for the lookups made by the database service so they no longer scan whole tables.
+
+    :param conn: The connection to execute the statements on.
+    :return: None
+    """
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_songs_username ON songs (username)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_songs_artist ON songs (artist)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_email ON users (email)")
+
+
+def rebuild_playlist_songs(conn):
+    """
+    Rebuild the playlist_songs table with TEXT ids matching the playlists and songs tables, an explicit position
+    column and a composite (playlist_id, song_id) primary key stored WITHOUT ROWID.
+
+    Existing rows are copied in their insertion order and duplicate links are dropped.
+
+    :param conn: The connection to execute the statements on.
+    :return: None
+    """
+    conn.execute('''
+                    CREATE TABLE playlist_songs_new (
+                        playlist_id TEXT NOT NULL,
+                        song_id TEXT NOT NULL,
+                        position INTEGER NOT NULL,
+                        PRIMARY KEY (playlist_id, song_id),
+                        FOREIGN KEY (playlist_id) REFERENCES playlists(playlist_id),
+                        FOREIGN KEY (song_id) REFERENCES songs(song_id)
+                    ) WITHOUT ROWID;
+                ''')
+    conn.execute('''
+                    INSERT OR IGNORE INTO playlist_songs_new (playlist_id, song_id, position)
+                    SELECT CAST(playlist_id AS TEXT), CAST(song_id AS TEXT),
+                           ROW_NUMBER() OVER (PARTITION BY playlist_id ORDER BY rowid) - 1
+                    FROM playlist_songs
+                    WHERE playlist_id IS NOT NULL AND song_id IS NOT NULL
+                ''')
+    conn.execute("DROP TABLE playlist_songs")
+    conn.execute("ALTER TABLE playlist_songs_new RENAME TO playlist_songs")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_playlist_songs_position ON playlist_songs (playlist_id, position)")
+
+
+def add_song_keyset_indexes(conn):
+    """
+    Index songs in (song_name, song_id) order, globally and per username and artist, so keyset pages of the songs
+    listing are read straight off an index. The single-column username and artist indexes become redundant.
+
+    :param conn: The connection to execute the statements on.
+    :return: None
+    """
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_songs_name_id ON songs (song_name, song_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_songs_username_name_id ON songs (username, song_name, song_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_songs_artist_name_id ON songs (artist, song_name, song_id)")
+    conn.execute("DROP INDEX IF EXISTS idx_songs_username")
+    conn.execute("DROP INDEX IF EXISTS idx_songs_artist")
+
+
+def add_songs_full_text_index(conn):
+    """
+    Add an FTS5 index over song names and artists, kept in sync with the songs table by triggers, and populate it
+    from the existing songs.
+
+    :param conn: The connection to execute the statements on.
+    :return: None
+    """
+    conn.execute('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5(
+                        song_name,
+                        artist,
+                        content='songs',
+                        content_rowid='rowid',
+                        tokenize='unicode61 remove_diacritics 2',
+                        prefix='2 3'
+                    );
+                ''')
+    conn.execute('''
+                    CREATE TRIGGER IF NOT EXISTS songs_fts_insert AFTER INSERT ON songs BEGIN
+                        INSERT INTO songs_fts (rowid, song_name, artist) VALUES (new.rowid, new.song_name, new.artist);
+                    END;
+                ''')
+    conn.execute('''
+                    CREATE TRIGGER IF NOT EXISTS songs_fts_delete AFTER DELETE ON songs BEGIN
+                        INSERT INTO songs_fts (songs_fts, rowid, song_name, artist)
+                        VALUES ('delete', old.rowid, old.song_name, old.artist);
+                    END;
+                ''')
+    conn.execute('''
+                    CREATE TRIGGER IF NOT EXISTS songs_fts_update AFTER UPDATE OF song_name, artist ON songs BEGIN
+                        INSERT INTO songs_fts (songs_fts, rowid, song_name, artist)
+                        VALUES ('delete', old.rowid, old.song_name, old.artist);
+                        INSERT INTO songs_fts (rowid, song_name, artist) VALUES (new.rowid, new.song_name, new.artist);
+                    END;
+                ''')
+    conn.execute("INSERT INTO songs_fts (songs_fts) VALUES ('rebuild')")
+
+
+# Each migration is applied once, in order, and the database's user_version is set to its number afterwards.
+# Never edit or reorder a released migration; append a new one instead.
+MIGRATIONS = [
+    (1, "Add indexes on songs(username), songs(artist) and users(email)", add_lookup_indexes),
+    (2, "Rebuild playlist_songs with a composite primary key", rebuild_playlist_songs),
+    (3, "Add (song_name, song_id) keyset indexes on songs", add_song_keyset_indexes),
+    (4, "Add FTS5 full-text index on song names and artists", add_songs_full_text_index),
+]
+
+
+def get_schema_version(conn):
+    """
+    :param conn: The connection to read from.
+    :return: The version of the last migration applied to the database.
+    """
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Apply every pending migration to the database, each in its own transaction.
+
+    :param conn: The writer connection to migrate.
+    :return: The schema version after migrating.
+    """
+    version = get_schema_version(conn)
+    for target_version, description, migration in MIGRATIONS:
+        if target_version <= version:
+            continue
+
+        logger.info(f"Applying database migration {target_version}: {description}")
+        conn.execute("BEGIN")
+        try:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {target_version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = target_version
+
+    return version
+
+
+def apply_migrations_sync():
+    """
+    Apply every pending migration to the media database synchronously.
+
+    :return: The schema version after migrating.
+    """
+    with write_connection() as conn:
+        return migrate(conn)
+
+
+async def apply_migrations():
+    """
+    Apply every pending migration to the media database.
+
+    :return: The schema version after migrating.
+    """
+    return await run_in_executor(apply_migrations_sync)
@@ -0,0 +1,99 @@
+import argparse
+import hashlib
+import os
+import time
+
+from fastapi.logger import logger
+
+
+def shard_dir(directory: str, file_id: str, depth: int) -> str:
+    """
+    Compute the nested directory a file is stored in, fanning files out by the hash of their ID so that no single
+    directory grows too large. With a depth of 2, `sg_1` is stored under `directory/ab/cd`.
+
+    :param directory: The top directory of the store.
+    :param file_id: The ID of the file.
+    :param depth: The number of nested levels, each splitting the files 256 ways. 0 stores files flat.
+    :return: The directory the file belongs in.
+    """
+    digest = hashlib.md5(file_id.encode()).hexdigest()
+    return os.path.join(directory, *(digest[level * 2:level * 2 + 2] for level in range(depth)))
+
+
+def is_shard_name(name: str) -> bool:
+    """
+    :param name: The name of a directory entry.
+    :return: True if the name is that of a shard directory, two lowercase hexadecimal digits.
+    """
+    return len(name) == 2 and all(character in "0123456789abcdef" for character in name)
+
+
+def migrate_batch(directory: str, depth: int, batch_size: int):
+    """
+    Move up to `batch_size` files stored flat in a directory into their shard directories.
+
+    Each file is renamed, which is atomic, so readers see the file at either its old or its new path and it can run
+    while the service is serving files. Hidden and temporary files are left alone.
+
+    :param directory: The top directory of the store.
+    :param depth: The number of nested levels.
+    :param batch_size: The maximum number of files to move.
+    :return: A list of tuples of the ID, old path and new path of each file moved. An empty list means the migration
+             is done.
+    """
+    moved = []
+    if depth == 0:
+        return moved
+
+    try:
+        entries = os.scandir(directory)
+    except FileNotFoundError:
+        return moved
+
+    with entries:
+        for entry in entries:
+            if len(moved) >= batch_size:
+                break
+            if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                continue
+            file_id = entry.name.split(".")[0]
+            target_dir = shard_dir(directory, file_id, depth)
+            os.makedirs(target_dir, exist_ok=True)
+            target = os.path.join(target_dir, entry.name)
+            try:
+                os.rename(entry.path, target)
+            except FileNotFoundError:
+                # deleted since it was listed
+                continue
+            moved.append((file_id, entry.path, target))
+    return moved
+
+
+def migrate(directory: str, depth: int, batch_size: int, pause: float):
+    """
+    Move every file stored flat in a directory into its shard directory, in batches.
+
+    :param directory: The top directory of the store.
+    :param depth: The number of nested levels.
+    :param batch_size: The number of files to move per batch.
+    :param pause: The number of seconds to wait between batches, leaving the disk to the service.
+    :return: The number of files moved.
+    """
+    total = 0
+    while moved := migrate_batch(directory, depth, batch_size):
+        total += len(moved)
+        logger.info(f"Moved {total} files of {directory} into shard directories")
+        time.sleep(pause)
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move files stored flat into nested shard directories.")
+    parser.add_argument("directories", nargs="+", help="The directories to migrate, such as files/music")
+    parser.add_argument("--depth", type=int, default=2, help="The number of nested levels")
+    parser.add_argument("--batch-size", type=int, default=500, help="The number of files to move per batch")
+    parser.add_argument("--pause", type=float, default=0.5, help="The number of seconds to wait between batches")
+    args = parser.parse_args()
+
+    for store in args.directories:
+        print(f"{store}: moved {migrate(store, args.depth, args.batch_size, args.pause)} files")
@@ -0,0 +1,52 @@
+import os
+import tempfile
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    # Pillow is optional, without it images are only served at full size
+    Image = ImageOps = None
+
+
+def thumbnails_supported() -> bool:
+    """
+    :return: True if Pillow is installed and thumbnails can be generated.
+    """
+    return Image is not None
+
+
+def make_thumbnails(source_path: str, targets, image_format: str, quality: int):
+    """
+    Scale an image down to each of the given sizes, keeping its aspect ratio, and write each thumbnail to a temporary
+    file renamed into place once complete, so readers never see a partially written thumbnail. The image is decoded
+    once for all sizes, and images smaller than a size are written at their own size.
+
+    :param source_path: The path to the image.
+    :param targets: A list of tuples of the size in pixels of the longest side of each thumbnail and its path.
+    :param image_format: The format to write the thumbnails in, such as "webp".
+    :param quality: The encoder quality, from 1 to 100.
+    :return: None
+    :raises RuntimeError: If Pillow is not installed.
+    :raises OSError: If the image cannot be read or is not an image.
+    """
+    if Image is None:
+        raise RuntimeError("Pillow is not installed")
+
+    with Image.open(source_path) as source:
+        # apply the EXIF orientation, which is lost when the image is re-encoded
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+        for size, path in sorted(targets, reverse=True):
+            # shrinking from the previous, larger thumbnail is faster and looks the same
+            image.thumbnail((size, size), Image.LANCZOS)
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".thumbnail-", suffix=".part")
+            try:
+                with os.fdopen(fd, "wb") as target:
+                    image.save(target, format=image_format, quality=quality)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
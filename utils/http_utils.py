@@ -0,0 +1,112 @@
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Mapping, Optional, Tuple
+
+
+def http_date(timestamp: float) -> str:
+    """
+    Format a POSIX timestamp as an HTTP date, as used by the Last-Modified header.
+
+    :param timestamp: The timestamp to format.
+    :return: The date in RFC 7231 IMF-fixdate format.
+    """
+    return formatdate(timestamp, usegmt=True)
+
+
+def parse_http_date(value: Optional[str]) -> Optional[float]:
+    """
+    Parse an HTTP date, as sent in the If-Modified-Since header.
+
+    :param value: The date to parse, if any.
+    :return: The date as a POSIX timestamp, or None if it is missing or malformed.
+    """
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def etag_matches(header: Optional[str], etag: str, weak: bool = True) -> bool:
+    """
+    Check whether an If-None-Match or If-Range header matches an entity tag.
+
+    :param header: The value of the header, a list of entity tags or "*".
+    :param etag: The current entity tag of the resource.
+    :param weak: Whether to use the weak comparison of If-None-Match, which ignores the W/ prefix, rather than the
+                 strong comparison of If-Range.
+    :return: True if any entity tag in the header matches.
+    """
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if weak:
+            candidate = candidate.removeprefix("W/")
+        if candidate == etag:
+            return True
+    return False
+
+
+def is_not_modified(headers: Mapping[str, str], etag: Optional[str], last_modified: float) -> bool:
+    """
+    Evaluate the If-None-Match and If-Modified-Since headers of a GET request, as described by RFC 7232.
+
+    If-Modified-Since is only considered when If-None-Match is absent.
+
+    :param headers: The request headers.
+    :param etag: The current entity tag of the resource, or None if it has none.
+    :param last_modified: The modification time of the resource as a POSIX timestamp.
+    :return: True if the client's copy is current and a 304 Not Modified response should be sent.
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+
+    if_modified_since = parse_http_date(headers.get("if-modified-since"))
+    # HTTP dates have a resolution of one second
+    return if_modified_since is not None and int(last_modified) <= if_modified_since
+
+
+def parse_range_header(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single byte range from a Range header.
+
+    Headers in another unit or that are malformed are ignored, as allowed by RFC 7233, so the caller serves the
+    whole file.
+
+    :param range_header: The value of the Range header, if any.
+    :param size: The size of the file in bytes.
+    :return: A tuple of the first and last byte positions of the range, both inclusive, or None to serve the whole
+             file.
+    :raises ValueError: If the header asks for several ranges or the range starts past the end of the file.
+    """
+    if not range_header:
+        return None
+
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not ranges.strip():
+        return None
+    if "," in ranges:
+        raise ValueError("Multiple ranges are not supported")
+
+    first, separator, last = ranges.strip().partition("-")
+    if not separator or not (first + last).isdigit():
+        return None
+
+    if first == "":
+        # suffix range: the last N bytes of the file
+        suffix_length = int(last)
+        if suffix_length == 0 or size == 0:
+            raise ValueError(f"Range not satisfiable: {range_header}")
+        return max(size - suffix_length, 0), size - 1
+
+    start = int(first)
+    if last != "" and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError(f"Range not satisfiable: {range_header}")
+    end = int(last) if last != "" else size - 1
+    return start, min(end, size - 1)
@@ -84,15 +84,16 @@ async def get_service_data(service_name, service_type, service_url):
     }
 
 
-async def handle_rest_request(url, endpoint, method, data=None, params=None, files=None, stream=False):
+async def handle_rest_request(url, endpoint, method, data=None, params=None, files=None, stream=False, content=None):
     """
     :param url: The base URL for the REST API.
     :param endpoint: The endpoint of the REST API.
-    :param method: The HTTP method to be used for the request. It can be one of "POST", "GET", "PUT", or "DELETE".
+    :param method: The HTTP method to be used for the request. It can be one of "POST", "GET", "PUT", "PATCH", or "DELETE".
     :param data: The JSON payload for the request. It is optional and only required for "POST" and "PUT" methods.
     :param params: The query parameters for the request. It is optional.
     :param files: The files to be uploaded with the request. It is optional and only required for "POST" and "PUT" methods.
     :param stream: A boolean flag indicating whether to stream the response or not. Defaults to False.
+    :param content: The raw bytes to send as the request body. It is optional and only used for "PATCH" requests.
     :return: If stream is True, returns the streaming response.
              Otherwise, returns a tuple containing the JSON response and the HTTP status code.
 
@@ -112,6 +113,8 @@ async def handle_rest_request(url, endpoint, method, data=None, params=None, fil
                     response = await client.get(request_url, params=params)
                 elif method == "PUT":
                     response = await client.put(request_url, json=data, params=params, files=files)
+                elif method == "PATCH":
+                    response = await client.patch(request_url, content=content, params=params)
                 elif method == "DELETE":
                     response = await client.delete(request_url, params=params)
                 else: